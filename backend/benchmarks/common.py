@@ -0,0 +1,71 @@
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_PATH = pathlib.Path(__file__).resolve().parents[1]
+HEADERS = {"Authorization": "benchmark"}
+
+
+def setup_volume() -> None:
+    """
+    Points the backend at a throwaway volume and config before `src.api` loads.
+    """
+    os.chdir(tempfile.mkdtemp(prefix="llm-tagger-bench-"))
+    os.mkdir("volume")
+    with open("config.json", "w") as f:
+        json.dump(
+            {
+                "listen": "127.0.0.1:0",
+                "api_base": "http://bench/",
+                "auth_token": HEADERS["Authorization"],
+                "max_file_size": 1 << 27,
+            },
+            f,
+        )
+    sys.path.insert(0, str(BACKEND_PATH))
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def latency_summary(samples: list[float]) -> dict:
+    """
+    Summarizes latencies given in seconds as milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples, default=0.0) * 1000,
+    }
+
+
+def run_metadata() -> dict:
+    """
+    Identifies the code and machine a result was produced on.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=BACKEND_PATH,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": int(time.time()),
+    }
@@ -0,0 +1,84 @@
+"""
+Compares two benchmark results and reports regressions.
+
+Metrics are matched by their path in the result tree. Latencies, durations and
+memory regress when they grow, throughputs when they shrink. Exits with status
+1 if any metric regressed by more than the threshold:
+
+    python -m benchmarks.compare base.json head.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ("_ms", "seconds", "peak_bytes", "wire_bytes")
+HIGHER_IS_BETTER = ("_per_second",)
+
+
+def flatten(tree: dict, prefix: str = "") -> dict[str, float]:
+    values = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def direction(path: str) -> int:
+    """
+    Returns 1 if growth is a regression, -1 if shrinking is, 0 if neither.
+    """
+    if path.endswith(HIGHER_IS_BETTER):
+        return -1
+    if path.endswith(LOWER_IS_BETTER):
+        return 1
+    return 0
+
+
+def compare(base: dict, head: dict, threshold: float) -> list[dict]:
+    base_values = flatten(base["results"])
+    head_values = flatten(head["results"])
+    rows = []
+    for path, base_value in base_values.items():
+        sign = direction(path)
+        if not sign or path not in head_values:
+            continue
+        head_value = head_values[path]
+        change = (head_value - base_value) / base_value if base_value else 0.0
+        rows.append(
+            {
+                "metric": path,
+                "base": base_value,
+                "head": head_value,
+                "change": change,
+                "regression": sign * change > threshold,
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON.")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    rows = compare(base, head, args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            marker = "REGRESSION" if row["regression"] else ""
+            print(
+                f"{row['metric']:<48} {row['base']:>14.3f} {row['head']:>14.3f} "
+                f"{row['change']:>+8.1%} {marker}"
+            )
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
@@ -0,0 +1,115 @@
+"""
+Read latency under concurrent dataset writes.
+
+Readers fetch an image and a single dataset item while writers keep replacing
+a large dataset. `blocking` runs database calls inline on the event loop, which
+is how every route behaved before the async database layer; `pool` uses the
+bounded database thread pool. Run from the backend directory:
+
+    python -m benchmarks.concurrency --duration 10 --output result.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from .common import HEADERS, percentile, setup_volume
+from .generate import make_dataset
+
+
+async def run_load(api, args, dataset: dict) -> dict:
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        await client.post("/datasets/create", json=dataset, headers=HEADERS)
+        response = await client.post(
+            "/images/upload",
+            files={
+                "file": (
+                    f"{dataset['name']}.png",
+                    b"\x89PNG" + b"\0" * 4096,
+                    "image/png",
+                )
+            },
+            headers=HEADERS,
+        )
+        image_url = "/" + response.json()["url"].split("/", 3)[3]
+        latencies: list[float] = []
+        writes = 0
+        deadline = time.perf_counter() + args.duration
+
+        async def reader() -> None:
+            while time.perf_counter() < deadline:
+                for url in (image_url, f"/datasets/{dataset['name']}/item-0"):
+                    start = time.perf_counter()
+                    await client.get(url, headers=HEADERS)
+                    latencies.append(time.perf_counter() - start)
+
+        async def writer() -> None:
+            nonlocal writes
+            while time.perf_counter() < deadline:
+                await client.put(
+                    f"/datasets/{dataset['name']}", json=dataset, headers=HEADERS
+                )
+                writes += 1
+
+        await asyncio.gather(
+            *(reader() for _ in range(args.readers)),
+            *(writer() for _ in range(args.writers)),
+        )
+        await client.delete(f"/datasets/{dataset['name']}", headers=HEADERS)
+    return {
+        "reads": len(latencies),
+        "writes": writes,
+        "read_p50_ms": percentile(latencies, 0.50) * 1000,
+        "read_p99_ms": percentile(latencies, 0.99) * 1000,
+        "read_max_ms": max(latencies, default=0.0) * 1000,
+    }
+
+
+async def main(args) -> dict:
+    setup_volume()
+    from src import api
+
+    api.database.init_db()
+    pooled_run = api.db.run
+
+    async def inline_run(func, *func_args, **kwargs):
+        return func(*func_args, **kwargs)
+
+    results = {
+        "params": vars(args),
+    }
+    for mode in args.modes:
+        api.db.run = inline_run if mode == "blocking" else pooled_run
+        dataset = make_dataset(
+            f"bench-{mode}", args.items, args.depth, 1, args.text_size
+        )
+        results[mode] = await run_load(api, args, dataset)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--text-size", type=int, default=256)
+    parser.add_argument(
+        "--modes", nargs="+", default=["blocking", "pool"], choices=["blocking", "pool"]
+    )
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    output = args.output and os.path.abspath(args.output)
+    results = asyncio.run(main(args))
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
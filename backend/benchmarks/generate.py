@@ -0,0 +1,166 @@
+"""
+Synthetic conversation trees and import files for the benchmarks.
+
+A tree starts with a system node followed by `depth` user turns. Every user turn
+has `branching` assistant replies and every reply that is not in the last turn
+continues with one user turn, so an item holds `branching ** depth` conversation
+paths. Text is seeded filler of `text_size` characters, so two runs with the
+same parameters produce identical files.
+"""
+
+import json
+import pathlib
+import random
+
+NODE_SPACING_X = 350
+NODE_SPACING_Y = 100
+
+
+# Vocabulary the filler text is drawn from.
+WORD_LIST = (
+    "the model user assistant answer question data train token example "
+    "because which would could should there their about after before these "
+    "system prompt reply context reason step first second then result value "
+    "function return list string number check error output input format file "
+    "please explain why how what when where write code test change update"
+)
+WORDS = WORD_LIST.split()
+
+
+def filler_text(seed: int, text_size: int) -> str:
+    """
+    Returns `text_size` characters of words drawn from a fixed vocabulary,
+    starting with the word `token<seed>`. It compresses about as well as
+    English prose, unlike a repeated phrase.
+    """
+    rng = random.Random(seed)
+    words = [f"token{seed}"]
+    length = len(words[0])
+    while length < text_size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:text_size]
+
+
+def make_node(role: str, x: int, y: int, text: str, to: list[int]) -> dict:
+    return {
+        "role": role,
+        "nodePosition": {"x": x, "y": y},
+        "nodeSize": {"width": 256, "height": 64},
+        "positive": text,
+        "negative": "",
+        "to": to,
+    }
+
+
+def make_node_items(depth: int, branching: int, text_size: int) -> list[dict]:
+    """
+    Builds the node list of one conversation tree, in the editor's JSON shape.
+    """
+    nodes = [make_node("system", 0, 0, filler_text(0, text_size), [])]
+    # Nodes whose `to` receives the next user turn, with their row in the layout.
+    parents = [(0, 0)]
+    for turn in range(depth):
+        next_parents = []
+        for parent, row in parents:
+            user = len(nodes)
+            nodes[parent]["to"].append(user)
+            nodes.append(
+                make_node(
+                    "user",
+                    (2 * turn + 1) * NODE_SPACING_X,
+                    row * NODE_SPACING_Y,
+                    filler_text(user, text_size),
+                    [],
+                )
+            )
+            for branch in range(branching):
+                assistant = len(nodes)
+                nodes[user]["to"].append(assistant)
+                assistant_row = row * branching + branch
+                nodes.append(
+                    make_node(
+                        "assistant",
+                        (2 * turn + 2) * NODE_SPACING_X,
+                        assistant_row * NODE_SPACING_Y,
+                        filler_text(assistant, text_size),
+                        [],
+                    )
+                )
+                next_parents.append((assistant, assistant_row))
+        parents = next_parents
+    return nodes
+
+
+def make_dataset(
+    name: str, items: int, depth: int, branching: int, text_size: int
+) -> dict:
+    node_items = make_node_items(depth, branching, text_size)
+    return {
+        "name": name,
+        "timestamp": 0,
+        "items": [{"name": f"item-{i}", "nodeItems": node_items} for i in range(items)],
+    }
+
+
+def make_alpaca_record(index: int, depth: int, text_size: int) -> dict:
+    history = [
+        [
+            filler_text(index + 2 * turn, text_size),
+            filler_text(index + 2 * turn + 1, text_size),
+        ]
+        for turn in range(depth - 1)
+    ]
+    return {
+        "instruction": filler_text(index, text_size),
+        "input": "",
+        "output": filler_text(index + 1, text_size),
+        "system": filler_text(0, text_size),
+        "history": history,
+    }
+
+
+def make_chatml_record(index: int, depth: int, text_size: int) -> list[dict]:
+    conversation = [{"role": "system", "content": filler_text(0, text_size)}]
+    for turn in range(depth):
+        for offset, role in enumerate(("user", "assistant")):
+            conversation.append(
+                {
+                    "role": role,
+                    "content": filler_text(index + 2 * turn + offset, text_size),
+                }
+            )
+    return conversation
+
+
+RECORD_MAKERS = {"alpaca": make_alpaca_record, "chatml": make_chatml_record}
+
+
+def write_import_file(
+    path: str | pathlib.Path,
+    kind: str,
+    records: int,
+    depth: int,
+    text_size: int,
+    format: str = "jsonl",
+) -> int:
+    """
+    Writes `records` Alpaca or ChatML records as a JSON array or JSONL file, one
+    record at a time, and returns the file size in bytes.
+    """
+    make_record = RECORD_MAKERS[kind]
+    with open(path, "w", encoding="utf-8") as f:
+        if format == "json":
+            f.write("[")
+        for index in range(records):
+            if format == "json" and index:
+                f.write(",")
+            f.write(
+                json.dumps(make_record(index, depth, text_size), ensure_ascii=False)
+            )
+            if format == "jsonl":
+                f.write("\n")
+        if format == "json":
+            f.write("]")
+    return pathlib.Path(path).stat().st_size
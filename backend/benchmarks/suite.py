@@ -0,0 +1,416 @@
+"""
+End-to-end benchmarks against a temporary SQLite volume.
+
+Measures plugin import throughput, export latency and memory, single item CRUD
+latency at several dataset sizes, and image serving throughput, all through the
+ASGI app in-process. Imports and exports run as background jobs and are timed
+until their job finishes. Peak memory is traced in the server process only,
+not in the job processes that convert records. Results are written as JSON;
+compare two of them with `benchmarks.compare` to catch regressions. Run from
+the backend directory:
+
+    python -m benchmarks.suite --output result.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+import httpx
+
+from .common import HEADERS, latency_summary, run_metadata, setup_volume
+from .generate import make_dataset, make_node_items, write_import_file
+
+
+async def measured(func, memory: bool):
+    """
+    Awaits `func()` and returns its result, the wall time in seconds and, when
+    `memory` is set, the peak traced Python allocation in bytes.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = await func()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def wait_for_job(client: httpx.AsyncClient, response: httpx.Response) -> dict:
+    """
+    Polls the job a plugin request started until it ends and returns its result.
+    """
+    response.raise_for_status()
+    body = response.json()
+    if "job_url" not in body:
+        # Served from an earlier export without starting a job.
+        return body
+    url = body["job_url"]
+    while True:
+        job = (await client.get(url, headers=HEADERS)).json()["job"]
+        if job["status"] == "succeeded":
+            return job["result"]
+        if job["status"] not in ("queued", "running"):
+            raise RuntimeError(f"Job {job['id']} {job['status']}: {job['error']}")
+        await asyncio.sleep(0.05)
+
+
+async def bench_imports(client: httpx.AsyncClient, args) -> dict:
+    results = {}
+    for kind in args.import_kinds:
+        path = os.path.abspath(f"{kind}.{args.import_format}")
+        size = write_import_file(
+            path,
+            kind,
+            args.import_records,
+            args.depth,
+            args.text_size,
+            args.import_format,
+        )
+        result = {"records": args.import_records, "file_bytes": size}
+        # The second pass runs under tracemalloc, which slows it down too much to
+        # report its time.
+        for memory in (False, True):
+            dataset_name = f"import-{kind}-{'memory' if memory else 'timing'}"
+            await client.post(
+                "/datasets/create",
+                json={"name": dataset_name, "timestamp": 0, "items": []},
+                headers=HEADERS,
+            )
+
+            upload = functools.partial(import_file, client, kind, dataset_name, path)
+            body, elapsed, peak = await measured(upload, memory)
+            if memory:
+                result["peak_bytes"] = peak
+            else:
+                result["seconds"] = elapsed
+                result["items_per_second"] = body["count"] / elapsed
+                result["bytes_per_second"] = size / elapsed
+            await client.delete(f"/datasets/{dataset_name}", headers=HEADERS)
+        results[kind] = result
+    return results
+
+
+async def import_file(
+    client: httpx.AsyncClient, kind: str, dataset_name: str, path: str
+) -> dict:
+    """
+    Uploads `path` to a plugin import and returns its finished job's result.
+    """
+    loop = asyncio.get_running_loop()
+    file = await loop.run_in_executor(None, open, path, "rb")
+    with file:
+        response = await client.post(
+            f"/plugins/import_{kind}",
+            data={"dataset_name": dataset_name},
+            files={"file": (os.path.basename(path), file)},
+            headers=HEADERS,
+        )
+    return await wait_for_job(client, response)
+
+
+async def bench_exports(client: httpx.AsyncClient, args) -> dict:
+    """
+    Times a cold export of a new dataset, a repeat of it, which is served from
+    the cache, and an export after one item was edited, which reuses the rest.
+    """
+    dataset = make_dataset(
+        "export", args.export_items, args.depth, args.branching, args.text_size
+    )
+    edited = make_dataset("export", 1, args.depth, args.branching, args.text_size)
+    edited["items"][0]["nodeItems"][-1]["positive"] = "edited"
+    results = {
+        "items": args.export_items,
+        "paths": args.export_items * args.branching**args.depth,
+    }
+    cases = [
+        (f"{kind}_{format}", kind, {"format": format})
+        for kind in args.import_kinds
+        for format in ("json", "jsonl")
+    ]
+    cases.append(("parquet", "parquet", {}))
+
+    async def export(name: str, kind: str, options: dict, cold: bool = False):
+        response = await client.post(
+            f"/plugins/export_{kind}",
+            json={"dataset_name": "export", **options},
+            headers=HEADERS,
+        )
+        result = await wait_for_job(client, response)
+        reused = "job_url" not in response.json() or result.get("reused_items")
+        if cold and reused:
+            raise RuntimeError(f"Cold {name} export reused an earlier export")
+        return result
+
+    for name, kind, options in cases:
+        result = {}
+        for memory in (False, True):
+            # A new dataset has no earlier export to reuse.
+            await client.delete("/datasets/export", headers=HEADERS)
+            await client.post("/datasets/create", json=dataset, headers=HEADERS)
+            body, elapsed, peak = await measured(
+                functools.partial(export, name, kind, options, cold=True), memory
+            )
+            if memory:
+                result["peak_bytes"] = peak
+            else:
+                result["seconds"] = elapsed
+        download = await client.get(body["url"], headers=HEADERS)
+        result["bytes"] = len(download.content)
+        _, result["cached_seconds"], _ = await measured(
+            functools.partial(export, name, kind, options), False
+        )
+        await client.put(
+            "/datasets/export/item-0", json=edited["items"][0], headers=HEADERS
+        )
+        _, result["incremental_seconds"], _ = await measured(
+            functools.partial(export, name, kind, options), False
+        )
+        results[name] = result
+    await client.delete("/datasets/export", headers=HEADERS)
+    return results
+
+
+async def bench_crud(client: httpx.AsyncClient, args) -> dict:
+    node_items = make_node_items(args.depth, args.branching, args.text_size)
+    results = {}
+    for size in args.crud_sizes:
+        name = f"crud-{size}"
+        await client.post(
+            "/datasets/create",
+            json=make_dataset(name, size, args.depth, args.branching, args.text_size),
+            headers=HEADERS,
+        )
+        latencies = {"create": [], "get": [], "update": [], "delete": []}
+        for i in range(args.crud_iterations):
+            item = {"name": f"bench-{i}", "nodeItems": node_items}
+            target = f"item-{i % size}"
+            requests = [
+                ("create", "POST", f"/datasets/{name}/create", item),
+                ("get", "GET", f"/datasets/{name}/{target}", None),
+                (
+                    "update",
+                    "PUT",
+                    f"/datasets/{name}/{target}",
+                    {**item, "name": target},
+                ),
+                ("delete", "DELETE", f"/datasets/{name}/bench-{i}", None),
+            ]
+            for operation, method, url, body in requests:
+                start = time.perf_counter()
+                response = await client.request(method, url, json=body, headers=HEADERS)
+                latencies[operation].append(time.perf_counter() - start)
+                response.raise_for_status()
+        results[str(size)] = {
+            operation: latency_summary(samples)
+            for operation, samples in latencies.items()
+        }
+        await client.delete(f"/datasets/{name}", headers=HEADERS)
+    return results
+
+
+async def read_image(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    deadline: float,
+    latencies: list[float],
+    sizes: list[int],
+) -> None:
+    """
+    Requests `url` back to back until `deadline`, recording each request's
+    latency and transferred body size.
+    """
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(response.content))
+
+
+async def bench_images(client: httpx.AsyncClient, args) -> dict:
+    response = await client.post(
+        "/images/upload",
+        files={
+            "file": (
+                "bench.png",
+                b"\x89PNG" + os.urandom(args.image_size),
+                "image/png",
+            )
+        },
+        headers=HEADERS,
+    )
+    url = "/" + response.json()["url"].split("/", 3)[3]
+    etag = (await client.get(url)).headers["etag"]
+    results = {"image_bytes": args.image_size + 4}
+    for mode, headers in (("full", {}), ("not_modified", {"If-None-Match": etag})):
+        latencies: list[float] = []
+        sizes: list[int] = []
+        deadline = time.perf_counter() + args.image_duration
+        readers = (
+            read_image(client, url, headers, deadline, latencies, sizes)
+            for _ in range(args.image_concurrency)
+        )
+        start = time.perf_counter()
+        await asyncio.gather(*readers)
+        elapsed = time.perf_counter() - start
+        results[mode] = {
+            "requests_per_second": len(latencies) / elapsed,
+            "bytes_per_second": sum(sizes) / elapsed,
+            **latency_summary(latencies),
+        }
+    return results
+
+
+async def bench_search(client: httpx.AsyncClient, args) -> dict:
+    dataset = make_dataset(
+        "search", args.search_items, args.depth, args.branching, args.text_size
+    )
+    await client.post("/datasets/create", json=dataset, headers=HEADERS)
+    # Items share their filler text, so every query matches one node per item.
+    queries = {
+        "match_all": {"q": "token1"},
+        "role_filter": {"q": "token2", "role": "assistant"},
+        "second_page": {"q": "token1"},
+    }
+    results = {"items": args.search_items}
+    for name, params in queries.items():
+        latencies = []
+        for _ in range(args.search_iterations):
+            start = time.perf_counter()
+            response = await client.get("/search", params=params, headers=HEADERS)
+            response.raise_for_status()
+            if name == "second_page":
+                cursor = response.json()["next_cursor"]
+                start = time.perf_counter()
+                response = await client.get(
+                    "/search", params={**params, "cursor": cursor}, headers=HEADERS
+                )
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        results[name] = latency_summary(latencies)
+    await client.delete("/datasets/search", headers=HEADERS)
+    return results
+
+
+async def bench_responses(client: httpx.AsyncClient, args) -> dict:
+    from src.responses import dumps
+
+    dataset = make_dataset(
+        "responses",
+        args.response_items,
+        args.depth,
+        args.branching,
+        args.response_text_size,
+    )
+    await client.post("/datasets/create", json=dataset, headers=HEADERS)
+    results = {"item_bytes": len(dumps(dataset["items"][0]))}
+    for encoding in ("identity", "gzip", "br", "zstd"):
+        headers = {**HEADERS, "Accept-Encoding": encoding}
+        result = {}
+        for name, url in (
+            ("item", "/datasets/responses/item-0"),
+            ("dataset", "/datasets/responses"),
+        ):
+            latencies = []
+            for _ in range(args.response_iterations):
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            result[name] = {
+                "wire_bytes": response.num_bytes_downloaded,
+                **latency_summary(latencies),
+            }
+        results[encoding] = result
+    payload = {"message": "Dataset retrieved", "dataset": dataset}
+    timings = {}
+    for name, encode in (
+        ("stdlib", lambda: json.dumps(payload, ensure_ascii=False).encode("utf-8")),
+        ("orjson", lambda: dumps(payload)),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.response_iterations):
+            encode()
+        timings[f"{name}_encode_seconds"] = (
+            time.perf_counter() - start
+        ) / args.response_iterations
+    results["encode"] = timings
+    await client.delete("/datasets/responses", headers=HEADERS)
+    return results
+
+
+BENCHMARKS = {
+    "import": bench_imports,
+    "export": bench_exports,
+    "crud": bench_crud,
+    "images": bench_images,
+    "search": bench_search,
+    "responses": bench_responses,
+}
+
+
+async def main(args) -> dict:
+    setup_volume()
+    from src import api
+
+    api.database.init_db()
+    results = {"meta": run_metadata(), "params": vars(args), "results": {}}
+    transport = httpx.ASGITransport(app=api.app)
+    # The transport does not run the lifespan, which starts the job processes.
+    async with (
+        api.lifespan(api.app),
+        httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client,
+    ):
+        for name in args.benchmarks:
+            results["results"][name] = await BENCHMARKS[name](client, args)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS)
+    )
+    parser.add_argument("--depth", type=int, default=3, help="User turns per path.")
+    parser.add_argument(
+        "--branching", type=int, default=2, help="Assistant replies per user turn."
+    )
+    parser.add_argument("--text-size", type=int, default=256)
+    parser.add_argument(
+        "--import-kinds",
+        nargs="+",
+        default=["alpaca", "chatml"],
+        choices=["alpaca", "chatml"],
+    )
+    parser.add_argument("--import-records", type=int, default=20000)
+    parser.add_argument("--import-format", choices=["json", "jsonl"], default="jsonl")
+    parser.add_argument("--export-items", type=int, default=2000)
+    parser.add_argument("--crud-sizes", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--crud-iterations", type=int, default=50)
+    parser.add_argument("--search-items", type=int, default=10000)
+    parser.add_argument("--search-iterations", type=int, default=20)
+    parser.add_argument("--response-items", type=int, default=20)
+    parser.add_argument("--response-text-size", type=int, default=65536)
+    parser.add_argument("--response-iterations", type=int, default=10)
+    parser.add_argument("--image-size", type=int, default=1 << 20)
+    parser.add_argument("--image-duration", type=float, default=5.0)
+    parser.add_argument("--image-concurrency", type=int, default=8)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    output = args.output and os.path.abspath(args.output)
+    results = asyncio.run(main(args))
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
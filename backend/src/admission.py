@@ -0,0 +1,159 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable
+
+from starlette.routing import Match
+
+from .responses import dumps
+from .schemas import AdmissionClass
+
+
+def admission_class(name: str | None) -> Callable:
+    """
+    Decorator assigning a route endpoint to an admission class. None exempts
+    it from admission control, which suits cheap routes that report on the
+    server, so they keep working while it is saturated.
+    """
+
+    def decorator(endpoint):
+        endpoint.admission_class = name
+        return endpoint
+
+    return decorator
+
+
+class Gate:
+    """
+    Lets up to `concurrency` requests run at once and up to `queue_depth` wait
+    for a slot, in arrival order. A waiter that gets no slot within
+    `queue_timeout` seconds gives up.
+    """
+
+    def __init__(self, name: str, settings: AdmissionClass) -> None:
+        self.name = name
+        self.settings = settings
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        """
+        Waits for a slot and returns whether one was granted. Every granted
+        slot must be given back with `release`.
+        """
+        if self.active < self.settings.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.settings.queue_depth:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.settings.queue_timeout)
+        except TimeoutError:
+            # Unless the slot was handed over just as the wait ended.
+            if not waiter.done():
+                self.withdraw(waiter)
+                self.rejected += 1
+                return False
+        except BaseException:
+            if waiter.done():
+                self.release()
+            else:
+                self.withdraw(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def withdraw(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        self.waiters.remove(waiter)
+
+    def release(self) -> None:
+        # A released slot goes straight to the next waiter, if there is one.
+        if self.waiters:
+            self.waiters.popleft().set_result(None)
+        else:
+            self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.settings.concurrency,
+            "queue_depth": self.settings.queue_depth,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControl:
+    """
+    Admission control by request class. Each route belongs to the class set
+    with `admission_class` on its endpoint, or to `default`, and every class
+    has its own concurrency limit and queue, so heavy bulk work cannot crowd
+    out interactive requests. Limits apply per worker process.
+    """
+
+    def __init__(self, classes: dict[str, AdmissionClass], default: str) -> None:
+        self.default = default
+        self.gates = {name: Gate(name, settings) for name, settings in classes.items()}
+
+    def gate_for(self, endpoint) -> Gate | None:
+        name = getattr(endpoint, "admission_class", self.default)
+        return self.gates[name] if name is not None else None
+
+    def stats(self) -> dict:
+        return {name: gate.stats() for name, gate in self.gates.items()}
+
+
+class AdmissionMiddleware:
+    """
+    Holds every routed request to its class's limit. A request that finds its
+    class's queue full, or waits too long, is answered with 429 and
+    `Retry-After` before its body is read. A slot is held until the response
+    is fully sent. Requests that match no route are not limited.
+    """
+
+    def __init__(self, app, router, control: AdmissionControl) -> None:
+        self.app = app
+        self.router = router
+        self.control = control
+
+    def classify(self, scope) -> Gate | None:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match is Match.FULL:
+                return self.control.gate_for(getattr(route, "endpoint", None))
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        gate = self.classify(scope)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+        if not await gate.acquire():
+            body = dumps({"message": f"Too many {gate.name} requests, retry later"})
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(gate.settings.retry_after).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
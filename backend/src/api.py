@@ -1,14 +1,44 @@
-import os
+import asyncio
+import functools
+import importlib
+import inspect
 import json
+import os
 import pathlib
-import importlib
-
-from fastapi import FastAPI, HTTPException, File, UploadFile, Header, Depends
-from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+from typing import Annotated, Literal
+
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+)
 from fastapi.middleware.cors import CORSMiddleware
-
-from .database import Database
-from .schemas import Config, Dataset, DatasetItem
+from fastapi.responses import FileResponse, PlainTextResponse, Response
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from .admission import AdmissionControl, AdmissionMiddleware, admission_class
+from .artifacts import ArtifactStore
+from .cache import ObjectCache
+from .database import AsyncDatabase, BatchRejected, Database, VersionConflict
+from .files import FilePool
+from .images import ImageRejected, receive_images
+from .jobs import JobEngine
+from .metrics import EventLoopMonitor, Metrics, MetricsMiddleware
+from .responses import EXCEPTION_HANDLERS, CompressionMiddleware, JSONResponse
+from .schemas import (
+    Config,
+    Dataset,
+    DatasetBatch,
+    DatasetItem,
+    DatasetItemPatch,
+    Role,
+    UploadInit,
+)
+from .uploads import UploadConflict, UploadStore
 
 
 def load_config() -> Config:
@@ -20,23 +50,142 @@ def load_config() -> Config:
     try:
         with open("config.json", "r") as f:
             return Config(**json.load(f))
-    except Exception as e:
+    except (OSError, TypeError, ValueError) as e:
         raise RuntimeError(f"Error loading config: {e}")
 
 
 BASE_PATH = pathlib.Path(__file__).parent
 
 config = load_config()
-app = FastAPI()
-db = Database()
+event_handlers = {"startup": [], "shutdown": []}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs the startup and shutdown handlers of the app and its plugins. Every
+    worker process runs its own copy.
+    """
+    for handler in event_handlers["startup"]:
+        result = handler()
+        if inspect.isawaitable(result):
+            await result
+    yield
+    for handler in reversed(event_handlers["shutdown"]):
+        result = handler()
+        if inspect.isawaitable(result):
+            await result
+
+
+app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=JSONResponse,
+    exception_handlers=EXCEPTION_HANDLERS,
+)
+metrics = Metrics()
+database = Database(
+    config.storage,
+    ObjectCache(config.cache_max_entries, config.cache_max_bytes),
+    metrics,
+)
+db = AsyncDatabase(database, config.database_workers)
+artifacts = ArtifactStore(
+    "volume/exports",
+    config.export_max_bytes,
+    config.export_expiration_time,
+    config.export_cache_expiration_time,
+)
+event_loop_monitor = EventLoopMonitor(metrics)
+jobs = JobEngine(db, "volume/jobs", config.job_workers, config.job_processes)
+files = FilePool(config.file_workers)
+uploads = UploadStore(
+    "volume/uploads", config.upload_max_bytes, config.upload_expiration_time, files
+)
+admission = AdmissionControl(dict(config.admission), "interactive")
 plugin_interfaces = []
+plugin_handler_duration = metrics.histogram(
+    "plugin_handler_duration_seconds",
+    "Time spent in plugin handlers, excluding any streamed response body.",
+    ("plugin",),
+)
+cache_gauge = metrics.gauge("object_cache", "Parsed object cache state.", ("field",))
+export_gauge = metrics.gauge(
+    "export_artifacts", "Export artifacts kept on disk.", ("field",)
+)
+admission_gauge = metrics.gauge(
+    "admission", "Admission control state by request class.", ("name", "field")
+)
 
+app.add_middleware(AdmissionMiddleware, router=app.router, control=admission)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
 )
+app.add_middleware(CompressionMiddleware, profile=config.compression)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+
+@app.exception_handler(OperationalError)
+async def database_busy(request: Request, exc: OperationalError) -> Response:
+    """
+    Answers a write that waited out the busy timeout, such as one arriving while
+    an import is being published, with 503 so the client retries it.
+    """
+    if "database is locked" not in str(exc.orig):
+        raise exc
+    return JSONResponse(
+        {"message": "Database is busy, retry later"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(IntegrityError)
+async def database_conflict(request: Request, exc: IntegrityError) -> Response:
+    """
+    Answers a write that clashes with a concurrent one, such as two items given
+    the same name at once, with 409 instead of a server error.
+    """
+    return JSONResponse(
+        {"message": "Conflicts with a concurrent change"}, status_code=409
+    )
+
+
+def collect_state_metrics() -> None:
+    for field, value in database.cache.stats().items():
+        cache_gauge.set(value, field=field)
+    for field, value in artifacts.stats().items():
+        export_gauge.set(value, field=field)
+    for name, stats in admission.stats().items():
+        for field, value in stats.items():
+            admission_gauge.set(value, name=name, field=field)
+
+
+metrics.on_collect(collect_state_metrics)
+
+
+def timed_handler(handler, plugin: str):
+    """
+    Wraps a plugin handler so its run time is recorded. The wrapper keeps the
+    handler's signature, which FastAPI reads to resolve its parameters.
+    """
+    if inspect.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with plugin_handler_duration.time(plugin=plugin):
+                return await handler(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            with plugin_handler_duration.time(plugin=plugin):
+                return handler(*args, **kwargs)
+
+    return wrapper
 
 
 def verify_auth_token(authorization: str = Header(None)) -> str:
@@ -51,29 +200,99 @@ def verify_auth_token(authorization: str = Header(None)) -> str:
 
 
 @app.post("/images/upload", dependencies=[Depends(verify_auth_token)])
-async def upload_image(file: UploadFile = File(...)) -> JSONResponse:
+@admission_class("images")
+async def upload_image(request: Request) -> JSONResponse:
     """
-    Handles uploading of image files.
+    Handles uploading of an image file, sent as the multipart form field `file`.
     """
-    if file.content_type not in ["image/jpeg", "image/png", "image/gif"]:
-        raise JSONResponse({"message": "File type not allowed"}, status_code=400)
-    if file.size > config.max_file_size:
-        raise JSONResponse({"message": "File size too large"}, status_code=400)
+    try:
+        [image_id] = await receive_images(
+            request,
+            files,
+            database.images,
+            "file",
+            config.max_file_size,
+            1,
+            db.create_images,
+        )
+    except ImageRejected as e:
+        return JSONResponse({"message": str(e)}, status_code=e.status)
     return JSONResponse(
         {
             "message": "Image uploaded successfully",
-            "url": f"{config.api_base}images/{db.create_image(file.filename, file.content_type, await file.read())}",
+            "url": f"{config.api_base}images/{image_id}",
+        }
+    )
+
+
+@app.post("/images/upload_batch", dependencies=[Depends(verify_auth_token)])
+@admission_class("images")
+async def upload_images(request: Request) -> JSONResponse:
+    """
+    Handles uploading of several image files at once, sent as the multipart
+    form field `files`. Either every image is stored or none is.
+    """
+    try:
+        image_ids = await receive_images(
+            request,
+            files,
+            database.images,
+            "files",
+            config.max_file_size,
+            config.image_batch_max_files,
+            db.create_images,
+        )
+    except ImageRejected as e:
+        return JSONResponse({"message": str(e)}, status_code=e.status)
+    return JSONResponse(
+        {
+            "message": "Images uploaded successfully",
+            "urls": [f"{config.api_base}images/{image_id}" for image_id in image_ids],
         }
     )
 
 
-@app.get("/images/{id}")
-async def get_uploaded_file(id: int) -> Response:
+def etag_matches(if_none_match: str, etag: str) -> bool:
     """
-    Serves the uploaded file.
+    Weak comparison of an If-None-Match header against an entity tag.
     """
-    image = db.get_image_by_id(id)
-    return Response(image.data, media_type=image.file_type)
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+@app.api_route("/images/{id}", methods=["GET", "HEAD"])
+@admission_class("images")
+async def get_uploaded_file(
+    id: int,
+    request: Request,
+    if_none_match: str | None = Header(None),
+    if_range: str | None = Header(None),
+) -> Response:
+    """
+    Serves the uploaded file. Image content never changes for a given id, so
+    responses carry a content-hash ETag and may be cached indefinitely.
+    """
+    image = await db.get_image_by_id(id)
+    if image is None:
+        return JSONResponse({"message": "Image not found"}, status_code=404)
+    headers = {
+        "ETag": f'"{image.sha256}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if if_range == headers["ETag"]:
+        # FileResponse only checks If-Range against its own mtime based tag, so a
+        # validator matching the content hash is dropped to let the range apply.
+        request.scope["headers"] = [
+            (key, value)
+            for key, value in request.scope["headers"]
+            if key != b"if-range"
+        ]
+    return FileResponse(image.path, media_type=image.file_type, headers=headers)
 
 
 @app.get("/datasets/list", dependencies=[Depends(verify_auth_token)])
@@ -81,10 +300,67 @@ async def list_datasets() -> JSONResponse:
     """
     Lists all available datasets.
     """
-    return JSONResponse({"message": "Datasets listed", "datasets": db.list_datasets()})
+    return JSONResponse(
+        {"message": "Datasets listed", "datasets": await db.list_datasets()}
+    )
+
+
+@app.get("/datasets", dependencies=[Depends(verify_auth_token)])
+async def list_dataset_summaries(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    sort: Literal["name", "timestamp", "modified_at", "item_count"] = "name",
+    order: Literal["asc", "desc"] = "asc",
+    prefix: str = "",
+) -> JSONResponse:
+    """
+    Lists dataset metadata one page at a time.
+    """
+    try:
+        datasets, next_cursor = await db.list_dataset_summaries(
+            limit, cursor, sort, order, prefix
+        )
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    return JSONResponse(
+        {
+            "message": "Datasets listed",
+            "datasets": [dataset.model_dump() for dataset in datasets],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@app.get("/search", dependencies=[Depends(verify_auth_token)])
+async def search_nodes(
+    q: str,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: str | None = None,
+    role: Annotated[list[Role] | None, Query()] = None,
+    dataset: str | None = None,
+    syntax: Literal["plain", "fts5"] = "plain",
+) -> JSONResponse:
+    """
+    Searches node text across datasets, best match first. Matched words in the
+    snippets are wrapped in `<mark>` tags.
+    """
+    try:
+        hits, next_cursor = await db.search_nodes(
+            q, limit, cursor, [r.value for r in role or []], dataset, syntax
+        )
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    return JSONResponse(
+        {
+            "message": "Search completed",
+            "hits": [hit.model_dump() for hit in hits],
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @app.post("/datasets/create", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
 async def create_dataset(dataset: Dataset) -> JSONResponse:
     """
     Creates a new dataset.
@@ -93,34 +369,57 @@ async def create_dataset(dataset: Dataset) -> JSONResponse:
         return JSONResponse(
             {"message": "Dataset name cannot be empty"}, status_code=400
         )
-    db.create_dataset(dataset.name, dataset.timestamp, dataset.items)
+    try:
+        await db.create_dataset(dataset.name, dataset.timestamp, dataset.items)
+    except IntegrityError:
+        return JSONResponse(
+            {"message": "Dataset or dataset item name already exists"},
+            status_code=409,
+        )
     return JSONResponse({"message": "Dataset created"})
 
 
 @app.get("/datasets/{name}", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
 async def get_dataset(name: str) -> JSONResponse:
     """
     Retrieves a dataset.
     """
-    db.get_dataset_by_name(name).as_dataset()
-    return JSONResponse({"message": "Dataset retrieved"})
+    dataset = await db.get_dataset_by_name(name)
+    if dataset is None:
+        return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    return JSONResponse(
+        {"message": "Dataset retrieved", "dataset": dataset.model_dump()}
+    )
 
 
 @app.put("/datasets/{name}", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
 async def update_dataset(name: str, dataset: Dataset) -> JSONResponse:
     """
     Updates an existing dataset.
     """
-    db.update_dataset_by_name(name, dataset)
+    try:
+        if not await db.update_dataset_by_name(name, dataset):
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    except IntegrityError:
+        return JSONResponse(
+            {"message": "Dataset item names must be unique"}, status_code=409
+        )
     return JSONResponse({"message": "Dataset updated"})
 
 
 @app.delete("/datasets/{name}", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
 async def delete_dataset(name: str) -> JSONResponse:
     """
     Deletes an existing dataset.
     """
-    db.delete_dataset_by_name(name)
+    dataset_id = await db.delete_dataset_by_name(name)
+    if dataset_id is None:
+        return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, artifacts.purge_dataset, dataset_id)
     return JSONResponse({"message": "Dataset deleted"})
 
 
@@ -129,10 +428,39 @@ async def list_dataset_items(name: str) -> JSONResponse:
     """
     Lists all available dataset items.
     """
+    items = await db.list_dataset_items(name)
+    if items is None:
+        return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    return JSONResponse({"message": "Dataset items listed", "items": items})
+
+
+# Two path segments under a dataset name an item, so this listing takes three.
+@app.get("/datasets/{name}/items/summaries", dependencies=[Depends(verify_auth_token)])
+async def list_dataset_item_summaries(
+    name: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    sort: Literal["created", "name", "modified_at"] = "created",
+    order: Literal["asc", "desc"] = "asc",
+    prefix: str = "",
+) -> JSONResponse:
+    """
+    Lists dataset item metadata one page at a time.
+    """
+    try:
+        page = await db.list_dataset_item_summaries(
+            name, limit, cursor, sort, order, prefix
+        )
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    if page is None:
+        return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    items, next_cursor = page
     return JSONResponse(
         {
             "message": "Dataset items listed",
-            "items": [item.name for item in db.get_dataset_by_name(name).items],
+            "items": [item.model_dump() for item in items],
+            "next_cursor": next_cursor,
         }
     )
 
@@ -149,12 +477,39 @@ async def create_dataset_item(dataset_name: str, item: DatasetItem) -> JSONRespo
         return JSONResponse(
             {"message": "Dataset item name cannot be empty"}, status_code=400
         )
-    dataset = db.get_dataset_by_name(dataset_name)
-    dataset.items.append(item)
-    db.update_dataset_by_name(dataset_name, dataset)
+    try:
+        if not await db.create_dataset_item(dataset_name, item):
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    except IntegrityError:
+        return JSONResponse({"message": "Dataset item already exists"}, status_code=409)
     return JSONResponse({"message": "Dataset item created"})
 
 
+@app.post(
+    "/datasets/{dataset_name}/batch",
+    dependencies=[Depends(verify_auth_token)],
+)
+@admission_class("bulk")
+async def apply_item_batch(dataset_name: str, batch: DatasetBatch) -> JSONResponse:
+    """
+    Creates, updates, patches and deletes many dataset items in one transaction.
+    Either every operation applies or none does; the results list the outcome
+    of each operation in order.
+    """
+    try:
+        results = await db.apply_item_batch(dataset_name, batch.operations)
+    except BatchRejected as e:
+        status = next(
+            result["status"] for result in e.results if result["status"] >= 400
+        )
+        return JSONResponse(
+            {"message": "Batch rejected", "results": e.results}, status_code=status
+        )
+    if results is None:
+        return JSONResponse({"message": "Dataset not found"}, status_code=404)
+    return JSONResponse({"message": "Batch applied", "results": results})
+
+
 @app.get(
     "/datasets/{dataset_name}/{item_name}",
     dependencies=[Depends(verify_auth_token)],
@@ -163,13 +518,17 @@ async def get_dataset_item(dataset_name: str, item_name: str) -> JSONResponse:
     """
     Retrieves a dataset item.
     """
-    dataset = db.get_dataset_by_name(dataset_name)
-    for item in dataset.items:
-        if item.name == item_name:
-            return JSONResponse(
-                {"message": "Dataset item retrieved", "item": item.model_dump()}
-            )
-    return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    result = await db.get_dataset_item(dataset_name, item_name)
+    if result is None:
+        return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    item, version = result
+    return JSONResponse(
+        {
+            "message": "Dataset item retrieved",
+            "item": item.model_dump(),
+            "version": version,
+        }
+    )
 
 
 @app.put(
@@ -182,14 +541,37 @@ async def update_dataset_item(
     """
     Updates a dataset item.
     """
-    dataset = db.get_dataset_by_name(dataset_name)
-    item.name = item_name
-    for i, orig_item in enumerate(dataset.items):
-        if orig_item.name == item_name:
-            dataset.items[i] = item
-            db.update_dataset_by_name(dataset_name, dataset)
-            return JSONResponse({"message": "Dataset item updated"})
-    return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    version = await db.update_dataset_item(dataset_name, item_name, item)
+    if version is None:
+        return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    return JSONResponse({"message": "Dataset item updated", "version": version})
+
+
+@app.patch(
+    "/datasets/{dataset_name}/{item_name}",
+    dependencies=[Depends(verify_auth_token)],
+)
+async def patch_dataset_item(
+    dataset_name: str, item_name: str, patch: DatasetItemPatch
+) -> JSONResponse:
+    """
+    Applies a list of node operations to a dataset item, provided it is still at
+    the version the client last saw.
+    """
+    try:
+        version = await db.patch_dataset_item(
+            dataset_name, item_name, patch.version, patch.operations
+        )
+    except VersionConflict as e:
+        return JSONResponse(
+            {"message": "Dataset item was modified", "version": e.version},
+            status_code=409,
+        )
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    if version is None:
+        return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    return JSONResponse({"message": "Dataset item patched", "version": version})
 
 
 @app.delete(
@@ -200,13 +582,148 @@ async def delete_dataset_item(dataset_name: str, item_name: str) -> JSONResponse
     """
     Deletes a dataset item.
     """
-    dataset = db.get_dataset_by_name(dataset_name)
-    for i, item in enumerate(dataset.items):
-        if item.name == item_name:
-            del dataset.items[i]
-            db.update_dataset_by_name(dataset_name, dataset)
-            return JSONResponse({"message": "Dataset item deleted"})
-    return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    if not await db.delete_dataset_item(dataset_name, item_name):
+        return JSONResponse({"message": "Dataset item not found"}, status_code=404)
+    return JSONResponse({"message": "Dataset item deleted"})
+
+
+@app.get("/diagnostics", dependencies=[Depends(verify_auth_token)])
+@admission_class(None)
+async def diagnostics() -> JSONResponse:
+    """
+    Reports runtime settings and state useful for tuning.
+    """
+    return JSONResponse(
+        {
+            "message": "Diagnostics collected",
+            "storage": await db.storage_diagnostics(),
+            "cache": database.cache.stats(),
+            "admission": admission.stats(),
+        }
+    )
+
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(verify_auth_token)])
+async def get_job(job_id: str) -> JSONResponse:
+    """
+    Reports the state, progress, throughput and ETA of a background job.
+    """
+    job = await db.get_job(job_id)
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    return JSONResponse({"message": "Job retrieved", "job": jobs.describe(job)})
+
+
+@app.post("/jobs/{job_id}/cancel", dependencies=[Depends(verify_auth_token)])
+async def cancel_job(job_id: str) -> JSONResponse:
+    """
+    Requests cancellation of a queued or running job. An import is rolled back
+    and a partial export discarded.
+    """
+    job = await jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    if job.status not in ("queued", "running"):
+        return JSONResponse(
+            {"message": "Job already finished", "job": jobs.describe(job)},
+            status_code=409,
+        )
+    return JSONResponse(
+        {"message": "Job cancellation requested", "job": jobs.describe(job)}
+    )
+
+
+@app.post("/uploads", dependencies=[Depends(verify_auth_token)])
+async def create_upload(upload: UploadInit) -> JSONResponse:
+    """
+    Starts a resumable upload of an import file, sent afterwards in chunks.
+    """
+    try:
+        created = await uploads.create(upload.filename, upload.size, upload.sha256)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=413)
+    return JSONResponse(
+        {
+            "message": "Upload created",
+            "upload": created.model_dump(),
+            "upload_url": f"/uploads/{created.id}",
+        },
+        status_code=201,
+    )
+
+
+@app.get("/uploads/{upload_id}", dependencies=[Depends(verify_auth_token)])
+async def get_upload(upload_id: str) -> JSONResponse:
+    """
+    Reports how many bytes of an upload have arrived, where a client resumes.
+    """
+    upload = await uploads.get(upload_id)
+    if upload is None:
+        return JSONResponse({"message": "Upload not found"}, status_code=404)
+    return JSONResponse({"message": "Upload retrieved", "upload": upload.model_dump()})
+
+
+@app.put("/uploads/{upload_id}", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
+async def write_upload_chunk(
+    upload_id: str, request: Request, offset: int, sha256: str | None = None
+) -> JSONResponse:
+    """
+    Writes the raw request body at `offset` of an upload. With `sha256`, the
+    hex digest of the chunk, a corrupted chunk is rejected and discarded.
+    """
+    try:
+        new_offset = await uploads.write_chunk(
+            upload_id, offset, request.stream(), sha256
+        )
+    except UploadConflict as e:
+        return JSONResponse({"message": str(e), "offset": e.offset}, status_code=409)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    if new_offset is None:
+        return JSONResponse({"message": "Upload not found"}, status_code=404)
+    return JSONResponse({"message": "Chunk written", "offset": new_offset})
+
+
+@app.post("/uploads/{upload_id}/finalize", dependencies=[Depends(verify_auth_token)])
+@admission_class("bulk")
+async def finalize_upload(upload_id: str) -> JSONResponse:
+    """
+    Completes an upload, verifying its checksum if one was declared. Plugins
+    import from a finalized upload by its id.
+    """
+    try:
+        upload = await uploads.finalize(upload_id)
+    except UploadConflict as e:
+        return JSONResponse({"message": str(e), "offset": e.offset}, status_code=409)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=400)
+    if upload is None:
+        return JSONResponse({"message": "Upload not found"}, status_code=404)
+    return JSONResponse({"message": "Upload finalized", "upload": upload.model_dump()})
+
+
+@app.delete("/uploads/{upload_id}", dependencies=[Depends(verify_auth_token)])
+async def delete_upload(upload_id: str) -> JSONResponse:
+    """
+    Discards an upload and its staged bytes.
+    """
+    if not await uploads.delete(upload_id):
+        return JSONResponse({"message": "Upload not found"}, status_code=404)
+    return JSONResponse({"message": "Upload deleted"})
+
+
+@app.get("/metrics", dependencies=[Depends(verify_auth_token)])
+@admission_class(None)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Reports this worker's metrics in the Prometheus text format.
+    """
+    loop = asyncio.get_running_loop()
+    return PlainTextResponse(
+        await loop.run_in_executor(None, metrics.render),
+        media_type="text/plain; version=0.0.4",
+    )
 
 
 @app.get("/plugins/list", dependencies=[Depends(verify_auth_token)])
@@ -225,12 +742,24 @@ async def list_plugins():
     return JSONResponse({"message": "Plugins listed", "plugins": plugin_info})
 
 
+event_handlers["startup"].append(artifacts.on_startup)
+event_handlers["startup"].append(event_loop_monitor.on_startup)
+event_handlers["startup"].append(jobs.on_startup)
+event_handlers["startup"].append(uploads.on_startup)
+event_handlers["shutdown"].append(db.shutdown)
+event_handlers["shutdown"].append(files.shutdown)
+event_handlers["shutdown"].append(jobs.on_shutdown)
+event_handlers["shutdown"].append(artifacts.on_shutdown)
+event_handlers["shutdown"].append(event_loop_monitor.on_shutdown)
+event_handlers["shutdown"].append(uploads.on_shutdown)
+
 for path in (BASE_PATH / "plugins").iterdir():
     if path.is_file() and path.suffix == ".py" and path.stem != "__init__":
         plugin = importlib.import_module(f".plugins.{path.stem}", package="src")
-        plugin_instance = plugin.Plugin(db)
+        plugin_instance = plugin.Plugin(db, config, artifacts, jobs, uploads)
         for interface in plugin_instance.plugin_interfaces:
             assert interface.type in ["request", "download"]
+            assert interface.admission_class in [None, *admission.gates]
             for param in interface.params:
                 assert param.display_name != ""
                 assert param.api_name != ""
@@ -239,19 +768,22 @@ for path in (BASE_PATH / "plugins").iterdir():
                 plugin_interfaces.append(interface)
                 app.add_api_route(
                     f"/plugins/{interface.api_name}",
-                    interface.handler,
+                    admission_class(interface.admission_class)(
+                        timed_handler(interface.handler, interface.api_name)
+                    ),
                     dependencies=[Depends(verify_auth_token)],
                     methods=["POST"],
                 )
             elif interface.type == "download":
                 app.add_api_route(
                     f"/plugins/{interface.api_name}",
-                    interface.handler,
+                    admission_class(interface.admission_class)(
+                        timed_handler(interface.handler, interface.api_name)
+                    ),
                     dependencies=[Depends(verify_auth_token)],
                     methods=["GET"],
                 )
 
         if plugin_instance.on_events:
             for event, handlers in plugin_instance.on_events.items():
-                for handler in handlers:
-                    app.add_event_handler(event, handler)
+                event_handlers[event].extend(handlers)
@@ -0,0 +1,302 @@
+import array
+import asyncio
+import fcntl
+import json
+import os
+import pathlib
+import time
+import uuid
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from fastapi.responses import FileResponse, Response
+
+from .responses import JSONResponse
+
+EXPORT_NAMESPACE = uuid.UUID("47348547-a1bf-4136-9441-ea43d4febb47")
+
+
+class ArtifactTooLarge(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ExportKey:
+    """
+    Identifies the export of one version of a dataset. `kind` names the plugin
+    and every option that changes the output, such as `alpaca.jsonl`.
+    """
+
+    kind: str
+    dataset_id: int
+    version: int
+
+    def artifact_id(self) -> str:
+        name = f"{self.kind}/{self.dataset_id}/{self.version}"
+        return str(uuid.uuid5(EXPORT_NAMESPACE, name))
+
+
+@dataclass
+class Artifact:
+    id: str
+    path: pathlib.Path
+    filename: str
+    media_type: str
+    size: int
+    last_access: float
+    ttl: float
+    key: ExportKey | None
+
+
+class ArtifactStore:
+    """
+    Export artifacts kept as files under `root`, so they survive across workers
+    and never sit on the Python heap. Each artifact is a `<id>.data` file plus a
+    `<id>.json` sidecar holding its download filename and media type. The data
+    file's mtime is its last access time, which drives both TTL and LRU eviction.
+
+    An export written with an `ExportKey` is named after the key and kept for
+    `cache_ttl` instead, so asking again for an unchanged dataset finds it. It
+    may come with an `<id>.index` of where each item's output lies in the
+    file, for the next export of the dataset to copy unchanged items from.
+
+    Scanning methods such as `previous`, `supersede`, `purge_dataset` and
+    `evict` read every sidecar, so they run on job threads or an executor,
+    never on the event loop.
+    """
+
+    def __init__(
+        self, root: str | pathlib.Path, max_bytes: int, ttl: float, cache_ttl: float
+    ) -> None:
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.eviction_task: asyncio.Task | None = None
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def write(
+        self,
+        artifact_id: str,
+        filename: str,
+        media_type: str,
+        chunks: Iterable[bytes],
+        key: ExportKey | None = None,
+        index: array.array | None = None,
+    ) -> None:
+        """
+        Writes chunks to a new artifact named by a uuid4 string, or by
+        `key.artifact_id()` for a cached export. `index`, if given, is filled
+        while the chunks are consumed and saved with the artifact. Any
+        exception from `chunks` discards the partial file and propagates.
+        Raises `ArtifactTooLarge` if the artifact alone exceeds the byte budget.
+        """
+        uuid.UUID(artifact_id)
+        # Identical cached exports may be written concurrently, so every writer
+        # has its own staging files and the last one to finish wins.
+        part = f"{artifact_id}.{uuid.uuid4().hex}"
+        part_path = self.root / f"{part}.part"
+        meta = {"filename": filename, "media_type": media_type}
+        if key is not None:
+            meta.update(kind=key.kind, dataset_id=key.dataset_id, version=key.version)
+        try:
+            size = 0
+            with open(part_path, "wb") as f:
+                # Held until the artifact is in place, so eviction leaves this
+                # write alone however long it stalls between chunks.
+                fcntl.flock(f, fcntl.LOCK_EX)
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ArtifactTooLarge(
+                            f"Export exceeds the {self.max_bytes} byte budget"
+                        )
+                    f.write(chunk)
+                f.flush()
+                if index is not None:
+                    with open(self.root / f"{part}.index", "wb") as index_file:
+                        index.tofile(index_file)
+                    os.replace(
+                        self.root / f"{part}.index", self.root / f"{artifact_id}.index"
+                    )
+                with open(self.root / f"{part}.meta", "w") as meta_file:
+                    json.dump(meta, meta_file)
+                os.replace(
+                    self.root / f"{part}.meta", self.root / f"{artifact_id}.json"
+                )
+                os.replace(part_path, self.root / f"{artifact_id}.data")
+        except BaseException:
+            for suffix in (".part", ".index", ".meta"):
+                (self.root / f"{part}{suffix}").unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def get(self, artifact_id: str) -> Artifact | None:
+        try:
+            uuid.UUID(artifact_id)
+            path = self.root / f"{artifact_id}.data"
+            stat = path.stat()
+            with open(self.root / f"{artifact_id}.json") as f:
+                meta = json.load(f)
+        except (ValueError, OSError):
+            return None
+        key = None
+        if "kind" in meta:
+            key = ExportKey(meta["kind"], meta["dataset_id"], meta["version"])
+        return Artifact(
+            id=artifact_id,
+            path=path,
+            filename=meta["filename"],
+            media_type=meta["media_type"],
+            size=stat.st_size,
+            last_access=stat.st_mtime,
+            ttl=self.ttl if key is None else self.cache_ttl,
+            key=key,
+        )
+
+    def lookup(self, key: ExportKey) -> Artifact | None:
+        """
+        Returns the unexpired export for `key` and marks it as used, or None.
+        """
+        artifact = self.get(key.artifact_id())
+        if artifact is None or time.time() > artifact.last_access + artifact.ttl:
+            return None
+        os.utime(artifact.path)
+        return artifact
+
+    def previous(self, key: ExportKey) -> Artifact | None:
+        """
+        Returns the latest indexed export of the same kind of an earlier version
+        of the dataset, or None.
+        """
+        latest = None
+        for meta_path in self.root.glob("*.json"):
+            artifact = self.get(meta_path.stem)
+            if (
+                artifact is not None
+                and artifact.key is not None
+                and artifact.key.kind == key.kind
+                and artifact.key.dataset_id == key.dataset_id
+                and artifact.key.version < key.version
+                and (self.root / f"{artifact.id}.index").exists()
+                and (latest is None or artifact.key.version > latest.key.version)
+            ):
+                latest = artifact
+        return latest
+
+    def read_index(self, artifact: Artifact) -> array.array | None:
+        index = array.array("q")
+        try:
+            with open(self.root / f"{artifact.id}.index", "rb") as f:
+                index.frombytes(f.read())
+        except OSError:
+            return None
+        return index
+
+    def supersede(self, key: ExportKey) -> None:
+        """
+        Removes exports of the same kind of earlier versions of the dataset,
+        which no request can ask for anymore.
+        """
+        for meta_path in self.root.glob("*.json"):
+            artifact = self.get(meta_path.stem)
+            if (
+                artifact is not None
+                and artifact.key is not None
+                and artifact.key.kind == key.kind
+                and artifact.key.dataset_id == key.dataset_id
+                and artifact.key.version < key.version
+            ):
+                self.delete(artifact.id)
+
+    def purge_dataset(self, dataset_id: int) -> None:
+        """
+        Removes every export of a deleted dataset.
+        """
+        for meta_path in self.root.glob("*.json"):
+            artifact = self.get(meta_path.stem)
+            if (
+                artifact is not None
+                and artifact.key is not None
+                and artifact.key.dataset_id == dataset_id
+            ):
+                self.delete(artifact.id)
+
+    def delete(self, artifact_id: str) -> None:
+        for suffix in (".data", ".index", ".json"):
+            (self.root / f"{artifact_id}{suffix}").unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        entries = 0
+        total = 0
+        for path in self.root.glob("*.data"):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries += 1
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+    def download_response(self, artifact_id: str) -> Response:
+        artifact = self.get(artifact_id)
+        if not artifact:
+            return JSONResponse(status_code=404, content={"message": "File not found"})
+        if time.time() > artifact.last_access + artifact.ttl:
+            self.delete(artifact_id)
+            return JSONResponse(
+                status_code=410, content={"message": "File has expired"}
+            )
+        os.utime(artifact.path)
+        return FileResponse(
+            artifact.path, media_type=artifact.media_type, filename=artifact.filename
+        )
+
+    def evict(self) -> None:
+        """
+        Removes expired artifacts and partial writes abandoned by a crashed
+        writer, then the least recently downloaded artifacts until the store fits
+        in its byte budget.
+        """
+        now = time.time()
+        entries = []
+        for path in self.root.glob("*.part"):
+            try:
+                if now <= path.stat().st_mtime + self.ttl:
+                    continue
+                with open(path, "rb") as f:
+                    # A write in progress, in any worker, holds the lock.
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    path.unlink(missing_ok=True)
+            except (BlockingIOError, FileNotFoundError):
+                pass
+        for path in self.root.glob("*.data"):
+            artifact = self.get(path.stem)
+            if artifact is None:
+                # Left without a sidecar by an interrupted delete.
+                path.unlink(missing_ok=True)
+                continue
+            if now > artifact.last_access + artifact.ttl:
+                self.delete(artifact.id)
+            else:
+                entries.append((artifact.last_access, artifact.size, artifact.id))
+        total = sum(size for _, size, _ in entries)
+        for _, size, artifact_id in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.delete(artifact_id)
+            total -= size
+
+    async def on_startup(self):
+        # Every worker runs this loop. Eviction only unlinks files that are
+        # expired or over budget, so concurrent passes are harmless.
+        self.eviction_task = asyncio.create_task(self.run_eviction())
+
+    async def on_shutdown(self):
+        if self.eviction_task:
+            self.eviction_task.cancel()
+
+    async def run_eviction(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.evict)
+            await asyncio.sleep(self.ttl)
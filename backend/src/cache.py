@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+
+class ObjectCache:
+    """
+    Thread-safe LRU cache of parsed objects, bounded both by entry count and by
+    an estimate of their memory. Every entry is stored with a stamp, such as a
+    row version, and a lookup with a different stamp counts as a miss, so an
+    entry written by another process is never served stale. Entries may belong
+    to a group so that everything derived from one dataset can be dropped at once.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Hashable, tuple[Any, Any, int, Hashable]] = (
+            OrderedDict()
+        )
+        self.groups: dict[Hashable, set[Hashable]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, stamp: Any) -> Any | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(
+        self,
+        key: Hashable,
+        stamp: Any,
+        value: Any,
+        size: int,
+        group: Hashable = None,
+    ) -> None:
+        with self.lock:
+            self._remove(key)
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            self.entries[key] = (stamp, value, size, group)
+            self.bytes += size
+            if group is not None:
+                self.groups.setdefault(group, set()).add(key)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_group(self, group: Hashable) -> None:
+        with self.lock:
+            for key in list(self.groups.get(group, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        _, _, size, group = entry
+        self.bytes -= size
+        if group is not None:
+            keys = self.groups[group]
+            keys.discard(key)
+            if not keys:
+                del self.groups[group]
@@ -1,47 +1,617 @@
+import asyncio
+import base64
+import binascii
+import copy
+import functools
+import json
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from typing import Any
 
-from sqlalchemy import create_engine
-from sqlalchemy import Column, Integer, String, LargeBinary, JSON
-from sqlalchemy.orm import sessionmaker
+import orjson
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    and_,
+    bindparam,
+    create_engine,
+    event,
+    func,
+    inspect,
+    literal,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
 
-from .schemas import Image, Dataset
+from .cache import ObjectCache
+from .images import ImageStore, StoredImage
+from .metrics import Metrics
+from .patches import apply_operations
+from .schemas import (
+    BatchOperation,
+    CreateItem,
+    Dataset,
+    DatasetItem,
+    DatasetItemSummary,
+    DatasetSummary,
+    DeleteItem,
+    Image,
+    ItemOperation,
+    Job,
+    PatchItem,
+    SearchHit,
+    StorageProfile,
+    UpdateItem,
+)
 
-engine = create_engine("sqlite:///volume/database.db")
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+# Job state lives in its own SQLite file, so progress can be written while an
+# import holds the write lock of the main database.
+JobBase = declarative_base()
+
+# Pragmas reported by the storage diagnostics, in the order they are applied.
+STORAGE_PRAGMAS = ["journal_mode", "synchronous", "cache_size", "mmap_size"]
+
+
+# Search index rows are keyed by `item_id << NODE_INDEX_BITS | node_index`, so
+# all nodes of an item form one rowid range the triggers can replace at once.
+NODE_INDEX_BITS = 20
+
+# Keeps `node_search` in step with every insert, update and delete of an item,
+# whichever code path writes it.
+SEARCH_INDEX_NODES = f"""
+INSERT INTO node_search (rowid, positive, negative, role)
+SELECT (NEW.id << {NODE_INDEX_BITS}) | key,
+       json_extract(value, '$.positive'),
+       json_extract(value, '$.negative'),
+       json_extract(value, '$.role')
+FROM json_each(NEW.node_items) WHERE key < {1 << NODE_INDEX_BITS};
+"""
+SEARCH_UNINDEX_NODES = f"""
+DELETE FROM node_search WHERE rowid BETWEEN OLD.id << {NODE_INDEX_BITS}
+    AND (OLD.id << {NODE_INDEX_BITS}) | {(1 << NODE_INDEX_BITS) - 1};
+"""
+SEARCH_TRIGGERS = {
+    "dataset_items_search_insert": f"AFTER INSERT ON dataset_items BEGIN "
+    f"{SEARCH_INDEX_NODES} END",
+    "dataset_items_search_update": f"AFTER UPDATE OF node_items ON dataset_items "
+    f"BEGIN {SEARCH_UNINDEX_NODES} {SEARCH_INDEX_NODES} END",
+    "dataset_items_search_delete": f"AFTER DELETE ON dataset_items BEGIN "
+    f"{SEARCH_UNINDEX_NODES} END",
+}
+
+# Names or ids bound into one `IN (...)`, well below SQLite's variable limit.
+IN_CLAUSE_CHUNK = 500
+
+# A queued or running job whose worker has not sent a heartbeat for this long is
+# reported as failed.
+JOB_STALE_MILLIS = 60_000
+
+# Rough size of a parsed NodeItem and its nested models before its text, in bytes.
+NODE_OVERHEAD = 1024
+
+
+class VersionConflict(Exception):
+    def __init__(self, version: int) -> None:
+        super().__init__(f"Item is at version {version}")
+        self.version = version
+
+
+def batch_item_name(operation: BatchOperation) -> str:
+    if isinstance(operation, (CreateItem, UpdateItem)):
+        return operation.item.name
+    return operation.name
+
+
+class BatchRejected(Exception):
+    """
+    Raised when any operation of an item batch fails, after all of them were
+    checked. Nothing of the batch has been written.
+    """
+
+    def __init__(self, results: list[dict]) -> None:
+        super().__init__("Batch rejected")
+        self.results = results
+
+
+class BatchError(Exception):
+    def __init__(self, status: int, message: str, version: int | None = None):
+        super().__init__(message)
+        self.status = status
+        self.version = version
+
+
+def current_millis() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def chunked(values: list, size: int) -> Iterator[list]:
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def encode_cursor(sort: str, order: str, value: Any, id: int) -> str:
+    """
+    Packs the position after the last listed row into an opaque page cursor.
+    """
+    payload = json.dumps([sort, order, value, id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> tuple[Any, int]:
+    """
+    Returns the sort value and row id a cursor points after. Raises `ValueError`
+    if the cursor is malformed or was issued for a different ordering.
+    """
+    try:
+        cursor_sort, cursor_order, value, id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (ValueError, binascii.Error, UnicodeDecodeError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order) or not isinstance(id, int):
+        raise ValueError("Cursor does not match the requested sort order")
+    return value, id
+
+
+def find_free_prefix(taken: Iterable[str], default_prefix: str) -> str:
+    """
+    Returns the first `<default_prefix>-<n>-` prefix none of `taken` starts with.
+    """
+    taken = list(taken)
+    count = 0
+    while True:
+        prefix = f"{default_prefix}-{count}-"
+        if not any(name.startswith(prefix) for name in taken):
+            return prefix
+        count += 1
+
+
+def name_prefix_filter(column, prefix: str):
+    """
+    Matches names starting with `prefix` as a range, so the name index is used.
+    """
+    return and_(column >= prefix, column < prefix + "\U0010ffff")
+
+
+def estimate_item_size(item: DatasetItem) -> int:
+    """
+    Approximates the memory held by a parsed dataset item, for cache accounting.
+    """
+    size = NODE_OVERHEAD + len(item.name)
+    for node in item.nodeItems:
+        size += (
+            NODE_OVERHEAD
+            + len(node.positive)
+            + len(node.negative or "")
+            + 8 * len(node.to)
+        )
+    return size
 
 
 class ImageTable(Base):
     __tablename__ = "images"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String, unique=True)
+    name = Column(String)
     file_type = Column(String)
-    data = Column(LargeBinary)
+    sha256 = Column(String, index=True)
+    size = Column(Integer)
 
-    def as_image(self) -> Image:
+    def as_image(self, path: str) -> Image:
         return Image(
-            id=self.id, name=self.name, file_type=self.file_type, data=self.data
+            id=self.id,
+            name=self.name,
+            file_type=self.file_type,
+            sha256=self.sha256,
+            size=self.size,
+            path=path,
         )
 
 
 class DatasetTable(Base):
     __tablename__ = "datasets"
+    # Ids are never reused, so nothing keyed by a deleted dataset's id, such as
+    # a cached export, can be mistaken for a new dataset's.
+    __table_args__ = ({"sqlite_autoincrement": True},)
 
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True)
     timestamp = Column(Integer)
-    items = Column(JSON)
+    modified_at = Column(Integer, nullable=False, default=current_millis)
+    version = Column(Integer, nullable=False, default=1)
+
+    def as_dataset(self, items: list["DatasetItemTable"]) -> Dataset:
+        return Dataset(
+            name=self.name,
+            timestamp=self.timestamp,
+            items=[item.as_dataset_item() for item in items],
+        )
+
+
+class DatasetItemTable(Base):
+    __tablename__ = "dataset_items"
+    __table_args__ = (
+        Index("ix_dataset_items_dataset_id_name", "dataset_id", "name", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    dataset_id = Column(
+        Integer, ForeignKey("datasets.id", ondelete="CASCADE"), nullable=False
+    )
+    name = Column(String, nullable=False)
+    node_items = Column(JSON)
+    modified_at = Column(Integer, nullable=False, default=current_millis)
+    version = Column(Integer, nullable=False, default=1)
+
+    def as_dataset_item(self) -> DatasetItem:
+        return DatasetItem(name=self.name, nodeItems=self.node_items)
+
+
+class ImportTable(Base):
+    """
+    An unfinished import into a dataset and the item name prefix reserved for
+    it. Its items are staged in `import_items` until it is published.
+    """
 
-    def as_dataset(self) -> Dataset:
-        return Dataset(name=self.name, timestamp=self.timestamp, items=self.items)
+    __tablename__ = "imports"
+
+    id = Column(String, primary_key=True)
+    dataset_id = Column(Integer)
+    prefix = Column(String)
+    created_at = Column(Integer, nullable=False, default=current_millis)
+
+
+class ImportItemTable(Base):
+    __tablename__ = "import_items"
+
+    id = Column(Integer, primary_key=True)
+    import_id = Column(String, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    node_items = Column(JSON)
+
+
+class JobTable(JobBase):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    unit = Column(String, nullable=False)
+    done = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    processed = Column(Integer, nullable=False, default=0)
+    created_at = Column(Integer, nullable=False, default=current_millis)
+    started_at = Column(Integer)
+    finished_at = Column(Integer)
+    heartbeat_at = Column(Integer, nullable=False, default=current_millis)
+    result = Column(JSON)
+    error = Column(String)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+
+    def as_job(self) -> Job:
+        return Job(
+            id=self.id,
+            kind=self.kind,
+            status=self.status,
+            unit=self.unit,
+            done=self.done,
+            total=self.total,
+            processed=self.processed,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            result=self.result,
+            error=self.error,
+            cancel_requested=self.cancel_requested,
+        )
+
+
+def migrate_dataset_items(connection, database: "Database") -> None:
+    """
+    Moves the per-dataset `items` JSON blob into one `dataset_items` row per item.
+    Items are taken to have last changed at the dataset's timestamp.
+    """
+    columns = [column["name"] for column in inspect(connection).get_columns("datasets")]
+    if "items" not in columns:
+        return
+    dataset_items = DatasetItemTable.__table__
+    for dataset_id, items, timestamp in connection.exec_driver_sql(
+        "SELECT id, items, timestamp FROM datasets"
+    ).all():
+        rows = []
+        names = set()
+        for item in json.loads(items or "[]"):
+            # Names used to be unique only by convention, keep duplicates reachable.
+            name = item["name"]
+            suffix = 1
+            while name in names:
+                name = f"{item['name']} ({suffix})"
+                suffix += 1
+            names.add(name)
+            rows.append(
+                {
+                    "dataset_id": dataset_id,
+                    "name": name,
+                    "node_items": item["nodeItems"],
+                    "modified_at": timestamp or 0,
+                }
+            )
+        if rows:
+            connection.execute(dataset_items.insert(), rows)
+    connection.exec_driver_sql("ALTER TABLE datasets DROP COLUMN items")
+
+
+def migrate_image_files(connection, database: "Database") -> None:
+    """
+    Moves image blobs out of SQLite into the content-addressed image store,
+    keeping every image id so existing URLs stay valid.
+    """
+    columns = [column["name"] for column in inspect(connection).get_columns("images")]
+    if "data" not in columns:
+        return
+    connection.exec_driver_sql("ALTER TABLE images RENAME TO images_legacy")
+    ImageTable.__table__.create(connection)
+    legacy_rows = connection.exec_driver_sql(
+        "SELECT id, name, file_type, data FROM images_legacy"
+    )
+    for id, name, file_type, data in legacy_rows:
+        sha256, size = database.images.write([data or b""])
+        connection.execute(
+            ImageTable.__table__.insert(),
+            {
+                "id": id,
+                "name": name,
+                "file_type": file_type,
+                "sha256": sha256,
+                "size": size,
+            },
+        )
+    connection.exec_driver_sql("DROP TABLE images_legacy")
+
+
+def migrate_modified_times(connection, database: "Database") -> None:
+    """
+    Adds last-modified times to datasets and items, starting from the dataset's
+    own timestamp.
+    """
+    for table in ("datasets", "dataset_items"):
+        columns = [column["name"] for column in inspect(connection).get_columns(table)]
+        if "modified_at" not in columns:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN modified_at INTEGER NOT NULL DEFAULT 0"
+            )
+    connection.exec_driver_sql(
+        "UPDATE datasets SET modified_at = COALESCE(timestamp, 0) WHERE modified_at = 0"
+    )
+    connection.exec_driver_sql(
+        "UPDATE dataset_items SET modified_at = "
+        "(SELECT modified_at FROM datasets WHERE datasets.id = dataset_id) "
+        "WHERE modified_at = 0"
+    )
+
+
+def migrate_versions(connection, database: "Database") -> None:
+    """
+    Adds the version counters bumped by every write to datasets and items.
+    """
+    for table in ("datasets", "dataset_items"):
+        columns = [column["name"] for column in inspect(connection).get_columns(table)]
+        if "version" not in columns:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+            )
+
+
+def migrate_search_index(connection, database: "Database") -> None:
+    """
+    Creates the FTS5 index over node text, fills it from the existing items and
+    installs the triggers that keep it current. Matches in `positive` weigh
+    twice as much as in `negative`; `role` is only there to filter on.
+    """
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS node_search USING fts5("
+        "positive, negative, role, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO node_search (node_search, rank) "
+        "VALUES ('rank', 'bm25(2.0, 1.0, 0.0)')"
+    )
+    connection.exec_driver_sql("DELETE FROM node_search")
+    connection.exec_driver_sql(
+        "INSERT INTO node_search (rowid, positive, negative, role) "
+        f"SELECT (dataset_items.id << {NODE_INDEX_BITS}) | key, "
+        "json_extract(value, '$.positive'), json_extract(value, '$.negative'), "
+        "json_extract(value, '$.role') "
+        "FROM dataset_items, json_each(dataset_items.node_items) "
+        f"WHERE key < {1 << NODE_INDEX_BITS}"
+    )
+    for name, body in SEARCH_TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def rebuild_table(connection, table) -> None:
+    """
+    Recreates `table` from its current definition and copies every row over,
+    keeping ids. The new table is built beside the old one and renamed into
+    place once the old one is gone, so foreign keys of other tables that name
+    it keep pointing at it. Its indexes are recreated, its triggers are not.
+    """
+    scratch = MetaData()
+    # The copy's foreign keys must resolve within its own metadata.
+    for key in table.foreign_keys:
+        key.column.table.to_metadata(scratch)
+    new_table = table.to_metadata(scratch, name=f"{table.name}_new")
+    for index in table.indexes:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    new_table.create(connection)
+    columns = ", ".join(column.name for column in table.columns)
+    connection.exec_driver_sql(
+        f"INSERT INTO {new_table.name} ({columns}) SELECT {columns} FROM {table.name}"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {table.name}")
+    connection.exec_driver_sql(f"ALTER TABLE {new_table.name} RENAME TO {table.name}")
+
+
+def migrate_autoincrement(connection, database: "Database") -> None:
+    """
+    Rebuilds the dataset and item tables with AUTOINCREMENT keys, keeping every
+    id, so ids freed by deletes are not handed out again.
+    """
+    for table in (DatasetTable.__table__, DatasetItemTable.__table__):
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table.name,),
+        ).scalar_one()
+        if "AUTOINCREMENT" not in sql.upper():
+            rebuild_table(connection, table)
+    for name, body in SEARCH_TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def migrate_item_foreign_key(connection, database: "Database") -> None:
+    """
+    Points the item table's foreign key back at `datasets`. An earlier version
+    of `migrate_autoincrement` renamed the dataset table aside, which SQLite
+    followed by rewriting the key to the renamed table before it was dropped.
+    """
+    references = {
+        row[2]
+        for row in connection.exec_driver_sql("PRAGMA foreign_key_list(dataset_items)")
+    }
+    if references == {"datasets"}:
+        return
+    rebuild_table(connection, DatasetItemTable.__table__)
+    for name, body in SEARCH_TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def search_terms(query: str) -> str:
+    """
+    Turns plain search text into an FTS5 query matching every word, quoting
+    each word so FTS5 operators and punctuation in it are taken literally.
+    """
+    words = query.split()
+    if not words:
+        raise ValueError("Search query cannot be empty")
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+# The database `user_version` is the number of migrations already applied.
+MIGRATIONS = [
+    migrate_dataset_items,
+    migrate_image_files,
+    migrate_modified_times,
+    migrate_versions,
+    migrate_search_index,
+    migrate_autoincrement,
+    migrate_item_foreign_key,
+]
+
+
+def create_storage_engine(storage: StorageProfile, path: str | None = None):
+    """
+    Creates the SQLite engine for a storage profile, on `path` instead of the
+    profile's database if given. Every new pooled connection gets the profile's
+    pragmas before it is handed out.
+    """
+    engine = create_engine(
+        f"sqlite:///{path or storage.path}",
+        pool_size=storage.pool_size,
+        max_overflow=0,
+        connect_args={"timeout": storage.busy_timeout / 1000},
+        # JSON columns hold whole node lists, so their encoding dominates item
+        # reads and writes.
+        json_serializer=lambda value: orjson.dumps(value).decode(),
+        json_deserializer=orjson.loads,
+    )
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in STORAGE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma} = {getattr(storage, pragma)}")
+        cursor.execute(f"PRAGMA busy_timeout = {storage.busy_timeout}")
+        cursor.close()
+
+    return engine
+
+
+def instrument_engine(engine, metrics: Metrics) -> None:
+    """
+    Times every statement sent to SQLite, labeled by its leading keyword.
+    """
+    queries = metrics.histogram(
+        "db_query_duration_seconds",
+        "Time spent executing SQL statements, by statement type.",
+        ("operation",),
+    )
+    errors = metrics.counter(
+        "db_query_errors_total", "SQL statements that raised.", ("operation",)
+    )
+
+    def operation(statement: str) -> str:
+        keyword = statement.lstrip().split(None, 1)[:1]
+        return keyword[0].lower() if keyword else "unknown"
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(connection, cursor, statement, parameters, context, executemany):
+        start = connection.info["query_start"].pop()
+        queries.observe(time.perf_counter() - start, operation=operation(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def count_error(context):
+        starts = context.connection and context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+        errors.inc(operation=operation(context.statement or ""))
 
 
 class Database:
+    def __init__(
+        self, storage: StorageProfile, cache: ObjectCache, metrics: Metrics
+    ) -> None:
+        self.storage = storage
+        self.engine = create_storage_engine(storage)
+        self.jobs_engine = create_storage_engine(storage, storage.jobs_path)
+        instrument_engine(self.engine, metrics)
+        instrument_engine(self.jobs_engine, metrics)
+        self.Session = sessionmaker(bind=self.engine)
+        self.JobSession = sessionmaker(bind=self.jobs_engine)
+        self.images = ImageStore(storage.images_path)
+        self.cache = cache
+        self.import_items = metrics.counter(
+            "import_items_total", "Dataset items written by bulk imports."
+        )
+        self.import_batches = metrics.counter(
+            "import_batches_total", "Batches written by bulk imports."
+        )
+        self.import_duration = metrics.histogram(
+            "import_duration_seconds",
+            "Wall time of the transactions publishing bulk imports.",
+        )
+
     @contextmanager
-    def get_session(self):
-        session = Session()
+    def get_session(self, Session=None):
+        session = (Session or self.Session)()
         try:
             yield session
             session.commit()
@@ -52,63 +622,1067 @@ class Database:
             session.close()
 
     def init_db(self):
-        Base.metadata.create_all(engine)
+        Base.metadata.create_all(self.engine)
+        JobBase.metadata.create_all(self.jobs_engine)
+        with self.engine.begin() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(connection, self)
+                connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+    def storage_diagnostics(self) -> dict:
+        """
+        Returns the configured storage profile next to the values SQLite reports
+        for a pooled connection, plus pool and file statistics.
+        """
+        with self.engine.connect() as connection:
+            effective = {
+                pragma: connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+                for pragma in [*STORAGE_PRAGMAS, "busy_timeout"]
+            }
+            page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+            page_count = connection.exec_driver_sql("PRAGMA page_count").scalar()
+            freelist_count = connection.exec_driver_sql(
+                "PRAGMA freelist_count"
+            ).scalar()
+        return {
+            "profile": self.storage.model_dump(),
+            "effective": effective,
+            "pool": {
+                "size": self.engine.pool.size(),
+                "checked_in": self.engine.pool.checkedin(),
+                "checked_out": self.engine.pool.checkedout(),
+            },
+            "database_bytes": page_size * page_count,
+            "free_bytes": page_size * freelist_count,
+        }
 
-    def create_image(self, name: str, file_type: str, data: bytes) -> int:
+    def create_images(self, images: list[StoredImage]) -> list[int]:
+        """
+        Records images already written to the store and returns their ids, in
+        one transaction. Content that is already stored with the same type
+        reuses the existing id.
+        """
+        ids = []
         with self.get_session() as session:
-            image = ImageTable(name=name, file_type=file_type, data=data)
-            session.add(image)
-            session.flush()
-            return image.id
+            for stored in images:
+                image_id = session.scalar(
+                    select(ImageTable.id).filter_by(
+                        sha256=stored.sha256, file_type=stored.file_type
+                    )
+                )
+                if image_id is None:
+                    image = ImageTable(
+                        name=stored.name,
+                        file_type=stored.file_type,
+                        sha256=stored.sha256,
+                        size=stored.size,
+                    )
+                    session.add(image)
+                    session.flush()
+                    image_id = image.id
+                ids.append(image_id)
+        return ids
 
-    def get_image_by_id(self, id: int) -> Image:
+    def get_image_by_id(self, id: int) -> Image | None:
         with self.get_session() as session:
-            return session.query(ImageTable).filter_by(id=id).first().as_image()
+            image = session.query(ImageTable).filter_by(id=id).first()
+            if not image:
+                return None
+            return image.as_image(str(self.images.path_for(image.sha256)))
 
     def delete_image_by_id(self, id: id) -> None:
         with self.get_session() as session:
             image = session.query(ImageTable).filter_by(id=id).first()
             session.delete(image)
+            session.flush()
+            shared = session.scalar(
+                select(ImageTable.id).filter_by(sha256=image.sha256).limit(1)
+            )
+            if shared is None:
+                self.images.delete(image.sha256)
 
     def list_datasets(self) -> list[str]:
         with self.get_session() as session:
-            return [dataset.name for dataset in session.query(DatasetTable).all()]
+            return list(session.scalars(select(DatasetTable.name)))
 
-    def create_dataset(self, name: str, timestamp: int, items: dict) -> DatasetTable:
+    def list_dataset_summaries(
+        self,
+        limit: int,
+        cursor: str | None = None,
+        sort: str = "name",
+        order: str = "asc",
+        prefix: str = "",
+    ) -> tuple[list[DatasetSummary], str | None]:
+        """
+        Returns one page of dataset metadata and the cursor of the next page.
+        `sort` is one of `name`, `timestamp`, `modified_at` or `item_count`.
+        Raises `ValueError` for a bad cursor.
+        """
+        item_count = (
+            select(func.count())
+            .where(DatasetItemTable.dataset_id == DatasetTable.id)
+            .scalar_subquery()
+        )
+        key = item_count if sort == "item_count" else getattr(DatasetTable, sort)
+        statement = select(
+            DatasetTable.id,
+            DatasetTable.name,
+            DatasetTable.timestamp,
+            DatasetTable.modified_at,
+            item_count.label("item_count"),
+            key.label("sort_key"),
+        )
+        if prefix:
+            statement = statement.where(name_prefix_filter(DatasetTable.name, prefix))
         with self.get_session() as session:
-            dataset = DatasetTable(name=name, timestamp=timestamp, items=items)
+            rows, next_cursor = self._paginate(
+                session, statement, key, DatasetTable.id, limit, cursor, sort, order
+            )
+        return [
+            DatasetSummary(
+                name=row.name,
+                timestamp=row.timestamp or 0,
+                item_count=row.item_count,
+                modified_at=row.modified_at,
+            )
+            for row in rows
+        ], next_cursor
+
+    def create_dataset(
+        self, name: str, timestamp: int, items: list[DatasetItem]
+    ) -> None:
+        with self.get_session() as session:
+            modified_at = current_millis()
+            dataset = DatasetTable(
+                name=name, timestamp=timestamp, modified_at=modified_at
+            )
             session.add(dataset)
-            return dataset
+            session.flush()
+            self._insert_items(session, dataset.id, items, modified_at)
+            self.cache.invalidate_group(dataset.id)
 
     def get_dataset_by_id(self, id: int) -> Dataset:
         with self.get_session() as session:
-            return session.query(DatasetTable).filter_by(id=id).first().as_dataset()
+            dataset = session.query(DatasetTable).filter_by(id=id).first()
+            return self._load_dataset(session, dataset)
 
     def get_dataset_by_name(self, name: str) -> Dataset | None:
         with self.get_session() as session:
             dataset = session.query(DatasetTable).filter_by(name=name).first()
-            return dataset.as_dataset() if dataset else None
+            if not dataset:
+                return None
+            return self._load_dataset(session, dataset)
 
-    def delete_dataset_by_id(self, id: int) -> None:
+    def delete_dataset_by_id(self, id: int) -> int | None:
+        """
+        Deletes the dataset and returns its id, or None if there is none.
+        """
         with self.get_session() as session:
             dataset = session.query(DatasetTable).filter_by(id=id).first()
+            if not dataset:
+                return None
+            self._delete_items(session, dataset.id)
             session.delete(dataset)
+            self.cache.invalidate_group(dataset.id)
+            return dataset.id
 
-    def delete_dataset_by_name(self, name: str) -> None:
+    def delete_dataset_by_name(self, name: str) -> int | None:
+        """
+        Deletes the dataset and returns its id, or None if there is none.
+        """
         with self.get_session() as session:
             dataset = session.query(DatasetTable).filter_by(name=name).first()
+            if not dataset:
+                return None
+            self._delete_items(session, dataset.id)
             session.delete(dataset)
+            self.cache.invalidate_group(dataset.id)
+            return dataset.id
 
-    def update_dataset_by_id(self, id: int, dataset: Dataset) -> None:
-        dataset = dataset.model_dump()
+    def update_dataset_by_id(self, id: int, dataset: Dataset) -> bool:
+        """
+        Replaces the dataset's items. Returns False if there is no such dataset.
+        """
         with self.get_session() as session:
             dataset_table = session.query(DatasetTable).filter_by(id=id).first()
-            dataset_table.items = dataset["items"]
-            dataset_table.timestamp = dataset["timestamp"]
+            if not dataset_table:
+                return False
+            dataset_table.timestamp = dataset.timestamp
+            dataset_table.modified_at = current_millis()
+            dataset_table.version = DatasetTable.version + 1
+            self._delete_items(session, dataset_table.id)
+            self._insert_items(
+                session, dataset_table.id, dataset.items, dataset_table.modified_at
+            )
+            self.cache.invalidate_group(dataset_table.id)
+            return True
 
-    def update_dataset_by_name(self, name: str, dataset: Dataset) -> None:
-        dataset = dataset.model_dump()
+    def update_dataset_by_name(self, name: str, dataset: Dataset) -> bool:
+        """
+        Replaces the dataset's items. Returns False if there is no such dataset.
+        """
         with self.get_session() as session:
             dataset_table = session.query(DatasetTable).filter_by(name=name).first()
-            dataset_table.items = dataset["items"]
-            dataset_table.timestamp = dataset["timestamp"]
+            if not dataset_table:
+                return False
+            dataset_table.timestamp = dataset.timestamp
+            dataset_table.modified_at = current_millis()
+            dataset_table.version = DatasetTable.version + 1
+            self._delete_items(session, dataset_table.id)
+            self._insert_items(
+                session, dataset_table.id, dataset.items, dataset_table.modified_at
+            )
+            self.cache.invalidate_group(dataset_table.id)
+            return True
+
+    def list_dataset_items(self, dataset_name: str) -> list[str] | None:
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+            if dataset_id is None:
+                return None
+            return list(
+                session.scalars(
+                    select(DatasetItemTable.name)
+                    .filter_by(dataset_id=dataset_id)
+                    .order_by(DatasetItemTable.id)
+                )
+            )
+
+    def count_dataset_items(self, dataset_name: str) -> int | None:
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+            if dataset_id is None:
+                return None
+            return session.scalar(
+                select(func.count()).where(DatasetItemTable.dataset_id == dataset_id)
+            )
+
+    def list_dataset_item_summaries(
+        self,
+        dataset_name: str,
+        limit: int,
+        cursor: str | None = None,
+        sort: str = "created",
+        order: str = "asc",
+        prefix: str = "",
+    ) -> tuple[list[DatasetItemSummary], str | None] | None:
+        """
+        Returns one page of item metadata and the cursor of the next page, or None
+        if the dataset does not exist. `sort` is one of `created`, `name` or
+        `modified_at`. Raises `ValueError` for a bad cursor.
+        """
+        key = (
+            DatasetItemTable.id
+            if sort == "created"
+            else getattr(DatasetItemTable, sort)
+        )
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+            if dataset_id is None:
+                return None
+            statement = select(
+                DatasetItemTable.id,
+                DatasetItemTable.name,
+                DatasetItemTable.modified_at,
+                key.label("sort_key"),
+            ).where(DatasetItemTable.dataset_id == dataset_id)
+            if prefix:
+                statement = statement.where(
+                    name_prefix_filter(DatasetItemTable.name, prefix)
+                )
+            rows, next_cursor = self._paginate(
+                session, statement, key, DatasetItemTable.id, limit, cursor, sort, order
+            )
+        return [
+            DatasetItemSummary(name=row.name, modified_at=row.modified_at)
+            for row in rows
+        ], next_cursor
+
+    def get_dataset_item(
+        self, dataset_name: str, item_name: str
+    ) -> tuple[DatasetItem, int] | None:
+        """
+        Returns the item and its version. The parse is served from the cache if
+        the version is unchanged, otherwise it is loaded and cached.
+        """
+        with self.get_session() as session:
+            row = session.execute(
+                select(
+                    DatasetItemTable.id,
+                    DatasetItemTable.dataset_id,
+                    DatasetItemTable.name,
+                    DatasetItemTable.version,
+                    DatasetItemTable.modified_at,
+                )
+                .join(DatasetTable, DatasetTable.id == DatasetItemTable.dataset_id)
+                .where(DatasetTable.name == dataset_name)
+                .where(DatasetItemTable.name == item_name)
+            ).first()
+            if row is None:
+                return None
+            items = self._load_items(session, [row])
+            return (items[0], row.version) if items else None
+
+    def iter_dataset_items(
+        self, dataset_name: str, batch_size: int = 256
+    ) -> Iterator[DatasetItem] | None:
+        """
+        Returns a lazy iterator over the items of a dataset, or None if it does not
+        exist. Items are fetched `batch_size` rows at a time in short sessions so no
+        read transaction stays open while the caller consumes them.
+        """
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+        if dataset_id is None:
+            return None
+        return self._iter_items(dataset_id, batch_size)
+
+    def dataset_version(self, dataset_name: str) -> tuple[int, int] | None:
+        """
+        Returns the id and version of a dataset, or None if it does not exist.
+        Every write to the dataset or its items bumps the version.
+        """
+        with self.get_session() as session:
+            row = session.execute(
+                select(DatasetTable.id, DatasetTable.version).filter_by(
+                    name=dataset_name
+                )
+            ).first()
+            return (row.id, row.version) if row else None
+
+    def iter_item_batches(
+        self, dataset_id: int, known: dict[int, int], batch_size: int = 256
+    ) -> Iterator[list[tuple[int, int, DatasetItem | None]]]:
+        """
+        Yields the items of a dataset in batches of (id, version, item), like
+        `iter_dataset_items`. Items whose version is the one `known` maps their
+        id to are not loaded and come with None.
+        """
+        last_id = 0
+        while True:
+            with self.get_session() as session:
+                rows = session.execute(
+                    select(
+                        DatasetItemTable.id,
+                        DatasetItemTable.dataset_id,
+                        DatasetItemTable.name,
+                        DatasetItemTable.version,
+                        DatasetItemTable.modified_at,
+                    )
+                    .where(DatasetItemTable.dataset_id == dataset_id)
+                    .where(DatasetItemTable.id > last_id)
+                    .order_by(DatasetItemTable.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    return
+                last_id = rows[-1].id
+                items = self._load_item_map(
+                    session, [row for row in rows if known.get(row.id) != row.version]
+                )
+            yield [
+                (row.id, row.version, items.get(row.id))
+                for row in rows
+                if row.id in items or known.get(row.id) == row.version
+            ]
+
+    def create_dataset_item(self, dataset_name: str, item: DatasetItem) -> bool:
+        """
+        Inserts a single item row. Raises `IntegrityError` if the name is taken.
+        """
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+            if dataset_id is None:
+                return False
+            modified_at = current_millis()
+            self._insert_items(session, dataset_id, [item], modified_at)
+            self._touch_dataset(session, dataset_id, modified_at)
+            return True
+
+    def update_dataset_item(
+        self, dataset_name: str, item_name: str, item: DatasetItem
+    ) -> int | None:
+        """
+        Replaces an item's nodes and returns its new version, or None if the item
+        does not exist.
+        """
+        with self.get_session() as session:
+            item_table = self._get_item(session, dataset_name, item_name)
+            if not item_table:
+                return None
+            item_table.node_items = item.model_dump()["nodeItems"]
+            item_table.modified_at = current_millis()
+            item_table.version = DatasetItemTable.version + 1
+            self._touch_dataset(session, item_table.dataset_id, item_table.modified_at)
+            self.cache.invalidate(("item", item_table.id))
+            session.flush()
+            return session.scalar(
+                select(DatasetItemTable.version).filter_by(id=item_table.id)
+            )
+
+    def patch_dataset_item(
+        self,
+        dataset_name: str,
+        item_name: str,
+        version: int,
+        operations: list[ItemOperation],
+    ) -> int | None:
+        """
+        Applies operations to an item's stored nodes if it is still at `version`
+        and returns the new version, or None if the item does not exist. The
+        nodes are edited as stored JSON without validating the whole item again.
+        Raises `VersionConflict` if the item changed since `version` and
+        `ValueError` if an operation does not apply.
+        """
+        items = DatasetItemTable.__table__
+        with self.get_session() as session:
+            row = session.execute(
+                select(
+                    DatasetItemTable.id,
+                    DatasetItemTable.dataset_id,
+                    DatasetItemTable.version,
+                    DatasetItemTable.node_items,
+                )
+                .join(DatasetTable, DatasetTable.id == DatasetItemTable.dataset_id)
+                .where(DatasetTable.name == dataset_name)
+                .where(DatasetItemTable.name == item_name)
+            ).first()
+            if row is None:
+                return None
+            if row.version != version:
+                raise VersionConflict(row.version)
+            node_items = row.node_items
+            apply_operations(node_items, operations)
+            modified_at = current_millis()
+            # The version check is repeated in the write, so a concurrent update
+            # from another worker between the read and here is still detected.
+            updated = session.execute(
+                items.update()
+                .where(items.c.id == row.id, items.c.version == version)
+                .values(
+                    node_items=node_items,
+                    modified_at=modified_at,
+                    version=items.c.version + 1,
+                )
+            )
+            if updated.rowcount == 0:
+                raise VersionConflict(
+                    session.scalar(
+                        select(DatasetItemTable.version).filter_by(id=row.id)
+                    )
+                )
+            self._touch_dataset(session, row.dataset_id, modified_at)
+            self.cache.invalidate(("item", row.id))
+            return version + 1
+
+    def delete_dataset_item(self, dataset_name: str, item_name: str) -> bool:
+        with self.get_session() as session:
+            item_table = self._get_item(session, dataset_name, item_name)
+            if not item_table:
+                return False
+            session.delete(item_table)
+            self._touch_dataset(session, item_table.dataset_id, current_millis())
+            self.cache.invalidate(("item", item_table.id))
+            return True
+
+    def apply_item_batch(
+        self, dataset_name: str, operations: list[BatchOperation]
+    ) -> list[dict] | None:
+        """
+        Applies creates, updates, patches and deletes of items as one transaction
+        and returns one result per operation, or None if the dataset does not
+        exist. Every operation is checked first, in order and against the effect
+        of the ones before it, and the batch is only written if all of them
+        apply. Writes are grouped into one statement per kind of change.
+        Raises `BatchRejected` with the per-operation results otherwise.
+        """
+        items = DatasetItemTable.__table__
+        with self.get_session() as session:
+            dataset_id = self._get_dataset_id(session, dataset_name)
+            if dataset_id is None:
+                return None
+            modified_at = current_millis()
+            # Taking the write lock before reading any item keeps the versions
+            # read below current until the commit.
+            self._touch_dataset(session, dataset_id, modified_at)
+            names = {batch_item_name(operation) for operation in operations}
+            states = {
+                name: {"id": None, "version": 0, "node_items": None} for name in names
+            }
+            for row in self._select_in(
+                session,
+                select(
+                    DatasetItemTable.name, DatasetItemTable.id, DatasetItemTable.version
+                ).where(DatasetItemTable.dataset_id == dataset_id),
+                DatasetItemTable.name,
+                names,
+            ):
+                states[row.name].update(id=row.id, version=row.version, exists=True)
+            patched_ids = {
+                states[operation.name]["id"]
+                for operation in operations
+                if isinstance(operation, PatchItem)
+                and states[operation.name]["id"] is not None
+            }
+            stored_nodes = {
+                row.id: row.node_items
+                for row in self._select_in(
+                    session,
+                    select(DatasetItemTable.id, DatasetItemTable.node_items),
+                    DatasetItemTable.id,
+                    patched_ids,
+                )
+            }
+
+            results = []
+            deleted_ids = []
+            for operation in operations:
+                try:
+                    results.append(
+                        self._plan_batch_operation(
+                            operation, states, stored_nodes, deleted_ids
+                        )
+                    )
+                except BatchError as e:
+                    result = {
+                        "op": operation.op,
+                        "name": batch_item_name(operation),
+                        "status": e.status,
+                        "message": str(e),
+                    }
+                    if e.version is not None:
+                        result["version"] = e.version
+                    results.append(result)
+            if any(result["status"] >= 400 for result in results):
+                raise BatchRejected(results)
+
+            for chunk in chunked(deleted_ids, IN_CLAUSE_CHUNK):
+                session.execute(items.delete().where(items.c.id.in_(chunk)))
+            updated = [
+                {
+                    "item_id": state["id"],
+                    "new_nodes": state["node_items"],
+                    "new_version": state["version"],
+                }
+                for state in states.values()
+                if state["id"] is not None and state.get("dirty")
+            ]
+            if updated:
+                session.execute(
+                    items.update()
+                    .where(items.c.id == bindparam("item_id"))
+                    .values(
+                        node_items=bindparam("new_nodes"),
+                        version=bindparam("new_version"),
+                        modified_at=modified_at,
+                    ),
+                    updated,
+                )
+            created = [
+                {
+                    "dataset_id": dataset_id,
+                    "name": name,
+                    "node_items": state["node_items"],
+                    "version": state["version"],
+                    "modified_at": modified_at,
+                }
+                for name, state in states.items()
+                if state["id"] is None and state.get("exists")
+            ]
+            if created:
+                session.execute(items.insert(), created)
+            for item_id in [*deleted_ids, *(row["item_id"] for row in updated)]:
+                self.cache.invalidate(("item", item_id))
+            return results
+
+    def _plan_batch_operation(
+        self,
+        operation: BatchOperation,
+        states: dict[str, dict],
+        stored_nodes: dict[int, list[dict]],
+        deleted_ids: list[int],
+    ) -> dict:
+        """
+        Applies one batch operation to the in-memory item states and returns its
+        result. Raises `BatchError` if it does not apply.
+        """
+        name = batch_item_name(operation)
+        state = states[name]
+        exists = state.get("exists", False)
+        if isinstance(operation, CreateItem):
+            if name == "":
+                raise BatchError(400, "Dataset item name cannot be empty")
+            if exists:
+                raise BatchError(409, "Dataset item already exists")
+            state.update(
+                id=None,
+                version=1,
+                node_items=operation.item.model_dump()["nodeItems"],
+                exists=True,
+                dirty=True,
+            )
+            return {"op": "create", "name": name, "status": 201, "version": 1}
+        if not exists:
+            raise BatchError(404, "Dataset item not found")
+        if operation.version is not None and operation.version != state["version"]:
+            raise BatchError(409, "Dataset item was modified", state["version"])
+        if isinstance(operation, DeleteItem):
+            if state["id"] is not None:
+                deleted_ids.append(state["id"])
+            state.update(id=None, version=0, node_items=None, exists=False)
+            return {"op": "delete", "name": name, "status": 200}
+        if isinstance(operation, UpdateItem):
+            node_items = operation.item.model_dump()["nodeItems"]
+        else:
+            node_items = state["node_items"]
+            if node_items is None:
+                node_items = stored_nodes[state["id"]]
+            # Copied so a failing operation leaves the planned nodes untouched.
+            node_items = copy.deepcopy(node_items)
+            try:
+                apply_operations(node_items, operation.operations)
+            except ValueError as e:
+                raise BatchError(400, str(e))
+        state.update(node_items=node_items, version=state["version"] + 1, dirty=True)
+        return {
+            "op": operation.op,
+            "name": name,
+            "status": 200,
+            "version": state["version"],
+        }
+
+    def _select_in(self, session, statement, column, values) -> Iterator:
+        """
+        Runs `statement` restricted to `column IN values`, a chunk of values at a
+        time, and yields the rows of every chunk.
+        """
+        for chunk in chunked(list(values), IN_CLAUSE_CHUNK):
+            yield from session.execute(statement.where(column.in_(chunk)))
+
+    def begin_import(
+        self, dataset_name: str, default_prefix: str
+    ) -> tuple[str, str] | None:
+        """
+        Registers an import into a dataset and reserves it the first
+        `<default_prefix>-<n>-` item name prefix that neither an item nor
+        another unfinished import uses. Returns the import id and the prefix,
+        or None if the dataset does not exist.
+        """
+        import_id = str(uuid.uuid4())
+        with self.get_session() as session:
+            # Written before anything is read, so the write lock orders
+            # concurrent imports and no two of them pick the same prefix.
+            session.execute(
+                ImportTable.__table__.insert().values(
+                    id=import_id,
+                    dataset_id=select(DatasetTable.id)
+                    .filter_by(name=dataset_name)
+                    .scalar_subquery(),
+                    created_at=current_millis(),
+                )
+            )
+            dataset_id = session.scalar(
+                select(ImportTable.dataset_id).filter_by(id=import_id)
+            )
+            if dataset_id is None:
+                session.rollback()
+                return None
+            taken = set(
+                session.scalars(
+                    select(ImportTable.prefix)
+                    .filter_by(dataset_id=dataset_id)
+                    .where(ImportTable.prefix.is_not(None))
+                )
+            )
+            taken.update(
+                session.scalars(
+                    select(DatasetItemTable.name)
+                    .filter_by(dataset_id=dataset_id)
+                    .where(
+                        name_prefix_filter(DatasetItemTable.name, f"{default_prefix}-")
+                    )
+                )
+            )
+            prefix = find_free_prefix(taken, default_prefix)
+            session.execute(
+                ImportTable.__table__.update()
+                .where(ImportTable.id == import_id)
+                .values(prefix=prefix)
+            )
+        return import_id, prefix
+
+    def stage_import_rows(
+        self, import_id: str, rows: list[tuple[str, list[dict]]]
+    ) -> None:
+        """
+        Stages a batch of `(name, nodeItems)` items of an import in a short
+        transaction of its own. Staged items stay invisible until published.
+        """
+        if not rows:
+            return
+        with self.get_session() as session:
+            session.execute(
+                ImportItemTable.__table__.insert(),
+                [
+                    {"import_id": import_id, "name": name, "node_items": node_items}
+                    for name, node_items in rows
+                ],
+            )
+        self.import_batches.inc()
+
+    def publish_import(self, import_id: str) -> int:
+        """
+        Moves the staged items of an import into its dataset in one statement
+        and returns how many there were. Raises `KeyError` if the import or its
+        dataset no longer exists and `IntegrityError` if a staged name was
+        taken meanwhile; the import is left as it was then.
+        """
+        with self.import_duration.time(), self.get_session() as session:
+            modified_at = current_millis()
+            # Bumping the version first takes the write lock.
+            touched = session.execute(
+                DatasetTable.__table__.update()
+                .where(
+                    DatasetTable.id
+                    == select(ImportTable.dataset_id)
+                    .filter_by(id=import_id)
+                    .scalar_subquery()
+                )
+                .values(modified_at=modified_at, version=DatasetTable.version + 1)
+            ).rowcount
+            if not touched:
+                raise KeyError(import_id)
+            dataset_id = session.scalar(
+                select(ImportTable.dataset_id).filter_by(id=import_id)
+            )
+            self.cache.invalidate(("dataset", dataset_id))
+            staged = select(
+                literal(dataset_id),
+                ImportItemTable.name,
+                ImportItemTable.node_items,
+                literal(modified_at),
+            ).where(ImportItemTable.import_id == import_id)
+            count = session.execute(
+                DatasetItemTable.__table__.insert().from_select(
+                    ["dataset_id", "name", "node_items", "modified_at"],
+                    staged.order_by(ImportItemTable.id),
+                )
+            ).rowcount
+            self._discard_import(session, import_id)
+        # Only published imports count towards throughput.
+        self.import_items.inc(count)
+        return count
+
+    def discard_import(self, import_id: str) -> None:
+        """
+        Drops an unfinished import, its staged items and its prefix reservation.
+        """
+        with self.get_session() as session:
+            self._discard_import(session, import_id)
+
+    def create_job(self, id: str, kind: str, unit: str, total: int | None) -> None:
+        with self.get_session(self.JobSession) as session:
+            session.add(JobTable(id=id, kind=kind, unit=unit, total=total))
+
+    def update_job(self, id: str, **values) -> bool:
+        """
+        Updates job columns and refreshes its heartbeat. Returns whether
+        cancellation has been requested.
+        """
+        with self.get_session(self.JobSession) as session:
+            session.query(JobTable).filter_by(id=id).update(
+                {**values, "heartbeat_at": current_millis()}
+            )
+            return bool(
+                session.scalar(select(JobTable.cancel_requested).filter_by(id=id))
+            )
+
+    def touch_jobs(self, ids: list[str]) -> None:
+        if not ids:
+            return
+        with self.get_session(self.JobSession) as session:
+            session.query(JobTable).filter(JobTable.id.in_(ids)).update(
+                {"heartbeat_at": current_millis()}
+            )
+
+    def get_job(self, id: str) -> Job | None:
+        """
+        Returns a job. A queued or running job without a recent heartbeat lost
+        its worker, so it is marked as failed first.
+        """
+        with self.get_session(self.JobSession) as session:
+            now = current_millis()
+            session.query(JobTable).filter(
+                JobTable.id == id,
+                JobTable.status.in_(["queued", "running"]),
+                JobTable.heartbeat_at < now - JOB_STALE_MILLIS,
+            ).update(
+                {"status": "failed", "error": "Job was interrupted", "finished_at": now}
+            )
+            job = session.query(JobTable).filter_by(id=id).first()
+            return job.as_job() if job else None
+
+    def cancel_job(self, id: str) -> Job | None:
+        """
+        Flags an unfinished job for cancellation. The job's worker stops it at
+        its next progress update.
+        """
+        with self.get_session(self.JobSession) as session:
+            session.query(JobTable).filter(
+                JobTable.id == id, JobTable.status.in_(["queued", "running"])
+            ).update({"cancel_requested": True})
+        return self.get_job(id)
+
+    def search_nodes(
+        self,
+        query: str,
+        limit: int,
+        cursor: str | None = None,
+        roles: list[str] | None = None,
+        dataset_name: str | None = None,
+        syntax: str = "plain",
+    ) -> tuple[list[SearchHit], str | None]:
+        """
+        Returns one page of nodes matching `query`, best match first, and the
+        cursor of the next page. `syntax` is `plain` to match every word of the
+        query, or `fts5` to pass it through as an FTS5 query expression. Raises
+        `ValueError` for an empty or malformed query or a bad cursor.
+        """
+        terms = search_terms(query) if syntax == "plain" else f"({query})"
+        match = f"{{positive negative}} : {terms}"
+        if roles:
+            match += " AND role : (" + " OR ".join(f'"{role}"' for role in roles) + ")"
+        conditions = ["node_search MATCH :match"]
+        parameters: dict[str, Any] = {"match": match, "limit": limit + 1}
+        if dataset_name is not None:
+            conditions.append("datasets.name = :dataset_name")
+            parameters["dataset_name"] = dataset_name
+        if cursor is not None:
+            parameters["rank"], parameters["rowid"] = decode_cursor(
+                cursor, "rank", "asc"
+            )
+            conditions.append(
+                "(node_search.rank > :rank OR "
+                "(node_search.rank = :rank AND node_search.rowid > :rowid))"
+            )
+        statement = text(
+            "SELECT node_search.rowid, node_search.rank, node_search.role, "
+            "snippet(node_search, -1, '<mark>', '</mark>', '…', 16) AS snippet, "
+            "dataset_items.name AS item, datasets.name AS dataset "
+            "FROM node_search "
+            f"JOIN dataset_items ON dataset_items.id = "
+            f"node_search.rowid >> {NODE_INDEX_BITS} "
+            "JOIN datasets ON datasets.id = dataset_items.dataset_id "
+            f"WHERE {' AND '.join(conditions)} "
+            "ORDER BY node_search.rank, node_search.rowid LIMIT :limit"
+        )
+        with self.get_session() as session:
+            try:
+                rows = session.execute(statement, parameters).all()
+            except OperationalError as e:
+                if "locked" in str(e.orig):
+                    raise
+                raise ValueError(f"Invalid search query: {e.orig}")
+        hits = [
+            SearchHit(
+                dataset=row.dataset,
+                item=row.item,
+                node_index=row.rowid & ((1 << NODE_INDEX_BITS) - 1),
+                role=row.role or "",
+                snippet=row.snippet or "",
+                score=-row.rank,
+            )
+            for row in rows[:limit]
+        ]
+        if len(rows) <= limit:
+            return hits, None
+        last = rows[limit - 1]
+        return hits, encode_cursor("rank", "asc", last.rank, last.rowid)
+
+    def _paginate(self, session, statement, key, id_column, limit, cursor, sort, order):
+        """
+        Applies keyset pagination on `(key, id)` to a statement selecting `id` and
+        `sort_key`, and returns at most `limit` rows plus the next page cursor.
+        """
+        descending = order == "desc"
+        if cursor is not None:
+            value, last_id = decode_cursor(cursor, sort, order)
+            if descending:
+                after = or_(key < value, and_(key == value, id_column < last_id))
+            else:
+                after = or_(key > value, and_(key == value, id_column > last_id))
+            statement = statement.where(after)
+        if descending:
+            statement = statement.order_by(key.desc(), id_column.desc())
+        else:
+            statement = statement.order_by(key, id_column)
+        rows = session.execute(statement.limit(limit + 1)).all()
+        if len(rows) <= limit:
+            return rows, None
+        last = rows[limit - 1]
+        return rows[:limit], encode_cursor(sort, order, last.sort_key, last.id)
+
+    def _touch_dataset(self, session, dataset_id: int, modified_at: int) -> None:
+        session.query(DatasetTable).filter_by(id=dataset_id).update(
+            {"modified_at": modified_at, "version": DatasetTable.version + 1}
+        )
+        self.cache.invalidate(("dataset", dataset_id))
+
+    def _load_dataset(self, session, dataset: DatasetTable) -> Dataset:
+        """
+        Returns the cached parse of a dataset if its version is unchanged,
+        otherwise loads its items and caches the result.
+        """
+        key = ("dataset", dataset.id)
+        stamp = (dataset.version, dataset.modified_at)
+        cached = self.cache.get(key, stamp)
+        if cached is not None:
+            return cached
+        loaded = dataset.as_dataset(self._query_items(session, dataset.id))
+        size = sum(estimate_item_size(item) for item in loaded.items)
+        self.cache.put(key, stamp, loaded, size, group=dataset.id)
+        return loaded
+
+    def _load_items(self, session, rows) -> list[DatasetItem]:
+        """
+        Resolves item metadata rows (id, dataset_id, name, version, modified_at)
+        to parsed items, reading `node_items` only for rows missing from the cache.
+        """
+        items = self._load_item_map(session, rows)
+        return [items[row.id] for row in rows if row.id in items]
+
+    def _load_item_map(self, session, rows) -> dict[int, DatasetItem]:
+        items = {}
+        for row in rows:
+            cached = self.cache.get(("item", row.id), (row.version, row.modified_at))
+            if cached is not None:
+                items[row.id] = cached
+        missing = {row.id: row for row in rows if row.id not in items}
+        if missing:
+            for id, node_items in session.execute(
+                select(DatasetItemTable.id, DatasetItemTable.node_items).where(
+                    DatasetItemTable.id.in_(missing)
+                )
+            ):
+                row = missing[id]
+                item = DatasetItem(name=row.name, nodeItems=node_items)
+                self.cache.put(
+                    ("item", id),
+                    (row.version, row.modified_at),
+                    item,
+                    estimate_item_size(item),
+                    group=row.dataset_id,
+                )
+                items[id] = item
+        return items
+
+    def _get_dataset_id(self, session, dataset_name: str) -> int | None:
+        return session.scalar(select(DatasetTable.id).filter_by(name=dataset_name))
+
+    def _get_item(self, session, dataset_name: str, item_name: str):
+        return (
+            session.query(DatasetItemTable)
+            .join(DatasetTable, DatasetTable.id == DatasetItemTable.dataset_id)
+            .filter(DatasetTable.name == dataset_name)
+            .filter(DatasetItemTable.name == item_name)
+            .first()
+        )
+
+    def _query_items(self, session, dataset_id: int) -> list[DatasetItemTable]:
+        return (
+            session.query(DatasetItemTable)
+            .filter_by(dataset_id=dataset_id)
+            .order_by(DatasetItemTable.id)
+            .all()
+        )
+
+    def _iter_items(self, dataset_id: int, batch_size: int) -> Iterator[DatasetItem]:
+        for batch in self.iter_item_batches(dataset_id, {}, batch_size):
+            yield from (item for _, _, item in batch)
+
+    def _insert_items(
+        self, session, dataset_id: int, items: list[DatasetItem], modified_at: int
+    ) -> None:
+        self._insert_rows(
+            session,
+            dataset_id,
+            [(item.name, item.model_dump()["nodeItems"]) for item in items],
+            modified_at,
+        )
+
+    def _insert_rows(
+        self,
+        session,
+        dataset_id: int,
+        rows: list[tuple[str, list[dict]]],
+        modified_at: int,
+    ) -> None:
+        if not rows:
+            return
+        session.execute(
+            DatasetItemTable.__table__.insert(),
+            [
+                {
+                    "dataset_id": dataset_id,
+                    "name": name,
+                    "node_items": node_items,
+                    "modified_at": modified_at,
+                }
+                for name, node_items in rows
+            ],
+        )
+
+    def _discard_import(self, session, import_id: str) -> None:
+        session.execute(
+            ImportItemTable.__table__.delete().where(
+                ImportItemTable.import_id == import_id
+            )
+        )
+        session.execute(
+            ImportTable.__table__.delete().where(ImportTable.id == import_id)
+        )
+
+    def _delete_items(self, session, dataset_id: int) -> None:
+        session.query(DatasetItemTable).filter_by(dataset_id=dataset_id).delete()
+
+
+class AsyncDatabase:
+    """
+    Awaitable facade over `Database`. Every method of the wrapped database is
+    available as a coroutine that runs on a bounded thread pool, so a slow SQLite
+    call never blocks the event loop and at most `max_workers` calls hit the
+    database at once.
+    """
+
+    def __init__(self, database: Database, max_workers: int) -> None:
+        self.database = database
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="database"
+        )
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs any blocking callable on the database thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def shutdown(self) -> None:
+        """
+        Waits for queued database calls to finish, then closes pooled connections.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        self.database.engine.dispose()
+        self.database.jobs_engine.dispose()
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = getattr(self.database, name)
+
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return call
@@ -0,0 +1,248 @@
+import array
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import nullcontext
+
+from .artifacts import ArtifactStore, ExportKey
+from .database import Database
+from .responses import dumps
+from .schemas import DatasetItem, NodeItem, Role
+
+EXPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+# Prefix, separator between non-empty item outputs and suffix of an export file.
+RECORD_LAYOUTS = {
+    "json": (b"[", b",", b"]"),
+    "jsonl": (b"", b"", b""),
+}
+CHUNK_SIZE = 1 << 16
+# Dataset items handed to a job process at a time.
+EXPORT_BATCH_SIZE = 256
+
+
+def iter_conversation_paths(node_items: list[NodeItem]) -> Iterator[list[int]]:
+    """
+    Walks the conversation graph from the system node along the `to` links and
+    yields the node indices from the first turn to every ASSISTANT node, in
+    depth-first order. The walk uses an explicit stack and a single path list
+    shared by all branches, so the yielded list is only valid until the next
+    iteration and must be turned into a record right away.
+    Raises ValueError for malformed graphs, including cycles.
+    """
+    if not node_items:
+        raise ValueError("Empty nodeItems")
+    if node_items[0].role != Role.SYSTEM:
+        raise ValueError("First item must be system")
+
+    path: list[int] = []
+    on_path: set[int] = set()
+    stack = [(idx, 0) for idx in reversed(node_items[0].to)]
+    while stack:
+        idx, depth = stack.pop()
+        for removed in path[depth:]:
+            on_path.discard(removed)
+        del path[depth:]
+        if not 0 <= idx < len(node_items):
+            raise ValueError(f"Invalid index {idx}")
+        if idx in on_path:
+            raise ValueError(f"Cycle detected at node index {idx}")
+        current_node = node_items[idx]
+        path.append(idx)
+        on_path.add(idx)
+        if current_node.role == Role.SYSTEM:
+            raise ValueError(f"Unexpected SYSTEM node at index {idx}")
+        if current_node.role == Role.USER:
+            if not current_node.to:
+                raise ValueError(f"USER node at index {idx} has empty 'to' links")
+            for next_index in current_node.to:
+                if not 0 <= next_index < len(node_items):
+                    raise ValueError(
+                        f"Invalid node graph: next_index {next_index} "
+                        f"exceeds node_items length {len(node_items)}"
+                    )
+                next_node = node_items[next_index]
+                if next_node.role != Role.ASSISTANT:
+                    raise ValueError(
+                        f"Expected ASSISTANT node after USER at index {idx}, "
+                        f"but got {next_node.role} at index {next_index}"
+                    )
+        elif current_node.role == Role.ASSISTANT:
+            yield path
+        else:
+            continue
+        stack.extend(
+            (next_index, depth + 1) for next_index in reversed(current_node.to)
+        )
+
+
+def iter_json_chunks(records: Iterable[dict], format: str) -> Iterator[bytes]:
+    """
+    Encodes records one at a time as compact JSON or JSONL and yields them in
+    chunks of roughly `CHUNK_SIZE` bytes, so nothing but the current chunk is
+    ever held in memory. The first record is flushed on its own so the client
+    gets bytes as soon as the first conversation path is ready.
+    """
+    buffer = bytearray()
+    if format == "json":
+        buffer += b"["
+        separator = b","
+    else:
+        separator = b""
+    for count, record in enumerate(records):
+        if count:
+            buffer += separator
+        buffer += dumps(record)
+        if format == "jsonl":
+            buffer += b"\n"
+        if count == 0 or len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if format == "json":
+        buffer += b"]"
+    if buffer:
+        yield bytes(buffer)
+
+
+def encode_records(
+    build_record: Callable[[list[NodeItem], list[int]], dict],
+    format: str,
+    items: list[DatasetItem],
+) -> list[bytes]:
+    """
+    Builds the record of every conversation path of each item and returns the
+    records of each item encoded as compact JSON separated by commas, or as
+    JSONL. Runs in job processes, so every argument must be picklable.
+    """
+    encoded = []
+    for item in items:
+        parts = [
+            dumps(build_record(item.nodeItems, path))
+            for path in iter_conversation_paths(item.nodeItems)
+        ]
+        if format == "jsonl":
+            encoded.append(b"".join(part + b"\n" for part in parts))
+        else:
+            encoded.append(b",".join(parts))
+    return encoded
+
+
+def export_job(
+    context,
+    db: Database,
+    artifacts: ArtifactStore,
+    key: ExportKey,
+    filename: str,
+    media_type: str,
+    join_batches: Callable[[Iterator[bytes]], Iterable[bytes]],
+    encode_batch: Callable[[list[DatasetItem]], bytes],
+    url: str,
+) -> dict:
+    """
+    Job body of a plugin export. Encodes the dataset's items in batches with
+    `encode_batch` on the job process pool, turns the encoded batches into the
+    file's chunks with `join_batches` and writes them to the cached artifact
+    for `key`, which is downloaded from `url`. Progress counts dataset items.
+    """
+    sizes: deque[int] = deque()
+
+    def batches() -> Iterator[list[DatasetItem]]:
+        # Read by id, so the export is of the dataset `key` was taken from
+        # even if another one has been given its name meanwhile.
+        for batch in db.iter_item_batches(key.dataset_id, {}, EXPORT_BATCH_SIZE):
+            sizes.append(len(batch))
+            yield [item for _, _, item in batch]
+
+    def encoded() -> Iterator[bytes]:
+        done = 0
+        for chunk in context.map(encode_batch, batches()):
+            done += sizes.popleft()
+            context.progress(done)
+            yield chunk
+
+    artifacts.write(
+        key.artifact_id(), filename, media_type, join_batches(encoded()), key
+    )
+    artifacts.supersede(key)
+    return {"url": url, "filename": filename}
+
+
+def export_records_job(
+    context,
+    db: Database,
+    artifacts: ArtifactStore,
+    key: ExportKey,
+    filename: str,
+    media_type: str,
+    layout: tuple[bytes, bytes, bytes],
+    encode_items: Callable[[list[DatasetItem]], list[bytes]],
+    url: str,
+) -> dict:
+    """
+    Job body of an export that encodes every item on its own, such as alpaca or
+    chatml. Like `export_job`, except that the file is laid out by `layout`
+    from the outputs of `encode_items` and the artifact is indexed by item.
+    Items unchanged since the previous export of the same kind are copied from
+    that export's file, so only new and edited items are loaded and encoded.
+    """
+    previous = artifacts.previous(key)
+    previous_index = artifacts.read_index(previous) if previous else None
+    locations = {}
+    if previous_index is not None:
+        for i in range(0, len(previous_index), 4):
+            item_id, version, offset, length = previous_index[i : i + 4]
+            locations[item_id] = (version, offset, length)
+    known = {item_id: version for item_id, (version, _, _) in locations.items()}
+    batches = db.iter_item_batches(key.dataset_id, known, EXPORT_BATCH_SIZE)
+    pending: deque[list] = deque()
+    # (item id, version, offset, length) of each item's output in the file.
+    index = array.array("q")
+    reused = 0
+
+    def changed() -> Iterator[list[DatasetItem]]:
+        for batch in batches:
+            pending.append(batch)
+            yield [item for _, _, item in batch if item is not None]
+
+    def chunks(source) -> Iterator[bytes]:
+        nonlocal reused
+        prefix, separator, suffix = layout
+        offset = len(prefix)
+        empty = True
+        done = 0
+        yield prefix
+        for encoded in context.map(encode_items, changed()):
+            batch = pending.popleft()
+            outputs = iter(encoded)
+            buffer = bytearray()
+            for item_id, version, item in batch:
+                if item is None:
+                    _, start, length = locations[item_id]
+                    source.seek(start)
+                    output = source.read(length)
+                    reused += 1
+                else:
+                    output = next(outputs)
+                if output:
+                    if not empty:
+                        buffer += separator
+                    empty = False
+                index.extend((item_id, version, offset + len(buffer), len(output)))
+                buffer += output
+            offset += len(buffer)
+            done += len(batch)
+            context.progress(done)
+            yield bytes(buffer)
+        yield suffix
+
+    # Opened up front, so the previous file stays readable even if it is
+    # evicted meanwhile.
+    with (
+        open(previous.path, "rb") if previous_index is not None else nullcontext()
+    ) as source:
+        artifacts.write(
+            key.artifact_id(), filename, media_type, chunks(source), key, index
+        )
+    artifacts.supersede(key)
+    return {"url": url, "filename": filename, "reused_items": reused}
@@ -0,0 +1,48 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+
+class FilePool:
+    """
+    The thread pool blocking file operations of every request share, so a
+    request needs no thread of its own and at most `max_workers` operations
+    wait on the disk at once.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="file"
+        )
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def worker(self) -> "FileWorker":
+        return FileWorker(self)
+
+    async def shutdown(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+
+
+class FileWorker:
+    """
+    Runs the blocking file operations of one request on the shared pool, one
+    at a time and in the order they are submitted, so the event loop never
+    waits on the disk. An operation already running when its await is
+    cancelled still finishes before the next one starts, such as the cleanup
+    of a failed write.
+    """
+
+    def __init__(self, pool: FilePool) -> None:
+        self.pool = pool
+        self.last: Future | None = None
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self.last is not None and not self.last.done():
+            await asyncio.wait([asyncio.wrap_future(self.last)])
+        self.last = self.pool.executor.submit(func, *args)
+        return await asyncio.wrap_future(self.last)
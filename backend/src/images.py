@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import os
+import pathlib
+import tempfile
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+
+from fastapi import Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from .files import FilePool, FileWorker
+
+ALLOWED_TYPES = {"image/jpeg", "image/png", "image/gif"}
+# Received bytes are buffered up to this size before a write to the staging file.
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+class ImageWriter:
+    """
+    One image being streamed into an `ImageStore`. Chunks are hashed as they
+    are written to a staging file, created by the first write, which `finish`
+    completes and `publish` then moves under its digest.
+    """
+
+    def __init__(self, store: "ImageStore") -> None:
+        self.store = store
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.temp_path: str | None = None
+        self.file = None
+
+    def write(self, chunk: bytes) -> None:
+        if self.file is None:
+            fd, self.temp_path = tempfile.mkstemp(dir=self.store.root, suffix=".part")
+            self.file = os.fdopen(fd, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+
+    def finish(self) -> tuple[str, int]:
+        """
+        Completes the staging file and returns the content digest and size,
+        leaving `publish` nothing to do but a rename.
+        """
+        try:
+            if self.file is None:
+                self.write(b"")
+            self.file.close()
+            sha256 = self.digest.hexdigest()
+            self.store.path_for(sha256).parent.mkdir(exist_ok=True)
+        except BaseException:
+            self.abort()
+            raise
+        return sha256, self.size
+
+    def publish(self) -> None:
+        """
+        Moves the finished file under its digest, where it appears complete.
+        """
+        path = self.store.path_for(self.digest.hexdigest())
+        if path.exists():
+            os.unlink(self.temp_path)
+        else:
+            os.replace(self.temp_path, path)
+
+    def commit(self) -> tuple[str, int]:
+        stored = self.finish()
+        try:
+            self.publish()
+        except BaseException:
+            self.abort()
+            raise
+        return stored
+
+    def abort(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            pathlib.Path(self.temp_path).unlink(missing_ok=True)
+
+
+class ImageStore:
+    """
+    Image files addressed by the SHA-256 of their content, laid out as
+    `<root>/<first two hex digits>/<digest>`. Identical uploads share one file.
+    """
+
+    def __init__(self, root: str | pathlib.Path) -> None:
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, sha256: str) -> pathlib.Path:
+        return self.root / sha256[:2] / sha256
+
+    def open(self) -> ImageWriter:
+        return ImageWriter(self)
+
+    def write(self, chunks: Iterable[bytes]) -> tuple[str, int]:
+        """
+        Streams chunks into the store and returns the content digest and size.
+        """
+        writer = self.open()
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def delete(self, sha256: str) -> None:
+        self.path_for(sha256).unlink(missing_ok=True)
+
+
+@dataclass
+class StoredImage:
+    name: str
+    file_type: str
+    sha256: str
+    size: int
+
+
+class ImageRejected(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ImageReceiver:
+    """
+    Multipart parser callbacks that collect the file parts of form field
+    `field` for the store as they arrive, failing a part as soon as it has a
+    type other than an image or grows past `max_size`. Received bytes wait in
+    `ready` until the caller writes them.
+    """
+
+    def __init__(
+        self, store: ImageStore, field: str, max_size: int, max_files: int
+    ) -> None:
+        self.store = store
+        self.field = field
+        self.max_size = max_size
+        self.max_files = max_files
+        self.images: list[tuple[str, str, ImageWriter]] = []
+        self.headers: dict[bytes, bytes] = {}
+        self.header_name = b""
+        self.header_value = b""
+        self.writer: ImageWriter | None = None
+        self.part_size = 0
+        self.buffer = bytearray()
+        self.ready: list[tuple[ImageWriter, bytes]] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+        self.writer = None
+        self.part_size = 0
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[self.header_name.lower()] = self.header_value
+        self.header_name = b""
+        self.header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field or b"filename" not in options:
+            return
+        file_type = self.headers.get(b"content-type", b"").decode("latin-1").strip()
+        if file_type not in ALLOWED_TYPES:
+            raise ImageRejected(400, "File type not allowed")
+        if len(self.images) >= self.max_files:
+            raise ImageRejected(400, f"At most {self.max_files} files per upload")
+        filename = options[b"filename"].decode("utf-8", "replace")
+        self.writer = self.store.open()
+        self.images.append((filename, file_type, self.writer))
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.writer is None:
+            return
+        self.part_size += end - start
+        if self.part_size > self.max_size:
+            raise ImageRejected(413, "File size too large")
+        self.buffer += data[start:end]
+        if len(self.buffer) >= WRITE_BUFFER_SIZE:
+            self.on_part_end()
+
+    def on_part_end(self) -> None:
+        if self.writer is not None and self.buffer:
+            self.ready.append((self.writer, bytes(self.buffer)))
+            self.buffer.clear()
+
+    async def flush(self, worker: FileWorker) -> None:
+        """
+        Writes the bytes received so far to their staging files on `worker`.
+        """
+        ready, self.ready = self.ready, []
+        for writer, data in ready:
+            await worker.run(writer.write, data)
+
+
+async def receive_images(
+    request: Request,
+    files: FilePool,
+    store: ImageStore,
+    field: str,
+    max_size: int,
+    max_files: int,
+    register: Callable[[list[StoredImage]], Awaitable[list[int]]],
+) -> list[int]:
+    """
+    Streams the image files of a multipart form field into the store, has
+    `register` record them once the whole body has arrived and returns the ids
+    it gave them. Raises `ImageRejected` as soon as a file is not acceptable,
+    without reading the rest of the body. The files only appear in the store
+    once `register` succeeded, so a failure at any point stores nothing.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ImageRejected(400, "Expected a multipart/form-data body")
+    receiver = ImageReceiver(store, field, max_size, max_files)
+    worker = files.worker()
+    try:
+        parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await receiver.flush(worker)
+        parser.finalize()
+        await receiver.flush(worker)
+        if not receiver.images:
+            raise ImageRejected(400, "No file uploaded")
+        # Every file is finished before any is given up on, so none is still
+        # being written when the staging files are removed.
+        finished = await asyncio.gather(
+            *(files.run(writer.finish) for _, _, writer in receiver.images),
+            return_exceptions=True,
+        )
+        for result in finished:
+            if isinstance(result, BaseException):
+                raise result
+        image_ids = await register(
+            [
+                StoredImage(name, file_type, sha256, size)
+                for (name, file_type, _), (sha256, size) in zip(
+                    receiver.images, finished
+                )
+            ]
+        )
+    except BaseException as e:
+        for _, _, writer in receiver.images:
+            await worker.run(writer.abort)
+        if isinstance(e, MultipartParseError):
+            raise ImageRejected(400, "Malformed multipart body") from e
+        raise
+    await asyncio.gather(
+        *(files.run(writer.publish) for _, _, writer in receiver.images)
+    )
+    return image_ids
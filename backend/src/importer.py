@@ -0,0 +1,364 @@
+import codecs
+import json
+import os
+import re
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any, BinaryIO, TypeVar
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from .database import Database
+from .schemas import DatasetItem
+
+T = TypeVar("T")
+
+CHUNK_SIZE = 1 << 16
+# A JSON array record that does not close within this many characters is rejected
+# instead of buffering the rest of the upload.
+MAX_RECORD_SIZE = 1 << 26
+
+
+class RecordError(ValueError):
+    def __init__(
+        self, line: int, message: str, error: ValidationError | None = None
+    ) -> None:
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+        self.message = message
+        self.error = error
+
+    def __reduce__(self):
+        # Raised in job processes; the validation error itself is not picklable.
+        return RecordError, (self.line, self.message)
+
+
+@dataclass
+class ImportResult:
+    count: int
+    elapsed: float
+
+    @property
+    def items_per_second(self) -> float:
+        return self.count / self.elapsed if self.elapsed > 0 else float(self.count)
+
+
+def detect_format(file: BinaryIO, record_start: str) -> str:
+    """
+    Looks at the first two significant characters of the file and returns
+    `"json"` for a JSON array of records or `"jsonl"` for one record per line.
+    `record_start` is the character a record begins with, `{` or `[`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    head = ""
+    while len(head) < 2:
+        chunk = file.read(CHUNK_SIZE)
+        head += decoder.decode(chunk, final=not chunk).lstrip()
+        if len(head) > 1:
+            head = head[0] + head[1:].lstrip()
+        if not chunk:
+            break
+    file.seek(0)
+    if head[:1] == "[" and head[1:2] in (record_start, "]"):
+        return "json"
+    if head[:1] == record_start:
+        return "jsonl"
+    raise RecordError(1, "Content is neither valid JSON nor valid JSONL format")
+
+
+def iter_jsonl_values(file: BinaryIO) -> Iterator[tuple[int, Any]]:
+    for line_number, raw_line in enumerate(file, start=1):
+        try:
+            text = raw_line.decode("utf-8-sig" if line_number == 1 else "utf-8")
+        except UnicodeDecodeError as e:
+            raise RecordError(line_number, str(e))
+        if not text.strip():
+            continue
+        try:
+            yield line_number, json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RecordError(line_number, e.msg)
+
+
+class ValueScanner:
+    """
+    Finds where a JSON value ends in text arriving in pieces, tracking nesting
+    depth and string state from one piece to the next, so each character is
+    scanned once however many pieces the value spans. Scalars other than
+    strings end before the next comma, closing bracket or whitespace.
+    """
+
+    OUTSIDE = re.compile(r'["{}\[\]]')
+    INSIDE = re.compile(r'["\\]')
+    SCALAR_END = re.compile(r"[\s,\]]")
+
+    def __init__(self, first: str) -> None:
+        self.scalar = first not in '{["'
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def scan(self, text: str, index: int) -> int | None:
+        """
+        Scans `text` from `index` on and returns the index just past the end
+        of the value, or None if the value goes on in the next piece.
+        """
+        if self.scalar:
+            match = self.SCALAR_END.search(text, index)
+            return match.start() if match else None
+        if self.escaped:
+            if index >= len(text):
+                return None
+            index += 1
+            self.escaped = False
+        while True:
+            if self.in_string:
+                match = self.INSIDE.search(text, index)
+                if not match:
+                    return None
+                index = match.end()
+                if match.group() == "\\":
+                    if index >= len(text):
+                        self.escaped = True
+                        return None
+                    index += 1
+                    continue
+                self.in_string = False
+                if self.depth == 0:
+                    return index
+                continue
+            match = self.OUTSIDE.search(text, index)
+            if not match:
+                return None
+            index = match.end()
+            char = match.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth <= 0:
+                    return index
+
+
+def iter_json_array_values(file: BinaryIO) -> Iterator[tuple[int, Any]]:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    pos = 0
+    line = 1
+    eof = False
+
+    def read() -> str:
+        nonlocal eof
+        if eof:
+            return ""
+        chunk = file.read(CHUNK_SIZE)
+        eof = not chunk
+        try:
+            return text_decoder.decode(chunk, final=eof)
+        except UnicodeDecodeError as e:
+            raise RecordError(line, str(e))
+
+    def fill() -> bool:
+        nonlocal buffer, pos
+        if eof:
+            return False
+        buffer = buffer[pos:] + read()
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        nonlocal pos, line
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                line += buffer[pos] == "\n"
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                return ""
+
+    def next_value() -> Any:
+        """
+        Decodes the value starting at `pos` and moves past it. A value within
+        the buffer is decoded in place; one running past it is scanned piece
+        by piece as chunks arrive and decoded once, when it is complete.
+        """
+        nonlocal buffer, pos, line
+        if pos == len(buffer):
+            # Only at the end of the file, as `next_char` found no value.
+            raise RecordError(line, "Expecting value")
+        if buffer[pos] in '{["':
+            # Objects, arrays and strings end on a closing character, so one
+            # that decodes within the buffer is complete, unlike a number.
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                pass
+            else:
+                line += buffer.count("\n", pos, end)
+                pos = end
+                return value
+        scanner = ValueScanner(buffer[pos])
+        pieces = []
+        size = 0
+        end = scanner.scan(buffer, pos)
+        while end is None:
+            pieces.append(buffer[pos:])
+            size += len(buffer) - pos
+            if size > MAX_RECORD_SIZE:
+                raise RecordError(line, "Record is too large")
+            if eof:
+                buffer, pos, end = "", 0, 0
+                break
+            buffer, pos = read(), 0
+            end = scanner.scan(buffer, 0)
+        pieces.append(buffer[pos:end])
+        text = "".join(pieces)
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RecordError(line, e.msg)
+        line += text.count("\n")
+        pos = end
+        return value
+
+    if next_char() != "[":
+        raise RecordError(line, "Expected '['")
+    pos += 1
+    if next_char() == "]":
+        pos += 1
+    else:
+        while True:
+            next_char()
+            record_line = line
+            value = next_value()
+            yield record_line, value
+            char = next_char()
+            pos += 1
+            if char == "]":
+                break
+            if char != ",":
+                raise RecordError(line, "Expected ',' or ']'")
+    if next_char():
+        raise RecordError(line, "Extra data after the closing ']'")
+
+
+def iter_values(file: BinaryIO, record_start: str = "{") -> Iterator[tuple[int, Any]]:
+    """
+    Streams decoded but unvalidated records, with the line each starts on, out
+    of a JSON array or JSONL upload.
+    """
+    if detect_format(file, record_start) == "json":
+        return iter_json_array_values(file)
+    return iter_jsonl_values(file)
+
+
+def iter_records(
+    file: BinaryIO, validate: Callable[[Any], T], record_start: str = "{"
+) -> Iterator[T]:
+    """
+    Streams validated records out of a JSON array or JSONL upload without
+    holding the whole file in memory.
+    Raises `RecordError` with the line number of the first bad record.
+    """
+    for line, value in iter_values(file, record_start):
+        try:
+            yield validate(value)
+        except ValidationError as e:
+            raise RecordError(line, "Invalid record", e)
+
+
+def format_validation_error(e: ValidationError) -> list[str]:
+    error_messages = []
+    for error in e.errors():
+        field_path = ".".join(str(loc) for loc in error["loc"])
+        message = f"Field '{field_path}': {error['msg']}"
+        error_messages.append(message)
+    return error_messages
+
+
+def convert_records(
+    validate: Callable[[Any], T],
+    convert: Callable[[str, T], DatasetItem],
+    batch: tuple[str, int, list[tuple[int, Any]]],
+) -> list[tuple[str, list[dict]]]:
+    """
+    Validates and converts a batch of `(line, value)` records into
+    `(name, nodeItems)` rows, naming them `<prefix><index>` from `start` on.
+    Runs in job processes, so every argument must be picklable.
+    Raises `RecordError` with the line number of the first bad record.
+    """
+    prefix, start, values = batch
+    rows = []
+    for index, (line, value) in enumerate(values, start=start):
+        try:
+            item = convert(f"{prefix}{index}", validate(value))
+        except ValidationError as e:
+            raise RecordError(line, "; ".join(format_validation_error(e)))
+        except ValueError as e:
+            raise RecordError(line, str(e))
+        rows.append((item.name, item.model_dump()["nodeItems"]))
+    return rows
+
+
+def import_job(
+    context,
+    db: Database,
+    import_id: str,
+    prefix: str,
+    path: str,
+    convert_batch: Callable[[tuple[str, int, list[tuple[int, Any]]]], list],
+    batch_size: int,
+    record_start: str = "{",
+) -> dict:
+    """
+    Job body of a plugin import begun with `Database.begin_import`. Reads the
+    saved upload in batches of `batch_size` records, converts them with
+    `convert_batch` on the job process pool and stages each batch in a short
+    transaction, so editors can keep saving meanwhile. The items appear in the
+    dataset all at once when the import is published at the end; an import
+    that fails or is cancelled is discarded. Progress counts bytes of the
+    upload read so far.
+    """
+    start = time.perf_counter()
+    count = 0
+    try:
+        with open(path, "rb") as file:
+            total = os.fstat(file.fileno()).st_size
+
+            def batches():
+                batch = []
+                index = 0
+                for value in iter_values(file, record_start):
+                    batch.append(value)
+                    if len(batch) >= batch_size:
+                        yield prefix, index, batch
+                        index += len(batch)
+                        batch = []
+                if batch:
+                    yield prefix, index, batch
+
+            for rows in context.map(convert_batch, batches()):
+                db.stage_import_rows(import_id, rows)
+                count += len(rows)
+                context.progress(file.tell(), count, total)
+        context.progress(total, count, total)
+        try:
+            db.publish_import(import_id)
+        except KeyError:
+            raise ValueError("Dataset not found")
+        except IntegrityError:
+            raise ValueError("An imported item name was taken during the import")
+    except BaseException:
+        db.discard_import(import_id)
+        raise
+    elapsed = time.perf_counter() - start
+    return {
+        "count": count,
+        "items_per_second": ImportResult(count=count, elapsed=elapsed).items_per_second,
+    }
@@ -0,0 +1,223 @@
+import asyncio
+import multiprocessing
+import pathlib
+import shutil
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, TypeVar
+
+from .database import AsyncDatabase, current_millis
+from .schemas import Job
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Minimum seconds between two progress writes of one job.
+PROGRESS_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 10
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """
+    Handed to a running job to report progress and to run CPU-bound steps on
+    the engine's process pool. Both raise `JobCancelled` once cancellation has
+    been requested, so a job stops at its next batch.
+    """
+
+    def __init__(self, engine: "JobEngine", job_id: str) -> None:
+        self.engine = engine
+        self.job_id = job_id
+        self.done = 0
+        self.processed = 0
+        self.total: int | None = None
+        self.last_update = 0.0
+
+    def progress(
+        self, done: int, processed: int | None = None, total: int | None = None
+    ) -> None:
+        self.done = done
+        self.processed = done if processed is None else processed
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self.last_update >= PROGRESS_INTERVAL:
+            self.last_update = now
+            values = {"done": self.done, "processed": self.processed}
+            if self.total is not None:
+                values["total"] = self.total
+            if self.engine.database.update_job(self.job_id, **values):
+                self.engine.cancelled.add(self.job_id)
+        self.check()
+
+    def check(self) -> None:
+        if self.job_id in self.engine.cancelled:
+            raise JobCancelled()
+
+    def map(self, func: Callable[[T], R], values: Iterable[T]) -> Iterator[R]:
+        """
+        Runs `func` over `values` on the process pool and yields results in
+        order, keeping only a few calls in flight so neither the input nor the
+        output is buffered. `func` and its argument must be picklable.
+        """
+        processes = self.engine.processes
+        if processes is None:
+            for value in values:
+                self.check()
+                yield func(value)
+            return
+        pending: deque[Future] = deque()
+        try:
+            for value in values:
+                self.check()
+                pending.append(processes.submit(func, value))
+                if len(pending) >= self.engine.max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                self.check()
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class JobEngine:
+    """
+    Runs long imports and exports outside of the request that started them.
+    Job state lives in the `jobs` table, so any worker can report progress or
+    flag a job for cancellation, while the job itself runs on the worker that
+    accepted it: on a thread of its own, with CPU-bound conversion farmed out to
+    a process pool. Uploads a job needs are copied under `root` first, because
+    FastAPI closes them when the request ends.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        root: str | pathlib.Path,
+        max_jobs: int,
+        max_processes: int,
+    ) -> None:
+        self.db = db
+        self.database = db.database
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_jobs, thread_name_prefix="job"
+        )
+        self.max_processes = max_processes
+        self.max_in_flight = 2 * max_processes
+        self.processes: ProcessPoolExecutor | None = None
+        self.active: set[str] = set()
+        self.cancelled: set[str] = set()
+        self.heartbeat_task: asyncio.Task | None = None
+
+    async def save_upload(self, file: BinaryIO) -> pathlib.Path:
+        path = self.root / f"{uuid.uuid4()}.upload"
+
+        def copy() -> None:
+            with open(path, "wb") as f:
+                shutil.copyfileobj(file, f, 1 << 20)
+
+        await self.db.run(copy)
+        return path
+
+    async def submit(
+        self,
+        kind: str,
+        unit: str,
+        total: int | None,
+        func: Callable[..., dict],
+        *args: Any,
+        cleanup: Callable[[], None] | None = None,
+    ) -> str:
+        """
+        Queues `func(context, *args)` as a job and returns its id right away. The
+        dict `func` returns becomes the job result. `cleanup` runs when the job
+        ends, however it ends.
+        """
+        job_id = str(uuid.uuid4())
+        await self.db.create_job(job_id, kind, unit, total)
+        self.active.add(job_id)
+        self.executor.submit(self.run, job_id, func, args, cleanup)
+        return job_id
+
+    def run(self, job_id: str, func, args, cleanup) -> None:
+        context = JobContext(self, job_id)
+        try:
+            if self.database.update_job(
+                job_id, status="running", started_at=current_millis()
+            ):
+                raise JobCancelled()
+            result = func(context, *args)
+            self.database.update_job(
+                job_id,
+                status="succeeded",
+                done=context.done,
+                processed=context.processed,
+                result=result,
+                finished_at=current_millis(),
+            )
+        except JobCancelled:
+            self.database.update_job(
+                job_id, status="cancelled", finished_at=current_millis()
+            )
+        # Whatever a job body raises fails that job, never the worker.
+        except Exception as e:  # noqa: BLE001
+            self.database.update_job(
+                job_id, status="failed", error=str(e), finished_at=current_millis()
+            )
+        finally:
+            self.active.discard(job_id)
+            self.cancelled.discard(job_id)
+            if cleanup:
+                cleanup()
+
+    async def cancel(self, job_id: str) -> Job | None:
+        job = await self.db.cancel_job(job_id)
+        if job_id in self.active:
+            self.cancelled.add(job_id)
+        return job
+
+    def describe(self, job: Job) -> dict:
+        """
+        Returns the job with its throughput in `processed` units per second and,
+        while it runs, an ETA extrapolated from `done` over `total`.
+        """
+        end = job.finished_at or current_millis()
+        elapsed = (end - job.started_at) / 1000 if job.started_at else 0.0
+        description = job.model_dump()
+        description["elapsed_seconds"] = elapsed
+        description["per_second"] = job.processed / elapsed if elapsed > 0 else None
+        description["eta_seconds"] = None
+        if job.status == "running" and job.total and job.done:
+            description["eta_seconds"] = elapsed * (job.total - job.done) / job.done
+        return description
+
+    async def on_startup(self):
+        if self.max_processes > 0:
+            # Spawned rather than forked, since the worker already runs threads.
+            self.processes = ProcessPoolExecutor(
+                self.max_processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        self.heartbeat_task = asyncio.create_task(self.run_heartbeat())
+
+    async def on_shutdown(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        self.cancelled.update(self.active)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        if self.processes:
+            self.processes.shutdown(cancel_futures=True)
+
+    async def run_heartbeat(self):
+        while True:
+            await self.db.touch_jobs(list(self.active))
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
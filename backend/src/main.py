@@ -1,12 +1,60 @@
-from src.api import db, config
+import argparse
+
+from src.api import config, database
 
 if __name__ == "__main__":
     import uvicorn
 
-    db.init_db()
+    parser = argparse.ArgumentParser(description="Run the LLM-Tagger backend.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    parser.add_argument(
+        "--reload",
+        action=argparse.BooleanOptionalAction,
+        help="Restart on code changes, for development. Implies a single worker.",
+    )
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"])
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"])
+    parser.add_argument("--backlog", type=int, help="Listen socket backlog.")
+    parser.add_argument(
+        "--keep-alive", type=int, help="Seconds to keep idle connections open."
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        help="Seconds to let in-flight requests finish on shutdown.",
+    )
+    args = parser.parse_args()
+
+    server = config.server.model_copy(
+        update={
+            key: value
+            for key, value in {
+                "workers": args.workers,
+                "reload": args.reload,
+                "loop": args.loop,
+                "http": args.http,
+                "backlog": args.backlog,
+                "timeout_keep_alive": args.keep_alive,
+                "timeout_graceful_shutdown": args.graceful_timeout,
+            }.items()
+            if value is not None
+        }
+    )
+
+    # Migrations run once here, before any worker process imports the app.
+    database.init_db()
+    database.engine.dispose()
+    database.jobs_engine.dispose()
     uvicorn.run(
         "src.api:app",
         host=config.listen.split(":")[0],
         port=int(config.listen.split(":")[1]),
-        reload=True,
+        reload=server.reload,
+        workers=1 if server.reload else server.workers,
+        loop=server.loop,
+        http=server.http,
+        backlog=server.backlog,
+        timeout_keep_alive=server.timeout_keep_alive,
+        timeout_graceful_shutdown=server.timeout_graceful_shutdown,
+        limit_concurrency=server.limit_concurrency,
     )
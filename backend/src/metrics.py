@@ -0,0 +1,274 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+# Upper bounds of latency histogram buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label_value(str(value))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    A named family of time series that differ only by their label values.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.lock = threading.Lock()
+
+    def label_values(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]: ...
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...]) -> None:
+        super().__init__(name, help, label_names)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            labels = format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = (*sorted(buckets), float("inf"))
+        # Per label set: non-cumulative bucket counts, then sum and count.
+        self.series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self.label_values(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = ([0] * len(self.buckets), [0.0, 0])
+            series[0][index] += 1
+            series[1][0] += value
+            series[1][1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observes the wall time spent in the block, including when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            series = [
+                (key, list(counts), list(totals))
+                for key, (counts, totals) in self.series.items()
+            ]
+        names = (*self.label_names, "le")
+        for key, counts, (total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(names, (*key, format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Metrics:
+    """
+    In-process registry rendered in the Prometheus text exposition format.
+    Every worker process keeps its own registry, so a scrape reports the worker
+    that happened to serve it. Collect callbacks run before each render and are
+    the place to copy state owned by other objects into gauges.
+    """
+
+    def __init__(self, namespace: str = "llm_tagger") -> None:
+        self.namespace = namespace
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str, label_names=()) -> Counter:
+        return self._register(Counter, name, help, tuple(label_names))
+
+    def gauge(self, name: str, help: str, label_names=()) -> Gauge:
+        return self._register(Gauge, name, help, tuple(label_names))
+
+    def histogram(self, name: str, help: str, label_names=(), **kwargs) -> Histogram:
+        return self._register(Histogram, name, help, tuple(label_names), **kwargs)
+
+    def on_collect(self, callback: Callable[[], None]) -> None:
+        self.collectors.append(callback)
+
+    def render(self) -> str:
+        for callback in self.collectors:
+            callback()
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def _register(self, cls, name: str, help: str, label_names, **kwargs):
+        name = f"{self.namespace}_{name}"
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, label_names, **kwargs)
+            elif type(metric) is not cls or metric.label_names != label_names:
+                raise ValueError(f"Metric {name} is already registered differently")
+            return metric
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording HTTP request latency labeled by method, route
+    template and status. Requests that match no route share the `unmatched`
+    label, so probing random paths cannot grow the number of series.
+    """
+
+    def __init__(self, app, metrics: Metrics) -> None:
+        self.app = app
+        self.requests = metrics.histogram(
+            "http_request_duration_seconds",
+            "Time from receiving a request to sending the last response byte.",
+            ("method", "route", "status"),
+        )
+        self.in_progress = metrics.gauge(
+            "http_requests_in_progress", "Requests currently being served."
+        )
+        self.active = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        self.active += 1
+        self.in_progress.set(self.active)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.active -= 1
+            self.in_progress.set(self.active)
+            route = scope.get("route")
+            self.requests.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
+
+class EventLoopMonitor:
+    """
+    Measures event loop lag as how late a periodic sleep wakes up. Anything that
+    blocks the loop, like a synchronous database call or a large `json.dumps`,
+    shows up as lag for every request in flight on that worker.
+    """
+
+    def __init__(self, metrics: Metrics, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.lag = metrics.histogram(
+            "event_loop_lag_seconds", "Delay of event loop wakeups past their deadline."
+        )
+        self.task: asyncio.Task | None = None
+
+    async def on_startup(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def on_shutdown(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag.observe(max(0.0, time.perf_counter() - start - self.interval))
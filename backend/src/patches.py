@@ -0,0 +1,87 @@
+from .schemas import (
+    AddEdge,
+    DeleteNode,
+    InsertNode,
+    ItemOperation,
+    MoveNode,
+    RemoveEdge,
+    ResizeNode,
+    SetNodeRole,
+    SetNodeText,
+)
+
+
+def check_index(node_items: list[dict], index: int) -> None:
+    if not 0 <= index < len(node_items):
+        raise ValueError(f"Node index {index} out of range")
+
+
+def apply_operations(node_items: list[dict], operations: list[ItemOperation]) -> None:
+    """
+    Applies item operations in order to stored `nodeItems` JSON, in place. Only
+    the nodes an operation touches are read or rewritten; inserting or deleting
+    a node also renumbers the edges that point past it.
+    Raises `ValueError` naming the first operation that does not apply.
+    """
+    for number, operation in enumerate(operations):
+        try:
+            apply_operation(node_items, operation)
+        except ValueError as e:
+            raise ValueError(f"Operation {number} ({operation.op}): {e}")
+
+
+def apply_operation(node_items: list[dict], operation: ItemOperation) -> None:
+    if isinstance(operation, MoveNode):
+        check_index(node_items, operation.index)
+        node_items[operation.index]["nodePosition"] = (
+            operation.nodePosition.model_dump()
+        )
+    elif isinstance(operation, ResizeNode):
+        check_index(node_items, operation.index)
+        node_items[operation.index]["nodeSize"] = operation.nodeSize.model_dump()
+    elif isinstance(operation, SetNodeText):
+        check_index(node_items, operation.index)
+        node = node_items[operation.index]
+        if "positive" in operation.model_fields_set:
+            if operation.positive is None:
+                raise ValueError("positive cannot be null")
+            node["positive"] = operation.positive
+        if "negative" in operation.model_fields_set:
+            node["negative"] = operation.negative
+    elif isinstance(operation, SetNodeRole):
+        check_index(node_items, operation.index)
+        node_items[operation.index]["role"] = operation.role.value
+    elif isinstance(operation, AddEdge):
+        check_index(node_items, operation.source)
+        check_index(node_items, operation.target)
+        to = node_items[operation.source]["to"]
+        if operation.target not in to:
+            to.append(operation.target)
+    elif isinstance(operation, RemoveEdge):
+        check_index(node_items, operation.source)
+        to = node_items[operation.source]["to"]
+        if operation.target not in to:
+            raise ValueError(f"No edge from {operation.source} to {operation.target}")
+        to.remove(operation.target)
+    elif isinstance(operation, InsertNode):
+        index = len(node_items) if operation.index is None else operation.index
+        if not 0 <= index <= len(node_items):
+            raise ValueError(f"Node index {index} out of range")
+        node = operation.node.model_dump(mode="json")
+        if any(not 0 <= target < len(node_items) + 1 for target in node["to"]):
+            raise ValueError("Edge target out of range")
+        if index < len(node_items):
+            for other in node_items:
+                other["to"] = [
+                    target + 1 if target >= index else target for target in other["to"]
+                ]
+        node_items.insert(index, node)
+    elif isinstance(operation, DeleteNode):
+        check_index(node_items, operation.index)
+        del node_items[operation.index]
+        for other in node_items:
+            other["to"] = [
+                target - 1 if target > operation.index else target
+                for target in other["to"]
+                if target != operation.index
+            ]
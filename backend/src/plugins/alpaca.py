@@ -1,48 +1,36 @@
-import json
+import functools
 import uuid
-import time
-import asyncio
-
-from fastapi import File, UploadFile, Body
-from fastapi.responses import JSONResponse, Response
-
-from pydantic import BaseModel, ValidationError, model_validator
-from typing import Optional, Any
-
-from ..database import Database
+from collections.abc import Callable, Iterable, Iterator
+from typing import Annotated, Any, ClassVar, Literal
+
+from fastapi import Body, File, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, model_validator
+
+from ..artifacts import ArtifactStore, ExportKey
+from ..database import AsyncDatabase
+from ..exporter import (
+    EXPORT_FORMATS,
+    RECORD_LAYOUTS,
+    encode_records,
+    export_records_job,
+    iter_conversation_paths,
+    iter_json_chunks,
+)
+from ..importer import convert_records, import_job
+from ..jobs import JobEngine
+from ..responses import JSONResponse
 from ..schemas import (
-    PluginInterface,
-    PluginParam,
+    Config,
     DatasetItem,
     NodeItem,
     NodePosition,
     NodeSize,
+    PluginInterface,
+    PluginParam,
     Role,
 )
-
-
-def format_validation_error(e: ValidationError) -> list[str]:
-    error_messages = []
-    for error in e.errors():
-        field_path = ".".join(str(loc) for loc in error["loc"])
-        message = f"Field '{field_path}': {error['msg']}"
-        error_messages.append(message)
-    return error_messages
-
-
-def parse_json_or_jsonl(content):
-    content = content.strip()
-    try:
-        data = json.loads(content)
-        return data
-    except json.JSONDecodeError:
-        pass
-    try:
-        lines = content.splitlines()
-        data = [json.loads(line) for line in lines if line.strip()]
-        return data
-    except json.JSONDecodeError:
-        raise ValueError("Content is neither valid JSON nor valid JSONL format")
+from ..uploads import UploadStore
 
 
 class AlpacaDialogueRound(BaseModel):
@@ -58,30 +46,121 @@ class AlpacaDialogueRound(BaseModel):
 
 class AlpacaInteraction(BaseModel):
     instruction: str
-    input: Optional[str] = None
+    input: str | None = None
     output: str
-    system: Optional[str] = None
-    history: Optional[list[AlpacaDialogueRound]] = None
+    system: str | None = None
+    history: list[AlpacaDialogueRound] | None = None
 
 
 class ExportReq(BaseModel):
     dataset_name: str
-
-
-class ExportCacheItem(BaseModel):
-    content: bytes
-    filename: str
-    expiration_time: float
+    format: Literal["json", "jsonl"] = "json"
+    stream: bool = False
+
+
+def convert_alpaca_item(name: str, item: AlpacaInteraction) -> DatasetItem:
+    system_node = NodeItem(
+        role=Role.SYSTEM,
+        positive=item.system if item.system else "",
+        negative="",
+        nodePosition=NodePosition(x=0, y=0),
+        nodeSize=NodeSize(height=64, width=256),
+        to=[1],
+    )
+    converted_item = DatasetItem(name=name, nodeItems=[system_node])
+    count = 1
+    for node_item in item.history or []:
+        converted_item.nodeItems.append(
+            NodeItem(
+                role=Role.USER,
+                positive=node_item.human_instruction,
+                negative="",
+                nodePosition=NodePosition(x=(count * 2 - 1) * 350, y=0),
+                nodeSize=NodeSize(height=64, width=256),
+                to=[count * 2],
+            )
+        )
+        converted_item.nodeItems.append(
+            NodeItem(
+                role=Role.ASSISTANT,
+                positive=node_item.assistant_response,
+                negative="",
+                nodePosition=NodePosition(x=count * 2 * 350, y=0),
+                nodeSize=NodeSize(height=64, width=256),
+                to=[count * 2 + 1],
+            )
+        )
+        count += 1
+    converted_item.nodeItems.append(
+        NodeItem(
+            role=Role.USER,
+            positive=item.instruction + (f"\n{item.input}" if item.input else ""),
+            negative="",
+            nodePosition=NodePosition(x=(count * 2 - 1) * 350, y=0),
+            nodeSize=NodeSize(height=64, width=256),
+            to=[count * 2],
+        )
+    )
+    converted_item.nodeItems.append(
+        NodeItem(
+            role=Role.ASSISTANT,
+            positive=item.output,
+            negative="",
+            nodePosition=NodePosition(x=count * 2 * 350, y=0),
+            nodeSize=NodeSize(height=64, width=256),
+            to=[],
+        )
+    )
+    return converted_item
+
+
+def build_alpaca_record(node_items: list[NodeItem], path: list[int]) -> dict:
+    instruction = ""
+    has_input = False
+    history = []
+    for idx in path[:-1]:
+        node = node_items[idx]
+        if node.role == Role.USER:
+            instruction = node.positive
+            has_input = True
+        elif node.role == Role.ASSISTANT:
+            history.append([instruction, node.positive])
+    record = {"instruction": instruction}
+    if has_input:
+        record["input"] = ""
+    record["output"] = node_items[path[-1]].positive
+    record["system"] = node_items[0].positive
+    record["history"] = history
+    return record
+
+
+def iter_alpaca_records(items: Iterable[DatasetItem]) -> Iterator[dict]:
+    for item in items:
+        for path in iter_conversation_paths(item.nodeItems):
+            yield build_alpaca_record(item.nodeItems, path)
 
 
 class Plugin:
-    db: Database
-    on_events = {}
-    export_cache = {}
-    file_expiration_time = 60
-
-    def __init__(self, db: Database) -> None:
+    db: AsyncDatabase
+    config: Config
+    artifacts: ArtifactStore
+    jobs: JobEngine
+    uploads: UploadStore
+    on_events: ClassVar[dict[str, list[Callable]]] = {}
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        config: Config,
+        artifacts: ArtifactStore,
+        jobs: JobEngine,
+        uploads: UploadStore,
+    ) -> None:
         self.db = db
+        self.config = config
+        self.artifacts = artifacts
+        self.jobs = jobs
+        self.uploads = uploads
         self.plugin_interfaces = [
             PluginInterface(
                 display_name="Import alpaca",
@@ -129,267 +208,117 @@ class Plugin:
                 description="Download exported alpaca dataset.",
                 handler=self.download_file,
                 params=[],
+                admission_class=None,
             ),
         ]
-        self.on_events["startup"] = [self.on_startup]
-
-    async def on_startup(self):
-        asyncio.create_task(self.cleanup_export_cache())
-
-    async def cleanup_export_cache(self):
-        while True:
-            current_time = time.time()
-            expired_ids = [
-                download_id
-                for download_id, item in self.export_cache.items()
-                if current_time > item.expiration_time
-            ]
-            for download_id in expired_ids:
-                del self.export_cache[download_id]
-            await asyncio.sleep(self.file_expiration_time)
 
     async def import_alpaca(
         self,
-        dataset_name: str = Body(..., description="Dataset name"),
-        file: UploadFile = File(..., description="File to upload"),
+        dataset_name: Annotated[str, Body(description="Dataset name")],
+        file: Annotated[UploadFile | None, File(description="File to upload")] = None,
+        upload_id: Annotated[
+            str | None, Body(description="Finalized upload to import")
+        ] = None,
     ) -> JSONResponse:
-        try:
-            data = parse_json_or_jsonl(file.file.read().decode())
-        except ValueError:
-            return JSONResponse(
-                status_code=422,
-                content={"message": "Invalid file format need json or jsonl"},
-            )
-
-        alpaca_items = []
-        try:
-            if isinstance(data, list):
-                for item in data:
-                    alpaca_items.append(AlpacaInteraction(**item))
-            else:
+        if upload_id is not None:
+            # Read in place and kept, so a failed import can be retried.
+            path = await self.uploads.path(upload_id)
+            if path is None:
                 return JSONResponse(
-                    status_code=422,
-                    content={"message": "Dataset must be a list of alpaca items"},
+                    {"message": "Upload not found or not finalized"}, status_code=404
                 )
-        except ValidationError as e:
+            cleanup = None
+        elif file is None:
             return JSONResponse(
-                status_code=422,
-                content={
-                    "message": "Invalid alpaca dataset",
-                    "details": format_validation_error(e),
-                },
-            )
-
-        defalut_prefix = "alpaca"
-        count = 0
-        while True:
-            prefix = f"{defalut_prefix}-{count}-"
-            dataset = self.db.get_dataset_by_name(dataset_name)
-            if not any(item.name.startswith(prefix) for item in dataset.items):
-                break
-            count += 1
-
-        for i, item in enumerate(alpaca_items):
-            system_node = NodeItem(
-                role=Role.SYSTEM,
-                positive=item.system if item.system else "",
-                negative="",
-                nodePosition=NodePosition(x=0, y=0),
-                nodeSize=NodeSize(height=64, width=256),
-                to=[1],
-            )
-            converted_item = DatasetItem(name=f"{prefix}{i}", nodeItems=[system_node])
-            count = 1
-            if item.history is None:
-                item.history = []
-            for node_item in item.history:
-                converted_item.nodeItems.append(
-                    NodeItem(
-                        role=Role.USER,
-                        positive=node_item.human_instruction,
-                        negative="",
-                        nodePosition=NodePosition(x=(count * 2 - 1) * 350, y=0),
-                        nodeSize=NodeSize(height=64, width=256),
-                        to=[count * 2],
-                    )
-                )
-                converted_item.nodeItems.append(
-                    NodeItem(
-                        role=Role.ASSISTANT,
-                        positive=node_item.assistant_response,
-                        negative="",
-                        nodePosition=NodePosition(x=count * 2 * 350, y=0),
-                        nodeSize=NodeSize(height=64, width=256),
-                        to=[count * 2 + 1],
-                    )
-                )
-                count += 1
-            converted_item.nodeItems.append(
-                NodeItem(
-                    role=Role.USER,
-                    positive=item.instruction
-                    + (f"\n{item.input}" if item.input else ""),
-                    negative="",
-                    nodePosition=NodePosition(x=(count * 2 - 1) * 350, y=0),
-                    nodeSize=NodeSize(height=64, width=256),
-                    to=[count * 2],
-                )
-            )
-            converted_item.nodeItems.append(
-                NodeItem(
-                    role=Role.ASSISTANT,
-                    positive=item.output,
-                    negative="",
-                    nodePosition=NodePosition(x=count * 2 * 350, y=0),
-                    nodeSize=NodeSize(height=64, width=256),
-                    to=[],
-                )
+                {"message": "Either file or upload_id is required"}, status_code=400
             )
-            dataset = self.db.get_dataset_by_name(dataset_name)
-            dataset.items.append(converted_item)
-            self.db.update_dataset_by_name(dataset_name, dataset)
-        return JSONResponse(status_code=200, content={"message": "Imported"})
+        reserved = await self.db.begin_import(dataset_name, "alpaca")
+        if reserved is None:
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+        import_id, prefix = reserved
+        if upload_id is None:
+            path = await self.jobs.save_upload(file.file)
+            cleanup = functools.partial(path.unlink, missing_ok=True)
+        job_id = await self.jobs.submit(
+            "import_alpaca",
+            "bytes",
+            path.stat().st_size,
+            import_job,
+            self.db.database,
+            import_id,
+            prefix,
+            str(path),
+            functools.partial(
+                convert_records, AlpacaInteraction.model_validate, convert_alpaca_item
+            ),
+            self.config.import_batch_size,
+            cleanup=cleanup,
+        )
+        return JSONResponse(
+            {
+                "message": "Import started",
+                "job_id": job_id,
+                "job_url": f"/jobs/{job_id}",
+            },
+            status_code=202,
+        )
 
-    def traverse_nodes(
+    async def export_alpaca(
         self,
-        node_items: list[NodeItem],
-        idx: int,
-        context: AlpacaInteraction,
-        alpaca_dataset: list[AlpacaInteraction],
-    ) -> None:
-        if idx >= len(node_items):
-            raise ValueError("Invalid index")
-        current_node = node_items[idx]
-        assert current_node.role != Role.SYSTEM
-        if current_node.role == Role.USER:
-            if not current_node.to:
-                raise ValueError(f"USER node at index {idx} has empty 'to' links")
-            for next_index in current_node.to:
-                if next_index >= len(node_items):
-                    raise ValueError(
-                        f"Invalid node graph: next_index {next_index} "
-                        f"exceeds node_items length {len(node_items)}"
-                    )
-                next_node = node_items[next_index]
-                if next_node.role != Role.ASSISTANT:
-                    raise ValueError(
-                        f"Expected ASSISTANT node after USER at index {idx}, "
-                        f"but got {next_node.role} at index {next_index}"
-                    )
-                new_context = context.model_copy(deep=True)
-                new_context.instruction = current_node.positive
-                new_context.input = ""
-                self.traverse_nodes(node_items, next_index, new_context, alpaca_dataset)
-        elif current_node.role == Role.ASSISTANT:
-            context.output = current_node.positive
-            alpaca_dataset.append(context)
-            new_context = context.model_copy(deep=True)
-            new_context.history.append(
-                AlpacaDialogueRound(
-                    human_instruction=context.instruction,
-                    assistant_response=current_node.positive,
-                )
+        export_req: Annotated[ExportReq, Body(description="The dataset to export")],
+    ) -> Response:
+        media_type, extension = EXPORT_FORMATS[export_req.format]
+
+        if export_req.stream:
+            download_id = str(uuid.uuid4())
+            filename = f"alpaca_export_{download_id}.{extension}"
+            items = await self.db.iter_dataset_items(export_req.dataset_name)
+            if items is None:
+                return JSONResponse({"message": "Dataset not found"}, status_code=404)
+            chunks = iter_json_chunks(iter_alpaca_records(items), export_req.format)
+            # Errors past this point can only abort the stream, not change the status.
+            return StreamingResponse(
+                chunks,
+                media_type=media_type,
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
             )
-            if current_node.to:
-                for next_index in current_node.to:
-                    self.traverse_nodes(
-                        node_items, next_index, new_context, alpaca_dataset
-                    )
 
-    async def export_alpaca(
-        self, export_req: ExportReq = Body(..., description="The dataset to export")
-    ) -> JSONResponse:
-        dataset_name = export_req.dataset_name
-        dataset = self.db.get_dataset_by_name(dataset_name)
-        if not dataset:
+        state = await self.db.dataset_version(export_req.dataset_name)
+        if state is None:
             return JSONResponse({"message": "Dataset not found"}, status_code=404)
-
-        alpaca_dataset = []
-        for item in dataset.items:
-            if not item.nodeItems:
-                return JSONResponse({"message": "Empty nodeItems"}, status_code=400)
-            if item.nodeItems[0].role != Role.SYSTEM:
-                return JSONResponse(
-                    {
-                        "message": "Invalid dataset item",
-                        "detail": "First item must be system",
-                    },
-                    status_code=400,
-                )
-
-            system_positive = item.nodeItems[0].positive
-            context = AlpacaInteraction(
-                instruction="",
-                input=None,
-                output="",
-                system=system_positive,
-                history=[],
+        key = ExportKey(f"alpaca.{export_req.format}", *state)
+        download_id = key.artifact_id()
+        filename = f"alpaca_export_{download_id}.{extension}"
+        url = f"/plugins/download_alpaca/{download_id}"
+        if self.artifacts.lookup(key) is not None:
+            return JSONResponse(
+                {"message": "Export ready", "url": url, "filename": filename}
             )
-            try:
-                for start_index in item.nodeItems[0].to:
-                    self.traverse_nodes(
-                        item.nodeItems, start_index, context, alpaca_dataset
-                    )
-            except ValueError as e:
-                return JSONResponse(content={"message": str(e)}, status_code=400)
-
-        dumped_data = []
-        for interaction in alpaca_dataset:
-            try:
-                dumped = interaction.model_dump(exclude_none=True)
-                dumped["history"] = [
-                    [item["human_instruction"], item["assistant_response"]]
-                    for item in dumped["history"]
-                ]
-                dumped_data.append(dumped)
-            except ValidationError as e:
-                return JSONResponse(
-                    {
-                        "message": "Validation error",
-                        "errors": format_validation_error(e),
-                    },
-                    status_code=400,
-                )
-
-        json_data = dumped_data
-        json_content = json.dumps(json_data, indent=2, ensure_ascii=False)
-        content = json_content.encode("utf-8")
-
-        download_id = str(uuid.uuid4())
-        filename = f"alpaca_export_{download_id}.json"
-
-        self.export_cache[download_id] = ExportCacheItem(
-            content=content,
-            filename=filename,
-            expiration_time=time.time() + self.file_expiration_time,
+        count = await self.db.count_dataset_items(export_req.dataset_name)
+        if count is None:
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+        job_id = await self.jobs.submit(
+            "export_alpaca",
+            "items",
+            count,
+            export_records_job,
+            self.db.database,
+            self.artifacts,
+            key,
+            filename,
+            media_type,
+            RECORD_LAYOUTS[export_req.format],
+            functools.partial(encode_records, build_alpaca_record, export_req.format),
+            url,
         )
-
         return JSONResponse(
             {
-                "message": "Dataset exported",
-                "url": f"/plugins/download_alpaca/{download_id}",
-                "filename": filename,
+                "message": "Export started",
+                "job_id": job_id,
+                "job_url": f"/jobs/{job_id}",
             },
-            status_code=200,
+            status_code=202,
         )
 
     async def download_file(self, download_id: str) -> Response:
-        item = self.export_cache.get(download_id)
-        if not item:
-            return JSONResponse(status_code=404, content={"message": "File not found"})
-        if time.time() > item.expiration_time:
-            del self.export_cache[download_id]
-            return JSONResponse(
-                status_code=410, content={"message": "File has expired"}
-            )
-        self.export_cache[download_id].expiration_time = (
-            time.time() + self.file_expiration_time
-        )
-
-        return Response(
-            content=item.content,
-            headers={
-                "Content-Disposition": f'attachment; filename="{item.filename}"',
-                "Content-Type": "application/json",
-            },
-        )
+        return self.artifacts.download_response(download_id)
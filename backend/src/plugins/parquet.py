@@ -0,0 +1,223 @@
+import functools
+import io
+from collections.abc import Callable, Iterable, Iterator
+from typing import Annotated, ClassVar, Literal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import Body
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from ..artifacts import ArtifactStore, ExportKey
+from ..database import AsyncDatabase
+from ..exporter import export_job, iter_conversation_paths
+from ..jobs import JobEngine
+from ..responses import JSONResponse
+from ..schemas import (
+    Config,
+    DatasetItem,
+    PluginInterface,
+    PluginParam,
+    Role,
+)
+from ..uploads import UploadStore
+
+MESSAGE_TYPE = pa.struct([("role", pa.string()), ("content", pa.string())])
+# One row per conversation path, messages in the same order as a ChatML export.
+SCHEMA = pa.schema([("item", pa.string()), ("messages", pa.list_(MESSAGE_TYPE))])
+
+
+class ExportReq(BaseModel):
+    dataset_name: str
+    row_group_size: int = Field(10000, ge=1, le=1000000)
+    compression: Literal["zstd", "snappy", "gzip", "brotli", "lz4", "none"] = "zstd"
+
+
+def encode_parquet_batch(items: list[DatasetItem]) -> bytes:
+    """
+    Builds the rows of every conversation path of `items` as one Arrow record
+    batch, column by column, and returns it in the Arrow IPC stream format.
+    Runs in job processes.
+    """
+    names = []
+    offsets = [0]
+    roles = []
+    contents = []
+    for item in items:
+        node_items = item.nodeItems
+        for path in iter_conversation_paths(node_items):
+            names.append(item.name)
+            roles.append(Role.SYSTEM.value)
+            contents.append(node_items[0].positive)
+            for idx in path:
+                node = node_items[idx]
+                if node.role in (Role.USER, Role.ASSISTANT):
+                    roles.append(node.role.value)
+                    contents.append(node.positive)
+            offsets.append(len(roles))
+    messages = pa.ListArray.from_arrays(
+        pa.array(offsets, pa.int32()),
+        pa.StructArray.from_arrays(
+            [pa.array(roles, pa.string()), pa.array(contents, pa.string())],
+            fields=list(MESSAGE_TYPE),
+        ),
+    )
+    batch = pa.record_batch([pa.array(names, pa.string()), messages], schema=SCHEMA)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, SCHEMA) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what was written until it is drained, so the
+    Parquet writer's output can be handed on chunk by chunk.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def write_parquet_chunks(
+    batches: Iterable[bytes], row_group_size: int, compression: str
+) -> Iterator[bytes]:
+    """
+    Writes batches from `encode_parquet_batch` as a Parquet file and yields its
+    bytes after every row group. Rows are held back only until a full row group
+    of `row_group_size` rows is ready, which bounds memory by the row group.
+    """
+    sink = ChunkSink()
+    pending = SCHEMA.empty_table()
+    with pq.ParquetWriter(sink, SCHEMA, compression=compression) as writer:
+        for batch in batches:
+            table = pa.ipc.open_stream(batch).read_all()
+            pending = pa.concat_tables([pending, table])
+            while pending.num_rows >= row_group_size:
+                writer.write_table(pending.slice(0, row_group_size), row_group_size)
+                pending = pending.slice(row_group_size)
+                yield sink.drain()
+        if pending.num_rows:
+            writer.write_table(pending, row_group_size)
+    yield sink.drain()
+
+
+class Plugin:
+    db: AsyncDatabase
+    config: Config
+    artifacts: ArtifactStore
+    jobs: JobEngine
+    uploads: UploadStore
+    on_events: ClassVar[dict[str, list[Callable]]] = {}
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        config: Config,
+        artifacts: ArtifactStore,
+        jobs: JobEngine,
+        uploads: UploadStore,
+    ) -> None:
+        self.db = db
+        self.config = config
+        self.artifacts = artifacts
+        self.jobs = jobs
+        self.uploads = uploads
+        self.plugin_interfaces = [
+            PluginInterface(
+                display_name="Export Parquet",
+                api_name="export_parquet",
+                type="request",
+                content_type="application/json",
+                description="Export dataset to a Parquet file, one row per "
+                "conversation path.",
+                handler=self.export_parquet,
+                params=[
+                    PluginParam(
+                        display_name="Target dataset",
+                        api_name="dataset_name",
+                        description="Export from which dataset.",
+                        type="dataset",
+                    )
+                ],
+            ),
+            PluginInterface(
+                display_name="Download Parquet",
+                api_name="download_parquet/{download_id}",
+                type="download",
+                content_type="application/octet-stream",
+                description="Download exported Parquet dataset.",
+                handler=self.download_file,
+                params=[],
+                admission_class=None,
+            ),
+        ]
+
+    async def export_parquet(
+        self,
+        export_req: Annotated[ExportReq, Body(description="The dataset to export")],
+    ) -> Response:
+        state = await self.db.dataset_version(export_req.dataset_name)
+        if state is None:
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+        key = ExportKey(
+            f"parquet.{export_req.compression}.{export_req.row_group_size}", *state
+        )
+        download_id = key.artifact_id()
+        filename = f"parquet_export_{download_id}.parquet"
+        url = f"/plugins/download_parquet/{download_id}"
+        if self.artifacts.lookup(key) is not None:
+            return JSONResponse(
+                {"message": "Export ready", "url": url, "filename": filename}
+            )
+        count = await self.db.count_dataset_items(export_req.dataset_name)
+        if count is None:
+            return JSONResponse({"message": "Dataset not found"}, status_code=404)
+        job_id = await self.jobs.submit(
+            "export_parquet",
+            "items",
+            count,
+            export_job,
+            self.db.database,
+            self.artifacts,
+            key,
+            filename,
+            "application/vnd.apache.parquet",
+            functools.partial(
+                write_parquet_chunks,
+                row_group_size=export_req.row_group_size,
+                compression=export_req.compression,
+            ),
+            encode_parquet_batch,
+            url,
+        )
+        return JSONResponse(
+            {
+                "message": "Export started",
+                "job_id": job_id,
+                "job_url": f"/jobs/{job_id}",
+            },
+            status_code=202,
+        )
+
+    async def download_file(self, download_id: str) -> Response:
+        return self.artifacts.download_response(download_id)
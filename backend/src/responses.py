@@ -0,0 +1,271 @@
+import asyncio
+import zlib
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse as BaseJSONResponse
+from fastapi.utils import is_body_allowed_for_status_code
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .schemas import CompressionProfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+# Once this much of a body has been compressed, the rest is compressed on a
+# thread, off the event loop.
+THREAD_THRESHOLD = 1 << 18
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes JSON as compact UTF-8 without escaping non-ASCII text, like
+    `json.dumps` with `ensure_ascii=False` and tight separators, only faster.
+    """
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class JSONResponse(BaseJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def http_exception_handler(request: Request, exc: HTTPException) -> Response:
+    """
+    Answers an `HTTPException` like FastAPI does, encoded with `dumps`.
+    """
+    headers = getattr(exc, "headers", None)
+    if not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
+    return JSONResponse(
+        {"detail": exc.detail}, status_code=exc.status_code, headers=headers
+    )
+
+
+async def validation_exception_handler(
+    request: Request, exc: RequestValidationError
+) -> Response:
+    """
+    Answers an invalid request with 422 like FastAPI does, encoded with `dumps`.
+    """
+    return JSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=422)
+
+
+# Replace FastAPI's handlers, which encode with the standard library.
+EXCEPTION_HANDLERS = {
+    HTTPException: http_exception_handler,
+    RequestValidationError: validation_exception_handler,
+}
+
+
+class GzipEncoder:
+    def __init__(self, profile: CompressionProfile) -> None:
+        self.compressor = zlib.compressobj(profile.gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, profile: CompressionProfile) -> None:
+        self.compressor = brotli.Compressor(quality=profile.brotli_quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, profile: CompressionProfile) -> None:
+        self.compressor = zstandard.ZstdCompressor(
+            level=profile.zstd_level
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+ENCODERS = {
+    "zstd": ZstdEncoder if zstandard else None,
+    "br": BrotliEncoder if brotli else None,
+    "gzip": GzipEncoder,
+}
+
+
+def negotiate_encoding(accept_encoding: str, preference: list[str]) -> str | None:
+    """
+    Picks the content coding for an `Accept-Encoding` header: the available one
+    the client weighs highest, ties going to the earlier one in `preference`.
+    Returns None when only the identity coding is acceptable.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for coding in preference:
+        if ENCODERS.get(coding) is None:
+            continue
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Compresses text and JSON response bodies with the best coding the client
+    accepts. Single-body responses below `minimum_size` pass through as they
+    are; streamed bodies are compressed chunk by chunk and flushed after each
+    chunk, so the client still sees data as soon as it is sent. Range requests,
+    already encoded responses and responses offering byte ranges, such as
+    downloaded files, are never touched. HEAD requests get the same headers as
+    GET requests without anything being compressed.
+    """
+
+    def __init__(self, app, profile: CompressionProfile) -> None:
+        self.app = app
+        self.profile = profile
+
+    def skips(self, start, headers: MutableHeaders, size: int | None) -> bool:
+        """
+        Whether a response is sent as it is; `size` is its body size if known.
+        """
+        return (
+            start["status"] < 200
+            or start["status"] in (204, 206, 304)
+            or "content-encoding" in headers
+            or "accept-ranges" in headers
+            or not is_compressible(headers.get("content-type", ""))
+            or (size is not None and size < self.profile.minimum_size)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(
+            request_headers.get("accept-encoding", ""), self.profile.encodings
+        )
+        if encoding is None or "range" in request_headers:
+            await self.app(scope, receive, send)
+            return
+
+        head = scope["method"] == "HEAD"
+        start_message = None
+        encoder = None
+        compressed = 0
+
+        async def compress(data: bytes, finish: bool) -> bytes:
+            nonlocal compressed
+
+            def run() -> bytes:
+                body = encoder.compress(data) if data else b""
+                return body + encoder.finish() if finish else body
+
+            # Streamed chunks are small, so offload by the running total.
+            compressed += len(data)
+            if compressed >= THREAD_THRESHOLD:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, run)
+            return run()
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                # Such as a file sent by path, which is passed through as is.
+                if start_message is not None:
+                    await send(start_message)
+                    start_message = None
+                await send(message)
+                return
+            if start_message is not None:
+                # First body message: decide now that the body size is known.
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=start["headers"])
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if head:
+                    # The body is left out, so size it by its declared length.
+                    length = headers.get("content-length")
+                    size = int(length) if length is not None else None
+                else:
+                    size = None if more_body else len(body)
+                if self.skips(start, headers, size):
+                    await send(start)
+                    await send(message)
+                    return
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["etag"] = "W/" + headers["etag"]
+                if head:
+                    # The compressed length is unknown without compressing.
+                    del headers["content-length"]
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding](self.profile)
+                body = await compress(body, not more_body)
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    headers["content-length"] = str(len(body))
+                await send(start)
+                await send({**message, "body": body})
+                return
+            if encoder is None:
+                await send(message)
+                return
+            more_body = message.get("more_body", False)
+            body = await compress(message.get("body", b""), not more_body)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
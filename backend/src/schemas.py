@@ -1,14 +1,71 @@
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
-from pydantic import BaseModel
 from enum import Enum
-from typing import Optional, Awaitable
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
 
 
 class Image(BaseModel):
     id: int
     name: str
     file_type: str
-    data: bytes
+    sha256: str
+    size: int
+    path: str
+
+
+class StorageProfile(BaseModel):
+    path: str = "volume/database.db"
+    images_path: str = "volume/images"
+    jobs_path: str = "volume/jobs.db"
+    journal_mode: Literal["delete", "truncate", "persist", "memory", "wal"] = "wal"
+    synchronous: Literal["off", "normal", "full", "extra"] = "normal"
+    # Negative values are KiB, positive values are pages, as in SQLite.
+    cache_size: int = -65536
+    mmap_size: int = 268435456
+    busy_timeout: int = 5000
+    pool_size: int = 5
+
+
+class ServerProfile(BaseModel):
+    workers: int = 1
+    reload: bool = False
+    # "auto" picks uvloop and httptools when they are installed.
+    loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    http: Literal["auto", "h11", "httptools"] = "auto"
+    backlog: int = 2048
+    timeout_keep_alive: int = 5
+    timeout_graceful_shutdown: int = 30
+    limit_concurrency: int | None = None
+
+
+class CompressionProfile(BaseModel):
+    # Content codings offered, most preferred first, if the client accepts them.
+    encodings: list[Literal["zstd", "br", "gzip"]] = ["zstd", "br", "gzip"]
+    minimum_size: int = 1024
+    gzip_level: int = 4
+    brotli_quality: int = 4
+    zstd_level: int = 3
+
+
+class AdmissionClass(BaseModel):
+    concurrency: int = Field(ge=1)
+    queue_depth: int = Field(ge=0)
+    # Seconds a queued request may wait for a slot before it is turned away.
+    queue_timeout: float = 10.0
+    # Seconds rejected clients are told to wait, in the Retry-After header.
+    retry_after: int = 1
+
+
+class AdmissionProfile(BaseModel):
+    # Dataset and item editing, search and job status.
+    interactive: AdmissionClass = AdmissionClass(concurrency=64, queue_depth=256)
+    images: AdmissionClass = AdmissionClass(concurrency=32, queue_depth=256)
+    # Whole datasets, batches, upload chunks and plugin imports and exports.
+    bulk: AdmissionClass = AdmissionClass(
+        concurrency=2, queue_depth=8, queue_timeout=30.0, retry_after=30
+    )
 
 
 class Config(BaseModel):
@@ -16,6 +73,28 @@ class Config(BaseModel):
     api_base: str
     auth_token: str
     max_file_size: int
+    image_batch_max_files: int = 100
+    server: ServerProfile = ServerProfile()
+    compression: CompressionProfile = CompressionProfile()
+    admission: AdmissionProfile = AdmissionProfile()
+    database_workers: int = 4
+    # Threads per worker for the blocking file operations of uploads.
+    file_workers: int = 8
+    storage: StorageProfile = StorageProfile()
+    cache_max_entries: int = 4096
+    cache_max_bytes: int = 268435456
+    import_batch_size: int = 1000
+    # Jobs run concurrently per worker, and processes for their CPU-bound steps.
+    job_workers: int = 2
+    job_processes: int = 2
+    export_max_bytes: int = 4294967296
+    export_expiration_time: int = 60
+    # Seconds an export of a dataset version is kept for repeat requests after
+    # its last use. Any write to the dataset makes a new version.
+    export_cache_expiration_time: int = 86400
+    upload_max_bytes: int = 68719476736
+    # Seconds an upload may sit idle, unfinished or finalized, before removal.
+    upload_expiration_time: int = 86400
 
 
 class Role(str, Enum):
@@ -40,7 +119,7 @@ class NodeItem(BaseModel):
     nodePosition: NodePosition
     nodeSize: NodeSize
     positive: str
-    negative: Optional[str]
+    negative: str | None
     to: list[int]
 
 
@@ -55,6 +134,164 @@ class Dataset(BaseModel):
     items: list[DatasetItem]
 
 
+class DatasetSummary(BaseModel):
+    name: str
+    timestamp: int
+    item_count: int
+    modified_at: int
+
+
+class DatasetItemSummary(BaseModel):
+    name: str
+    modified_at: int
+
+
+class SearchHit(BaseModel):
+    dataset: str
+    item: str
+    node_index: int
+    role: str
+    snippet: str
+    score: float
+
+
+class MoveNode(BaseModel):
+    op: Literal["move_node"]
+    index: int
+    nodePosition: NodePosition
+
+
+class ResizeNode(BaseModel):
+    op: Literal["resize_node"]
+    index: int
+    nodeSize: NodeSize
+
+
+class SetNodeText(BaseModel):
+    op: Literal["set_text"]
+    index: int
+    positive: str | None = None
+    negative: str | None = None
+
+
+class SetNodeRole(BaseModel):
+    op: Literal["set_role"]
+    index: int
+    role: Role
+
+
+class AddEdge(BaseModel):
+    op: Literal["add_edge"]
+    source: int
+    target: int
+
+
+class RemoveEdge(BaseModel):
+    op: Literal["remove_edge"]
+    source: int
+    target: int
+
+
+class InsertNode(BaseModel):
+    op: Literal["insert_node"]
+    # Appends when omitted. Edges pointing at or past `index` are shifted, and
+    # `node.to` is read in the numbering after the insert.
+    index: int | None = None
+    node: NodeItem
+
+
+class DeleteNode(BaseModel):
+    op: Literal["delete_node"]
+    index: int
+
+
+ItemOperation = Annotated[
+    MoveNode
+    | ResizeNode
+    | SetNodeText
+    | SetNodeRole
+    | AddEdge
+    | RemoveEdge
+    | InsertNode
+    | DeleteNode,
+    Field(discriminator="op"),
+]
+
+
+class DatasetItemPatch(BaseModel):
+    version: int
+    operations: list[ItemOperation]
+
+
+class CreateItem(BaseModel):
+    op: Literal["create"]
+    item: DatasetItem
+
+
+class UpdateItem(BaseModel):
+    op: Literal["update"]
+    item: DatasetItem
+    # Replaces the item only if it is still at this version, when given.
+    version: int | None = None
+
+
+class PatchItem(BaseModel):
+    op: Literal["patch"]
+    name: str
+    version: int
+    operations: list[ItemOperation]
+
+
+class DeleteItem(BaseModel):
+    op: Literal["delete"]
+    name: str
+    version: int | None = None
+
+
+BatchOperation = Annotated[
+    CreateItem | UpdateItem | PatchItem | DeleteItem,
+    Field(discriminator="op"),
+]
+
+
+class DatasetBatch(BaseModel):
+    operations: list[BatchOperation] = Field(max_length=100000)
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    # What `done` and `total` count, such as "bytes" of an upload or "items".
+    unit: str
+    done: int
+    total: int | None
+    processed: int
+    created_at: int
+    started_at: int | None
+    finished_at: int | None
+    result: dict | None
+    error: str | None
+    cancel_requested: bool
+
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+    # Hex SHA-256 of the whole file, checked when the upload is finalized.
+    sha256: str | None = Field(None, pattern="^[0-9a-f]{64}$")
+
+
+class Upload(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+    sha256: str | None
+    finalized: bool
+    expires_at: float
+
+
 class PluginParam(BaseModel):
     display_name: str
     api_name: str
@@ -70,4 +307,6 @@ class PluginInterface:
     content_type: str
     description: str
     params: list[PluginParam]
-    handler: callable | Awaitable
+    handler: Callable | Awaitable
+    # Admission class of the route, see `AdmissionProfile`.
+    admission_class: str | None = "bulk"
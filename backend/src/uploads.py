@@ -0,0 +1,276 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import time
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import ExitStack
+from typing import BinaryIO
+
+from .files import FilePool
+from .schemas import Upload
+
+# Received bytes are buffered up to this size before a write to the staging file.
+WRITE_BUFFER_SIZE = 1 << 20
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class UploadConflict(Exception):
+    """
+    Raised when a chunk or finalize request does not match the upload's state.
+    `offset` is the number of bytes received so far, where the client resumes.
+    """
+
+    def __init__(self, message: str, offset: int) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadStore:
+    """
+    Resumable uploads of large import files. Each upload is a `<id>.part`
+    staging file, renamed to `<id>.data` once finalized, plus a `<id>.json`
+    sidecar with the declared name, size and checksum. The staging file's size
+    is the upload offset, so any worker can take the next chunk and a
+    connection dropped mid-chunk resumes from what reached the disk. Uploads
+    idle for longer than `ttl` seconds are removed.
+    """
+
+    def __init__(
+        self, root: str | pathlib.Path, max_bytes: int, ttl: float, files: FilePool
+    ) -> None:
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.files = files
+        self.eviction_task: asyncio.Task | None = None
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    async def create(self, filename: str, size: int, sha256: str | None) -> Upload:
+        """
+        Starts an upload of `size` bytes. Raises `ValueError` if it exceeds the
+        per-upload byte limit.
+        """
+        return await self.files.run(self._create, filename, size, sha256)
+
+    async def get(self, upload_id: str) -> Upload | None:
+        return await self.files.run(self._get, upload_id)
+
+    async def path(self, upload_id: str) -> pathlib.Path | None:
+        """
+        Returns the file of a finalized upload and marks it as used, or None if
+        there is no such finalized upload.
+        """
+        return await self.files.run(self._path, upload_id)
+
+    async def delete(self, upload_id: str) -> bool:
+        return await self.files.run(self._delete, upload_id)
+
+    def _create(self, filename: str, size: int, sha256: str | None) -> Upload:
+        if size > self.max_bytes:
+            raise ValueError(f"Upload exceeds the {self.max_bytes} byte limit")
+        upload_id = str(uuid.uuid4())
+        (self.root / f"{upload_id}.part").touch()
+        with open(self.root / f"{upload_id}.json", "w") as f:
+            json.dump(
+                {
+                    "filename": filename,
+                    "size": size,
+                    "sha256": sha256,
+                    "created_at": time.time(),
+                },
+                f,
+            )
+        return self._get(upload_id)
+
+    def _get(self, upload_id: str) -> Upload | None:
+        try:
+            uuid.UUID(upload_id)
+            with open(self.root / f"{upload_id}.json") as f:
+                meta = json.load(f)
+            finalized = (self.root / f"{upload_id}.data").exists()
+            suffix = ".data" if finalized else ".part"
+            stat = (self.root / f"{upload_id}{suffix}").stat()
+        except (ValueError, OSError):
+            return None
+        return Upload(
+            id=upload_id,
+            filename=meta["filename"],
+            size=meta["size"],
+            offset=stat.st_size,
+            sha256=meta["sha256"],
+            finalized=finalized,
+            expires_at=stat.st_mtime + self.ttl,
+        )
+
+    def _path(self, upload_id: str) -> pathlib.Path | None:
+        upload = self._get(upload_id)
+        if upload is None or not upload.finalized:
+            return None
+        path = self.root / f"{upload_id}.data"
+        os.utime(path)
+        return path
+
+    def open_part(self, upload_id: str, offset: int) -> tuple[Upload, BinaryIO] | None:
+        """
+        Opens the staging file of an upload for a chunk at `offset` and locks
+        it until closed, or returns None if the upload does not exist. Raises
+        `UploadConflict` like `write_chunk`.
+        """
+        upload = self._get(upload_id)
+        if upload is None:
+            return None
+        if upload.finalized:
+            raise UploadConflict("Upload is already finalized", upload.offset)
+        with ExitStack() as stack:
+            try:
+                f = stack.enter_context(open(self.root / f"{upload_id}.part", "r+b"))
+            except FileNotFoundError:
+                # Finalized or deleted since it was looked up.
+                return self.open_part(upload_id, offset)
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("Another chunk is being written", upload.offset)
+            current = os.fstat(f.fileno()).st_size
+            if (self.root / f"{upload_id}.data").exists():
+                # Finalized between the open and the lock.
+                raise UploadConflict("Upload is already finalized", current)
+            if offset != current:
+                raise UploadConflict("Offset does not match the upload", current)
+            f.seek(offset)
+            stack.pop_all()
+        return upload, f
+
+    async def write_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        sha256: str | None = None,
+    ) -> int | None:
+        """
+        Appends a streamed chunk at `offset` and returns the new offset, or None
+        if the upload does not exist. With `sha256`, a chunk that does not match
+        is discarded and raises `ValueError`; without it, whatever arrived before
+        the stream broke is kept. Raises `UploadConflict` if `offset` is not the
+        current offset, the upload is finalized or another chunk is being
+        written, and `ValueError` if the chunk runs past the declared size.
+        """
+        worker = self.files.worker()
+        opened = await worker.run(self.open_part, upload_id, offset)
+        if opened is None:
+            return None
+        upload, f = opened
+        try:
+            digest = hashlib.sha256()
+            buffer = bytearray()
+            end = offset
+            try:
+                async for chunk in chunks:
+                    end += len(chunk)
+                    if end > upload.size:
+                        raise ValueError("Chunk runs past the declared upload size")
+                    digest.update(chunk)
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await worker.run(f.write, buffer)
+                        buffer = bytearray()
+                if sha256 is not None and digest.hexdigest() != sha256:
+                    raise ValueError("Chunk checksum does not match")
+                await worker.run(f.write, buffer)
+            except BaseException as e:
+                if sha256 is not None or isinstance(e, ValueError):
+                    await worker.run(f.truncate, offset)
+                else:
+                    # An interrupted stream keeps its bytes, so the client
+                    # can resume from wherever the status reports.
+                    await worker.run(f.write, buffer)
+                raise
+            return f.tell()
+        finally:
+            await worker.run(f.close)
+
+    async def finalize(self, upload_id: str) -> Upload | None:
+        """
+        Completes an upload once every byte has arrived, checking the whole
+        file against the declared checksum if there was one. Returns None if
+        the upload does not exist. Raises `UploadConflict` if bytes are missing
+        or a chunk is being written, and `ValueError` on a checksum mismatch,
+        which leaves the upload as is.
+        """
+        return await self.files.run(self._finalize, upload_id)
+
+    def _finalize(self, upload_id: str) -> Upload | None:
+        upload = self._get(upload_id)
+        if upload is None or upload.finalized:
+            return upload
+        part_path = self.root / f"{upload_id}.part"
+        with ExitStack() as stack:
+            try:
+                f = stack.enter_context(open(part_path, "rb"))
+            except FileNotFoundError:
+                # Finalized or deleted since it was looked up.
+                return self._get(upload_id)
+            # Taken like a chunk write takes it, so no chunk lands in the file
+            # while it is checked and renamed.
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("A chunk is being written", upload.offset)
+            if (self.root / f"{upload_id}.data").exists():
+                return self._get(upload_id)
+            offset = os.fstat(f.fileno()).st_size
+            if offset != upload.size:
+                raise UploadConflict("Upload is incomplete", offset)
+            if upload.sha256 is not None and file_sha256(part_path) != upload.sha256:
+                raise ValueError("Upload checksum does not match")
+            os.replace(part_path, self.root / f"{upload_id}.data")
+        return self._get(upload_id)
+
+    def _delete(self, upload_id: str) -> bool:
+        if self._get(upload_id) is None:
+            return False
+        for suffix in (".part", ".data", ".json"):
+            (self.root / f"{upload_id}{suffix}").unlink(missing_ok=True)
+        return True
+
+    def evict(self) -> None:
+        """
+        Removes uploads, finished or not, that have not been written to or
+        imported from for longer than the TTL.
+        """
+        now = time.time()
+        for meta_path in self.root.glob("*.json"):
+            upload = self._get(meta_path.stem)
+            if upload is None:
+                try:
+                    if now > meta_path.stat().st_mtime + self.ttl:
+                        meta_path.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    pass
+            elif now > upload.expires_at:
+                self._delete(upload.id)
+
+    async def on_startup(self):
+        self.eviction_task = asyncio.create_task(self.run_eviction())
+
+    async def on_shutdown(self):
+        if self.eviction_task:
+            self.eviction_task.cancel()
+
+    async def run_eviction(self):
+        while True:
+            await self.files.run(self.evict)
+            await asyncio.sleep(min(self.ttl, 3600))
@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+from src.cache import ObjectCache
+from src.database import AsyncDatabase, Database
+from src.jobs import JobEngine
+from src.metrics import Metrics
+from src.schemas import DatasetItem, NodeItem, StorageProfile
+
+
+def build_item(
+    name: str, answer: str = "answer", negative: str | None = ""
+) -> DatasetItem:
+    """
+    Builds an item of one system prompt, one question and one answer.
+    """
+    nodes = [("system", "system prompt", [1]), ("user", "question", [2])]
+    nodes.append(("assistant", answer, []))
+    return DatasetItem(
+        name=name,
+        nodeItems=[
+            NodeItem(
+                role=role,
+                nodePosition={"x": 0, "y": 0},
+                nodeSize={"width": 100, "height": 100},
+                positive=positive,
+                negative=negative,
+                to=to,
+            )
+            for role, positive, to in nodes
+        ],
+    )
+
+
+@pytest.fixture
+def make_item():
+    return build_item
+
+
+@pytest.fixture
+def database(tmp_path):
+    storage = StorageProfile(
+        path=str(tmp_path / "database.db"),
+        images_path=str(tmp_path / "images"),
+        jobs_path=str(tmp_path / "jobs.db"),
+    )
+    database = Database(storage, ObjectCache(1000, 1 << 26), Metrics())
+    database.init_db()
+    yield database
+    database.engine.dispose()
+    database.jobs_engine.dispose()
+
+
+@pytest.fixture
+def run_job(database, tmp_path):
+    """
+    Runs a job body to completion on the calling thread and returns the job.
+    CPU-bound steps run inline, as the engine does before its pool starts.
+    """
+    engine = JobEngine(AsyncDatabase(database, 1), tmp_path / "jobs", 1, 1)
+
+    def run(func, *args):
+        job_id = str(uuid.uuid4())
+        database.create_job(job_id, "test", "items", None)
+        engine.run(job_id, func, args, None)
+        return database.get_job(job_id)
+
+    yield run
+    engine.executor.shutdown()
+    engine.db.executor.shutdown()
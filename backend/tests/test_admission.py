@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+from src.admission import AdmissionControl, AdmissionMiddleware, Gate, admission_class
+from src.schemas import AdmissionClass
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+
+def test_gate_queues_in_order_and_hands_over_slots():
+    async def run():
+        gate = Gate("bulk", AdmissionClass(concurrency=1, queue_depth=2))
+        assert await gate.acquire()
+        first = asyncio.create_task(gate.acquire())
+        second = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        # The queue is full, so a fourth request is turned away at once.
+        assert not await gate.acquire()
+        assert gate.stats()["queued"] == 2
+
+        gate.release()
+        assert await first
+        assert not second.done()
+        gate.release()
+        assert await second
+        gate.release()
+        return gate.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["active"] == 0
+    assert (stats["admitted"], stats["rejected"]) == (3, 1)
+
+
+def test_gate_waiter_gives_up_after_queue_timeout():
+    async def run():
+        settings = AdmissionClass(concurrency=1, queue_depth=1, queue_timeout=0.01)
+        gate = Gate("bulk", settings)
+        assert await gate.acquire()
+        assert not await gate.acquire()
+        # The slot is still held, and nobody is left waiting for it.
+        gate.release()
+        return gate.stats()
+
+    stats = asyncio.run(run())
+
+    assert (stats["active"], stats["queued"], stats["rejected"]) == (0, 0, 1)
+
+
+def test_middleware_answers_429_with_retry_after():
+    async def run():
+        entered, finish = asyncio.Event(), asyncio.Event()
+
+        @admission_class("bulk")
+        async def slow(request):
+            entered.set()
+            await finish.wait()
+            return PlainTextResponse("done")
+
+        @admission_class(None)
+        async def health(request):
+            return PlainTextResponse("ok")
+
+        app = Starlette(routes=[Route("/slow", slow), Route("/health", health)])
+        settings = AdmissionClass(concurrency=1, queue_depth=0, retry_after=7)
+        control = AdmissionControl({"bulk": settings}, "bulk")
+        app.add_middleware(AdmissionMiddleware, router=app.router, control=control)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            held = asyncio.create_task(c.get("/slow"))
+            await entered.wait()
+            rejected = await c.get("/slow")
+            exempt = await c.get("/health")
+            finish.set()
+            return rejected, exempt, await held
+
+    rejected, exempt, held = asyncio.run(run())
+
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "7"
+    assert rejected.json() == {"message": "Too many bulk requests, retry later"}
+    assert exempt.status_code == 200
+    assert held.text == "done"
@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from src.database import BatchRejected
+from src.schemas import CreateItem, Dataset, DeleteItem, UpdateItem
+
+
+def test_item_with_null_negative_is_served(database, make_item):
+    database.create_dataset("d", 1, [make_item("a", negative=None)])
+    database.create_dataset_item("d", make_item("b", negative=None))
+
+    item, version = database.get_dataset_item("d", "b")
+    assert item.nodeItems[0].negative is None
+    assert version == 1
+    # A second read is served from the cache, which sized the parsed item.
+    hits = database.cache.hits
+    assert database.get_dataset_item("d", "b") == (item, version)
+    assert database.cache.hits == hits + 1
+    assert [item.name for item in database.get_dataset_by_name("d").items] == [
+        "a",
+        "b",
+    ]
+
+
+def test_rejected_batch_writes_nothing(database, make_item):
+    database.create_dataset("d", 1, [make_item("a"), make_item("b")])
+    state = database.dataset_version("d")
+    operations = [
+        CreateItem(op="create", item=make_item("c")),
+        UpdateItem(op="update", item=make_item("a", "edited")),
+        DeleteItem(op="delete", name="b"),
+        DeleteItem(op="delete", name="missing"),
+    ]
+
+    with pytest.raises(BatchRejected) as rejected:
+        database.apply_item_batch("d", operations)
+
+    assert [result["status"] for result in rejected.value.results] == [
+        201,
+        200,
+        200,
+        404,
+    ]
+    assert database.list_dataset_items("d") == ["a", "b"]
+    item, version = database.get_dataset_item("d", "a")
+    assert item.nodeItems[-1].positive == "answer"
+    assert version == 1
+    assert database.dataset_version("d") == state
+
+
+def test_batch_checks_operations_against_earlier_ones(database, make_item):
+    database.create_dataset("d", 1, [make_item("a")])
+
+    results = database.apply_item_batch(
+        "d",
+        [
+            DeleteItem(op="delete", name="a", version=1),
+            CreateItem(op="create", item=make_item("a", "recreated")),
+            UpdateItem(op="update", item=make_item("a", "updated"), version=1),
+        ],
+    )
+
+    assert [result["status"] for result in results] == [200, 201, 200]
+    item, version = database.get_dataset_item("d", "a")
+    assert item.nodeItems[-1].positive == "updated"
+    assert version == 2
+
+
+def test_update_of_missing_dataset_is_reported(database, make_item):
+    dataset = Dataset(name="d", timestamp=1, items=[make_item("a")])
+    assert not database.update_dataset_by_name("d", dataset)
+    assert database.get_dataset_by_name("d") is None
+
+
+def test_duplicate_item_names_write_nothing(database, make_item):
+    with pytest.raises(IntegrityError):
+        database.create_dataset("d", 1, [make_item("a"), make_item("a")])
+    assert database.get_dataset_by_name("d") is None
+
+    database.create_dataset("d", 1, [make_item("a")])
+    version = database.dataset_version("d")
+    duplicates = Dataset(name="d", timestamp=2, items=[make_item("b")] * 2)
+    with pytest.raises(IntegrityError):
+        database.update_dataset_by_name("d", duplicates)
+    assert database.list_dataset_items("d") == ["a"]
+    assert database.dataset_version("d") == version
+
+
+@pytest.mark.parametrize("cursor", ["!", "bm90IGpzb24=", "MQ==", "W10=", "/w=="])
+def test_malformed_cursor_is_rejected(database, make_item, cursor):
+    database.create_dataset("d", 1, [make_item("a")])
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        database.list_dataset_item_summaries("d", 10, cursor)
@@ -0,0 +1,117 @@
+import functools
+import uuid
+
+import orjson
+import pytest
+from src.artifacts import ArtifactStore, ExportKey
+from src.exporter import RECORD_LAYOUTS, encode_records, export_records_job
+from src.plugins.alpaca import build_alpaca_record
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    return ArtifactStore(tmp_path / "exports", 1 << 30, 60, 3600)
+
+
+@pytest.fixture
+def export(database, artifacts, run_job):
+    """
+    Exports a dataset as alpaca JSONL like the plugin does and returns the
+    result of the export job, or None if the cached export was served, and the
+    exported file.
+    """
+
+    def export(dataset_name: str) -> tuple[dict | None, bytes]:
+        key = ExportKey("alpaca.jsonl", *database.dataset_version(dataset_name))
+        result = None
+        if artifacts.lookup(key) is None:
+            job = run_job(
+                export_records_job,
+                database,
+                artifacts,
+                key,
+                "export.jsonl",
+                "application/x-ndjson",
+                RECORD_LAYOUTS["jsonl"],
+                functools.partial(encode_records, build_alpaca_record, "jsonl"),
+                "/download",
+            )
+            assert job.status == "succeeded", job.error
+            result = job.result
+        return result, artifacts.get(key.artifact_id()).path.read_bytes()
+
+    return export
+
+
+def outputs(exported: bytes) -> list[str]:
+    return [orjson.loads(line)["output"] for line in exported.splitlines()]
+
+
+def test_unchanged_dataset_is_served_from_cache(database, make_item, export):
+    database.create_dataset("d", 1, [make_item("a", "first"), make_item("b", "second")])
+
+    result, exported = export("d")
+    assert result["reused_items"] == 0
+    assert outputs(exported) == ["first", "second"]
+    assert export("d") == (None, exported)
+
+
+def test_export_reuses_only_unchanged_items(database, make_item, export):
+    database.create_dataset("d", 1, [make_item("a", "first"), make_item("b", "second")])
+    export("d")
+    database.update_dataset_item("d", "a", make_item("a", "edited"))
+
+    result, exported = export("d")
+
+    assert result["reused_items"] == 1
+    assert outputs(exported) == ["edited", "second"]
+
+
+def test_recreated_item_is_not_copied_from_deleted_one(database, make_item, export):
+    database.create_dataset("d", 1, [make_item("a", "first"), make_item("b", "second")])
+    export("d")
+    # The newest item's id is the one SQLite would hand out again.
+    database.delete_dataset_item("d", "b")
+    database.create_dataset_item("d", make_item("c", "third"))
+
+    result, exported = export("d")
+
+    assert result["reused_items"] == 1
+    assert outputs(exported) == ["first", "third"]
+
+
+def test_recreated_dataset_is_not_served_old_export(
+    database, artifacts, make_item, export
+):
+    database.create_dataset("d", 1, [make_item("a", "first")])
+    export("d")
+    dataset_id = database.delete_dataset_by_name("d")
+    database.create_dataset("d", 1, [make_item("a", "recreated")])
+
+    result, exported = export("d")
+
+    assert result["reused_items"] == 0
+    assert outputs(exported) == ["recreated"]
+    artifacts.purge_dataset(dataset_id)
+    assert export("d") == (None, exported)
+    assert artifacts.stats()["entries"] == 1
+
+
+def test_eviction_spares_parts_being_written(tmp_path):
+    # With a zero TTL every partial write counts as stale.
+    artifacts = ArtifactStore(tmp_path / "exports", 1 << 30, 0, 0)
+    abandoned = artifacts.root / "abandoned.part"
+    abandoned.write_bytes(b"x")
+    seen = []
+
+    def chunks():
+        yield b"first"
+        artifacts.evict()
+        seen.extend(path.name for path in artifacts.root.glob("*.part"))
+        yield b"second"
+
+    artifacts.write(str(uuid.uuid4()), "a.json", "application/json", chunks())
+
+    assert len(seen) == 1
+    assert seen[0] != abandoned.name
+    assert not abandoned.exists()
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from src.files import FilePool
+from src.images import ImageStore, receive_images
+from starlette.requests import Request
+
+BOUNDARY = b"boundary"
+
+
+def multipart_request(files: list[bytes]) -> Request:
+    body = b"".join(
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="files"; filename="%d.png"\r\n'
+        b"Content-Type: image/png\r\n\r\n" % i + content + b"\r\n"
+        for i, content in enumerate(files)
+    )
+    body += b"--" + BOUNDARY + b"--\r\n"
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)],
+    }
+    return Request(scope, receive)
+
+
+def stored_files(store: ImageStore) -> list[str]:
+    return sorted(path.name for path in store.root.rglob("*") if path.is_file())
+
+
+@pytest.fixture
+def files():
+    pool = FilePool(2)
+    yield pool
+    pool.executor.shutdown()
+
+
+def test_images_appear_once_registered(tmp_path, files):
+    store = ImageStore(tmp_path / "images")
+    seen = []
+
+    async def register(images):
+        # Nothing is published while the rows are being written.
+        seen.extend(stored_files(store))
+        return [1, 2]
+
+    request = multipart_request([b"\x89PNGa", b"\x89PNGb"])
+    ids = asyncio.run(
+        receive_images(request, files, store, "files", 1 << 20, 10, register)
+    )
+
+    assert ids == [1, 2]
+    assert all(name.endswith(".part") for name in seen)
+    assert len(stored_files(store)) == 2
+    assert not any(name.endswith(".part") for name in stored_files(store))
+
+
+def test_failed_registration_stores_nothing(tmp_path, files):
+    store = ImageStore(tmp_path / "images")
+
+    async def register(images):
+        raise RuntimeError("database is locked")
+
+    request = multipart_request([b"\x89PNGa", b"\x89PNGb"])
+    with pytest.raises(RuntimeError):
+        asyncio.run(
+            receive_images(request, files, store, "files", 1 << 20, 10, register)
+        )
+
+    assert stored_files(store) == []
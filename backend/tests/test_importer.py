@@ -0,0 +1,109 @@
+import functools
+import io
+import json
+
+import pytest
+from src import importer
+from src.importer import RecordError, convert_records, import_job
+from src.plugins.alpaca import AlpacaInteraction, convert_alpaca_item
+
+
+def alpaca_file(tmp_path, records):
+    path = tmp_path / "upload.json"
+    path.write_text(json.dumps(records))
+    return str(path)
+
+
+CONVERT = functools.partial(
+    convert_records, AlpacaInteraction.model_validate, convert_alpaca_item
+)
+
+
+def test_staged_items_appear_on_publish(database, make_item):
+    database.create_dataset("d", 1, [make_item("a")])
+    import_id, prefix = database.begin_import("d", "alpaca")
+    database.stage_import_rows(
+        import_id, [(f"{prefix}0", make_item("x").model_dump()["nodeItems"])]
+    )
+
+    # Editors keep saving while the import is staged, and see nothing of it.
+    database.update_dataset_item("d", "a", make_item("a", "edited"))
+    assert [item.name for item in database.get_dataset_by_name("d").items] == ["a"]
+    version = database.dataset_version("d")
+
+    assert database.publish_import(import_id) == 1
+    assert [item.name for item in database.get_dataset_by_name("d").items] == [
+        "a",
+        f"{prefix}0",
+    ]
+    assert database.dataset_version("d") != version
+
+
+def test_concurrent_imports_reserve_distinct_prefixes(database, make_item):
+    database.create_dataset("d", 1, [make_item("alpaca-1-0")])
+    assert database.begin_import("missing", "alpaca") is None
+
+    _, first = database.begin_import("d", "alpaca")
+    second_id, second = database.begin_import("d", "alpaca")
+    assert (first, second) == ("alpaca-0-", "alpaca-2-")
+
+    # A discarded import releases its prefix.
+    database.discard_import(second_id)
+    assert database.begin_import("d", "alpaca")[1] == "alpaca-2-"
+
+
+def test_failed_import_is_discarded(database, make_item, run_job, tmp_path):
+    database.create_dataset("d", 1, [make_item("a")])
+    records = [{"instruction": "q", "output": "a"}] * 3 + [{"output": 1}]
+    import_id, prefix = database.begin_import("d", "alpaca")
+
+    job = run_job(
+        import_job,
+        database,
+        import_id,
+        prefix,
+        alpaca_file(tmp_path, records),
+        CONVERT,
+        2,
+    )
+
+    assert job.status == "failed"
+    assert "Line 1" in job.error
+    assert [item.name for item in database.get_dataset_by_name("d").items] == ["a"]
+    # The prefix of the failed import is free again.
+    assert database.begin_import("d", "alpaca")[1] == prefix
+
+
+def test_import_job_publishes_every_batch(database, make_item, run_job, tmp_path):
+    database.create_dataset("d", 1, [make_item("a")])
+    records = [{"instruction": f"q{i}", "output": "a"} for i in range(5)]
+    import_id, prefix = database.begin_import("d", "alpaca")
+
+    job = run_job(
+        import_job,
+        database,
+        import_id,
+        prefix,
+        alpaca_file(tmp_path, records),
+        CONVERT,
+        2,
+    )
+
+    assert job.status == "succeeded"
+    names = [item.name for item in database.get_dataset_by_name("d").items]
+    assert names == ["a"] + [f"{prefix}{i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64])
+def test_array_values_span_chunks(monkeypatch, chunk_size):
+    monkeypatch.setattr(importer, "CHUNK_SIZE", chunk_size)
+    values = [{"a": 'x"]}\\', "b": [1.5e3, None]}, -2500.0, "é\n", [[], {}]]
+    text = "[\n" + ",\n".join(json.dumps(value) for value in values) + "\n]"
+
+    parsed = list(importer.iter_json_array_values(io.BytesIO(text.encode())))
+
+    assert parsed == [(line, value) for line, value in enumerate(values, start=2)]
+    truncated = io.BytesIO(text[:-6].encode())
+    with pytest.raises(RecordError) as error:
+        list(importer.iter_json_array_values(truncated))
+    assert error.value.line == 5
@@ -0,0 +1,40 @@
+def test_job_result_and_progress_are_stored(run_job):
+    def body(context):
+        squares = list(context.map(lambda value: value * value, range(4)))
+        context.progress(4, processed=8, total=4)
+        return {"squares": squares}
+
+    job = run_job(body)
+
+    assert job.status == "succeeded"
+    assert job.result == {"squares": [0, 1, 4, 9]}
+    assert (job.done, job.processed, job.total) == (4, 8, 4)
+    assert job.started_at <= job.finished_at
+
+
+def test_failed_job_records_its_error(run_job):
+    def body(context):
+        raise ValueError("Dataset not found")
+
+    job = run_job(body)
+
+    assert job.status == "failed"
+    assert job.error == "Dataset not found"
+
+
+def test_job_stops_at_progress_after_cancellation(database, run_job):
+    reached = []
+
+    def body(context):
+        # As if another worker cancelled the job meanwhile.
+        database.cancel_job(context.job_id)
+        for done in range(1, 4):
+            context.progress(done)
+            reached.append(done)
+        return {}
+
+    job = run_job(body)
+
+    assert job.status == "cancelled"
+    assert job.cancel_requested
+    assert reached == []
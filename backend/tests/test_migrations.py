@@ -0,0 +1,119 @@
+import sqlite3
+
+import orjson
+import pytest
+from src.cache import ObjectCache
+from src.database import MIGRATIONS, SEARCH_TRIGGERS, Database
+from src.metrics import Metrics
+from src.schemas import StorageProfile
+
+# The schema before any migration, when items were a JSON column of datasets.
+BASELINE_SCHEMA = """
+CREATE TABLE images (
+    id INTEGER NOT NULL, name VARCHAR, file_type VARCHAR, data BLOB,
+    PRIMARY KEY (id), UNIQUE (name)
+);
+CREATE TABLE datasets (
+    id INTEGER NOT NULL, name VARCHAR, timestamp INTEGER, items JSON,
+    PRIMARY KEY (id), UNIQUE (name)
+);
+"""
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return StorageProfile(
+        path=str(tmp_path / "database.db"),
+        images_path=str(tmp_path / "images"),
+        jobs_path=str(tmp_path / "jobs.db"),
+    )
+
+
+def open_database(storage: StorageProfile) -> Database:
+    database = Database(storage, ObjectCache(1000, 1 << 26), Metrics())
+    database.init_db()
+    return database
+
+
+def schema(path: str) -> tuple[dict, set, set, int]:
+    connection = sqlite3.connect(path)
+    try:
+        tables = dict(
+            connection.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+            )
+        )
+        triggers = {
+            row[0]
+            for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+            )
+        }
+        references = {
+            row[2]
+            for row in connection.execute("PRAGMA foreign_key_list(dataset_items)")
+        }
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        connection.close()
+    return tables, triggers, references, version
+
+
+def test_baseline_database_is_migrated(storage, make_item):
+    item = make_item("a", "findme").model_dump()
+    connection = sqlite3.connect(storage.path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.execute(
+        "INSERT INTO datasets (id, name, timestamp, items) VALUES (?, ?, ?, ?)",
+        (1, "d", 1000, orjson.dumps([item]).decode()),
+    )
+    connection.execute(
+        "INSERT INTO images (id, name, file_type, data) VALUES (?, ?, ?, ?)",
+        (7, "a.png", "image/png", b"\x89PNG"),
+    )
+    connection.commit()
+    connection.close()
+
+    database = open_database(storage)
+    tables, triggers, references, version = schema(storage.path)
+
+    assert version == len(MIGRATIONS)
+    assert references == {"datasets"}
+    assert set(SEARCH_TRIGGERS) <= triggers
+    assert "AUTOINCREMENT" in tables["datasets"]
+    assert "AUTOINCREMENT" in tables["dataset_items"]
+    assert not any(name.endswith(("_legacy", "_new")) for name in tables)
+    assert database.get_dataset_item("d", "a")[0].nodeItems[-1].positive == "findme"
+    [summary], _ = database.list_dataset_item_summaries("d", 10)
+    assert summary.modified_at == 1000
+    assert [hit.item for hit in database.search_nodes("findme", 10)[0]] == ["a"]
+    assert database.get_image_by_id(7).sha256 is not None
+
+    # The triggers keep working on the rebuilt table.
+    database.delete_dataset_item("d", "a")
+    assert database.search_nodes("findme", 10)[0] == []
+
+
+def test_item_foreign_key_is_repaired(storage, make_item):
+    open_database(storage).create_dataset("d", 1, [make_item("a")])
+    # What the first version of migrate_autoincrement left behind.
+    connection = sqlite3.connect(storage.path)
+    (sql,) = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'datasets'"
+    ).fetchone()
+    connection.execute("ALTER TABLE datasets RENAME TO datasets_legacy")
+    connection.execute(sql)
+    connection.execute("INSERT INTO datasets SELECT * FROM datasets_legacy")
+    connection.execute("DROP TABLE datasets_legacy")
+    connection.execute(f"PRAGMA user_version = {len(MIGRATIONS) - 1}")
+    connection.commit()
+    connection.close()
+    assert schema(storage.path)[2] == {"datasets_legacy"}
+
+    database = open_database(storage)
+    _, triggers, references, version = schema(storage.path)
+
+    assert references == {"datasets"}
+    assert set(SEARCH_TRIGGERS) <= triggers
+    assert version == len(MIGRATIONS)
+    assert database.list_dataset_items("d") == ["a"]
@@ -0,0 +1,85 @@
+import pytest
+from src.database import VersionConflict
+from src.schemas import AddEdge, DeleteNode, InsertNode, NodeItem, RemoveEdge
+
+
+def node(role: str, positive: str, to: list[int]) -> NodeItem:
+    return NodeItem(
+        role=role,
+        nodePosition={"x": 0, "y": 0},
+        nodeSize={"width": 100, "height": 100},
+        positive=positive,
+        negative="",
+        to=to,
+    )
+
+
+def graph(database) -> list[tuple[str, list[int]]]:
+    item, _ = database.get_dataset_item("d", "a")
+    return [(node.positive, node.to) for node in item.nodeItems]
+
+
+@pytest.fixture
+def item(database, make_item):
+    # system prompt -> question -> answer
+    database.create_dataset("d", 1, [make_item("a")])
+
+
+def test_insert_node_shifts_edges(database, item):
+    operations = [
+        InsertNode(op="insert_node", index=1, node=node("user", "inserted", [2])),
+        InsertNode(op="insert_node", node=node("assistant", "appended", [])),
+    ]
+
+    assert database.patch_dataset_item("d", "a", 1, operations) == 2
+    assert graph(database) == [
+        ("system prompt", [2]),
+        ("inserted", [2]),
+        ("question", [3]),
+        ("answer", []),
+        ("appended", []),
+    ]
+
+
+def test_delete_node_drops_and_shifts_edges(database, item):
+    database.patch_dataset_item(
+        "d", "a", 1, [AddEdge(op="add_edge", source=0, target=2)]
+    )
+
+    database.patch_dataset_item("d", "a", 2, [DeleteNode(op="delete_node", index=1)])
+
+    assert graph(database) == [("system prompt", [1]), ("answer", [])]
+
+
+def test_edges_are_added_and_removed(database, item):
+    operations = [
+        AddEdge(op="add_edge", source=2, target=0),
+        # Adding an existing edge leaves it as it is.
+        AddEdge(op="add_edge", source=0, target=1),
+        RemoveEdge(op="remove_edge", source=1, target=2),
+    ]
+
+    database.patch_dataset_item("d", "a", 1, operations)
+
+    assert graph(database) == [
+        ("system prompt", [1]),
+        ("question", []),
+        ("answer", [0]),
+    ]
+    with pytest.raises(ValueError, match="No edge from 1 to 2"):
+        database.patch_dataset_item("d", "a", 2, operations[2:])
+    assert database.get_dataset_item("d", "a")[1] == 2
+
+
+def test_stale_version_is_refused(database, item):
+    operations = [AddEdge(op="add_edge", source=2, target=0)]
+    database.patch_dataset_item("d", "a", 1, operations)
+
+    with pytest.raises(VersionConflict) as conflict:
+        database.patch_dataset_item(
+            "d", "a", 1, [DeleteNode(op="delete_node", index=0)]
+        )
+
+    assert conflict.value.version == 2
+    assert len(graph(database)) == 3
+    assert database.patch_dataset_item("missing", "a", 1, operations) is None
@@ -0,0 +1,49 @@
+import pytest
+
+
+def hits(database, query: str, **kwargs) -> list[tuple[str, int]]:
+    found, _ = database.search_nodes(query, 20, **kwargs)
+    return [(hit.item, hit.node_index) for hit in found]
+
+
+def test_index_follows_item_updates_and_deletes(database, make_item):
+    database.create_dataset("d", 1, [make_item("a", "walrus"), make_item("b")])
+    assert hits(database, "walrus") == [("a", 2)]
+
+    database.update_dataset_item("d", "a", make_item("a", "narwhal"))
+    assert hits(database, "walrus") == []
+    assert hits(database, "narwhal") == [("a", 2)]
+
+    database.delete_dataset_item("d", "a")
+    assert hits(database, "narwhal") == []
+    assert len(hits(database, "question")) == 1
+
+
+def test_pages_cover_every_hit_once(database, make_item):
+    items = [make_item(f"i{i}", "walrus " * (i % 3 + 1)) for i in range(7)]
+    database.create_dataset("d", 1, items)
+
+    pages, cursor = [], None
+    while True:
+        found, cursor = database.search_nodes("walrus", 3, cursor)
+        pages.append([hit.item for hit in found])
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(name for page in pages for name in page) == [
+        item.name for item in items
+    ]
+    with pytest.raises(ValueError):
+        database.search_nodes("walrus", 3, "not a cursor")
+
+
+def test_malformed_fts5_query_is_rejected(database, make_item):
+    database.create_dataset("d", 1, [make_item("a", "walrus")])
+    assert hits(database, "walr*", syntax="fts5") == [("a", 2)]
+
+    # The route answers a `ValueError` with 400.
+    with pytest.raises(ValueError, match="Invalid search query"):
+        database.search_nodes('"walrus', 20, syntax="fts5")
+    with pytest.raises(ValueError, match="Invalid search query"):
+        database.search_nodes("walrus AND", 20, syntax="fts5")
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+from src.files import FilePool
+from src.uploads import UploadConflict, UploadStore
+
+CONTENT = b"0123456789" * 10
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def interrupted(data: bytes):
+    yield data
+    raise ConnectionError("client went away")
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    files = FilePool(2)
+    yield UploadStore(tmp_path / "uploads", 1 << 20, 60, files)
+    files.executor.shutdown()
+
+
+def test_interrupted_chunk_resumes_from_stored_offset(uploads):
+    async def run():
+        upload = await uploads.create("a.json", len(CONTENT), None)
+        with pytest.raises(ConnectionError):
+            await uploads.write_chunk(upload.id, 0, interrupted(CONTENT[:30]))
+        offset = (await uploads.get(upload.id)).offset
+        await uploads.write_chunk(upload.id, offset, stream(CONTENT[offset:]))
+        return await uploads.finalize(upload.id)
+
+    upload = asyncio.run(run())
+
+    assert upload.finalized
+    assert asyncio.run(uploads.path(upload.id)).read_bytes() == CONTENT
+
+
+def test_chunk_at_wrong_offset_is_refused(uploads):
+    async def run():
+        upload = await uploads.create("a.json", len(CONTENT), None)
+        await uploads.write_chunk(upload.id, 0, stream(CONTENT[:40]))
+        with pytest.raises(UploadConflict) as conflict:
+            await uploads.write_chunk(upload.id, 20, stream(CONTENT[20:]))
+        assert conflict.value.offset == 40
+        with pytest.raises(UploadConflict) as incomplete:
+            await uploads.finalize(upload.id)
+        assert incomplete.value.offset == 40
+
+    asyncio.run(run())
+
+
+def test_checksum_mismatches_are_rejected(uploads):
+    async def run():
+        declared = hashlib.sha256(CONTENT).hexdigest()
+        upload = await uploads.create("a.json", len(CONTENT), declared)
+        chunk = CONTENT[:50]
+        with pytest.raises(ValueError):
+            await uploads.write_chunk(upload.id, 0, stream(chunk), "0" * 64)
+        # A corrupted chunk is discarded, not kept for a resume.
+        assert (await uploads.get(upload.id)).offset == 0
+        digest = hashlib.sha256(chunk).hexdigest()
+        await uploads.write_chunk(upload.id, 0, stream(chunk), digest)
+        await uploads.write_chunk(upload.id, 50, stream(b"x" * 50))
+        with pytest.raises(ValueError):
+            await uploads.finalize(upload.id)
+        upload = await uploads.get(upload.id)
+        assert upload.offset == len(CONTENT)
+        assert not upload.finalized
+
+    asyncio.run(run())
+
+
+def test_idle_uploads_expire(uploads):
+    async def run():
+        idle = await uploads.create("a.json", len(CONTENT), None)
+        active = await uploads.create("b.json", len(CONTENT), None)
+        past = time.time() - 120
+        os.utime(uploads.root / f"{idle.id}.part", (past, past))
+        await uploads.files.run(uploads.evict)
+        return await uploads.get(idle.id), await uploads.get(active.id)
+
+    idle, active = asyncio.run(run())
+
+    assert idle is None
+    assert active is not None
+
+
+def test_finalize_waits_out_a_chunk_being_written(uploads):
+    async def run():
+        upload = await uploads.create("a.json", len(CONTENT), None)
+        await uploads.write_chunk(upload.id, 0, stream(CONTENT))
+        # A second worker's chunk still holds the staging file.
+        _, f = uploads.open_part(upload.id, len(CONTENT))
+        with f, pytest.raises(UploadConflict):
+            await uploads.finalize(upload.id)
+        return await uploads.finalize(upload.id)
+
+    assert asyncio.run(run()).finalized
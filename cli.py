@@ -1,7 +1,7 @@
 import argparse
-
-from pathlib import Path
+import sys
 from getpass import getpass
+from pathlib import Path
 from string import Template
 
 template_sources = [
@@ -51,4 +51,4 @@ if __name__ == "__main__":
         setup()
     else:
         print("Invalid operation.")
-        exit(1)
+        sys.exit(1)